@@ -1,29 +1,14 @@
 # app/__init__.py
 import os
-from flask import Flask, render_template, session, current_app
-from pykakasi import kakasi
+from flask import Flask, render_template, session, current_app, flash, redirect, request
 import datetime
-import psycopg2
-from collections import defaultdict
 
 # --- ここから修正 ---
 # データベース接続関数と、新しいconfigモジュールをインポート
-from .db import get_db_connection
 from . import config # data_definitions の代わりに config をインポート
+from . import sidebar
 # --- ここまで修正 ---
 
-_kks_hira_converter = kakasi()
-_kks_hira_converter.setMode("J", "H")
-_kks_hira_converter.setMode("K", "H")
-_kks_hira_converter.setMode("s", False)
-_kks_hira_converter.setMode("C", False)
-
-_kks_kata_converter = kakasi()
-_kks_kata_converter.setMode("J", "K")
-_kks_kata_converter.setMode("H", "K")
-_kks_kata_converter.setMode("s", False)
-_kks_kata_converter.setMode("C", False)
-
 
 def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
@@ -31,7 +16,9 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_secret_key_should_be_changed_in_production'),
         USER_FILE='users.json',
-        UPLOAD_FOLDER=os.path.join(app.root_path, 'uploads')
+        UPLOAD_FOLDER=os.path.join(app.root_path, 'uploads'),
+        # アップロードの最大サイズ。大きなCSVは一時ファイル経由で読むので、メモリ使用量はこの値に比例しない
+        MAX_CONTENT_LENGTH=int(os.environ.get('MAX_CONTENT_LENGTH_MB', config.UPLOAD_MAX_CONTENT_LENGTH_MB)) * 1024 * 1024
     )
 
     if test_config is None:
@@ -51,8 +38,17 @@ def create_app(test_config=None):
         except OSError as e:
             app.logger.error(f"Error creating upload folder {app.config['UPLOAD_FOLDER']}: {e}")
 
-    app.kks_hira_converter = _kks_hira_converter
-    app.kks_kata_converter = _kks_kata_converter
+    from . import instrumentation
+    instrumentation.init_app(app)
+
+    from . import replica
+    replica.init_app(app)
+
+    @app.errorhandler(413)
+    def request_entity_too_large(error):
+        limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+        flash(f"アップロードされたファイルが大きすぎます (上限: {limit_mb} MB)。", 'danger')
+        return redirect(request.url)
 
     from . import auth
     app.register_blueprint(auth.bp)
@@ -64,36 +60,19 @@ def create_app(test_config=None):
     from . import admin
     app.register_blueprint(admin.bp)
 
+    from . import api
+    app.register_blueprint(api.bp)
+
+    from . import warmup
+    app.register_blueprint(warmup.bp)
+
     @app.context_processor
     def inject_global_vars():
         """
         テンプレート全体で利用可能な変数を注入します。
         サイドバー用のデータ取得もここで行います。
         """
-        conn = None
-        grouped_by_era = defaultdict(list)
-        try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT name, display_name, era, release_date FROM products 
-                WHERE show_in_sidebar = TRUE 
-                ORDER BY era DESC NULLS LAST, release_date DESC, name ASC
-                """
-            )
-            sidebar_products = cur.fetchall()
-            for product in sidebar_products:
-                era = product['era']
-                if era:
-                    grouped_by_era[era].append(product)
-        except (Exception, psycopg2.Error) as e:
-            current_app.logger.error(f"Sidebar data fetching failed: {e}")
-        finally:
-            if conn:
-                if 'cur' in locals() and not cur.closed:
-                    cur.close()
-                conn.close()
+        grouped_by_era = sidebar.get_sidebar_data()
 
         # --- ここから修正 ---
         # sidebar_era_order と sidebar_era_names の参照元を config に変更
@@ -107,5 +86,10 @@ def create_app(test_config=None):
         }
         # --- ここまで修正 ---
 
+    # gunicorn 以外で起動する場合など、ここでウォームアップしたいときは WARMUP_ON_START=1 にする
+    # (gunicorn では gunicorn.conf.py の post_worker_init で行う)
+    if os.environ.get('WARMUP_ON_START') == '1' and not app.config.get('TESTING'):
+        warmup.warm_up(app)
+
     app.logger.info("Flask app created successfully.")
     return app
\ No newline at end of file
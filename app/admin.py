@@ -3,15 +3,20 @@ from flask import (
     Blueprint, flash, redirect, render_template, request, url_for, current_app, session, jsonify, make_response
 )
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
 import traceback
 import csv
 import io
 import os
 import re
+import base64
+import binascii
+import json
 from werkzeug.utils import secure_filename
 import datetime
-from app.db import get_db_connection
+from markupsafe import Markup
+from app.db import get_db_connection, count_items_to_rename, rename_category_in_batches
 from app.auth import login_required
 # --- ここから修正 ---
 # data_definitionsからはcalculate_eraのみを、configから設定を読み込むように変更
@@ -19,32 +24,28 @@ from app.data_definitions import calculate_era
 from app import config
 # --- ここまで修正 ---
 from app.utils import normalize_for_search
+from app import instrumentation
+from app import csv_ingest
+from app import import_pipeline
+from app import versioning
+from app import counting
+from app import rollups
+from app import similarity
+from app import duplicates
+from app import analytics
+from app import records
+from app import import_reports
+from app.replica import read_only
 from urllib.parse import unquote, quote
 
-# SeleniumとBeautifulSoupのインポート
-# SeleniumとBeautifulSoupのインポート
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
+# Selenium と BeautifulSoup は読み込みに時間がかかり、使うのは Wiki インポートだけなので、
+# ワーカーの起動時ではなく scrape_wiki_page の中で読み込む
 import time
 
 
 ALLOWED_EXTENSIONS = {'csv'}
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-CSV_HEADER_MAP = {
-    'name': ['name', '名前', '名称'],
-    'card_id': ['card_id', 'カードid', 'カードID', '型番'],
-    'rare': ['rare', 'レアリティ', 'レア度'],
-    'stock': ['stock', '在庫', '在庫数'],
-    'category': ['category', 'カテゴリ', '分類']
-}
-
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -112,23 +113,28 @@ def admin_unify_rarities():
                            current_db_rarities=current_db_rarities)
 
 def get_items_by_category_for_batch(category_keyword=None, page=1, per_page=20, sort_by="name", sort_order="asc"):
-    if not category_keyword: return [], 0
-    conn = None; items = []; total_items = 0
+    """ (1ページ分の行, 件数 (counting.RowCount)) を返す。件数が多い場合は見積もりになる """
+    if not category_keyword: return [], counting.RowCount(0, True)
+    # 件数は同じ版のうちはキャッシュする (版番号は接続を開く前に読む)
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    items_version = versioning.version_key(versions, 'items') if versions else None
+    conn = None; items = []; total_items = counting.RowCount(0, True)
     try:
-        conn = get_db_connection(); cur = conn.cursor()
-        base_query = "SELECT id, name, card_id, rare, stock, category FROM items WHERE LOWER(category) LIKE %s"
-        count_query = "SELECT COUNT(*) FROM items WHERE LOWER(category) LIKE %s"
+        conn = get_db_connection(); cur = records.tuple_cursor(conn)
+        base_query = f"SELECT {', '.join(records.ITEM_COLUMNS)} FROM items WHERE LOWER(category) LIKE %s"
         search_term = f"%{category_keyword.lower()}%"
-        cur.execute(count_query, (search_term,))
-        total_items_result = cur.fetchone()
-        total_items = total_items_result['count'] if total_items_result else 0
+        total_items = counting.count_rows(cur, 'category_items_count', 'category_items', (search_term,), items_version)
         valid_sort_keys_batch = ["name", "card_id", "rare", "stock", "id", "category"]
         if sort_by not in valid_sort_keys_batch: sort_by = "name"
         if sort_order.lower() not in ["asc", "desc"]: sort_order = "asc"
         offset = (page - 1) * per_page
-        query_with_order_limit = f"{base_query} ORDER BY {sort_by} {sort_order.upper()} LIMIT %s OFFSET %s"
+        query_with_order_limit = f"{base_query} ORDER BY {sort_by} {sort_order.upper()}, id ASC LIMIT %s OFFSET %s"
         cur.execute(query_with_order_limit, (search_term, per_page, offset))
-        items = cur.fetchall()
+        items = records.fetch_records(cur, records.ItemRow)
+        if not items and offset > 0 and not total_items.exact:
+            # 見積もりが多すぎて結果の外のページになった。呼び出し側が正確な件数でページを補正する
+            total_items = counting.count_rows(cur, 'category_items_count', 'category_items', (search_term,), items_version, force_exact=True)
+        total_items = counting.exact_from_page(total_items, offset, len(items), per_page)
     except (psycopg2.Error, Exception) as e:
         current_app.logger.error(f"Error in get_items_by_category_for_batch (category: '{category_keyword}'): {e}\n{traceback.format_exc()}")
         flash("カテゴリ別商品取得中にデータベースエラーが発生しました。", "danger")
@@ -148,7 +154,12 @@ def admin_batch_register():
         current_app.logger.info(f"Batch stock update started by user '{session.get('username', 'unknown_user')}' for category '{category_keyword_hidden}'.")
         try:
             conn = get_db_connection()
-            with conn.cursor() as cur:
+            with records.tuple_cursor(conn) as cur:
+                # 送られてきたカードの現在の在庫は、1行ずつではなく1回の SELECT でまとめて読む
+                form_item_ids = [int(key.split('_')[-1]) for key in request.form
+                                 if key.startswith('stock_item_') and key.split('_')[-1].isdigit()]
+                cur.execute("SELECT id, stock FROM items WHERE id = ANY(%s)", (form_item_ids,))
+                current_stocks = dict(cur.fetchall())
                 for key, value in request.form.items():
                     if key.startswith('stock_item_'):
                         try:
@@ -168,13 +179,11 @@ def admin_batch_register():
                             if stock_count < 0:
                                 stock_count = 0
                                 error_messages_for_flash.append(f"ID {item_id} の在庫数に負の値が入力されました。0として扱います。")
-                            cur.execute("SELECT stock FROM items WHERE id = %s", (item_id,))
-                            current_item_db_stock = cur.fetchone()
-                            if current_item_db_stock:
-                                if current_item_db_stock['stock'] != stock_count:
+                            if item_id in current_stocks:
+                                if current_stocks[item_id] != stock_count:
                                     cur.execute("UPDATE items SET stock = %s WHERE id = %s", (stock_count, item_id))
                                     updated_count += 1
-                                    current_app.logger.debug(f"Batch update: Item ID {item_id} stock changed from {current_item_db_stock['stock']} to {stock_count}")
+                                    current_app.logger.debug(f"Batch update: Item ID {item_id} stock changed from {current_stocks[item_id]} to {stock_count}")
                             else:
                                 current_app.logger.warning(f"Batch update: Item ID {item_id} not found in database during update attempt.")
                                 error_messages_for_flash.append(f"ID {item_id} の商品がデータベースに見つかりませんでした（更新スキップ）。")
@@ -204,18 +213,20 @@ def admin_batch_register():
     category_keyword = request.args.get('category_keyword', '').strip()
     page = request.args.get('page', 1, type=int)
     per_page_batch = 20
-    items_for_batch, total_items_batch = [], 0
+    items_for_batch, total_items_batch = [], counting.RowCount(0, True)
     if category_keyword:
         items_for_batch, total_items_batch = get_items_by_category_for_batch(category_keyword, page, per_page_batch)
-        if not items_for_batch and page == 1 and total_items_batch == 0:
+        if not items_for_batch and page == 1 and total_items_batch.count == 0:
             flash(f"カテゴリ「{category_keyword}」に該当するカードは見つかりませんでした。", "info")
-    total_pages_batch = (total_items_batch + per_page_batch - 1) // per_page_batch if per_page_batch > 0 else 1
-    if page > total_pages_batch and total_pages_batch > 0:
+    total_pages_batch = (total_items_batch.count + per_page_batch - 1) // per_page_batch if per_page_batch > 0 else 1
+    if page > total_pages_batch and total_pages_batch > 0 and total_items_batch.exact:
         page = total_pages_batch
-        items_for_batch, _ = get_items_by_category_for_batch(category_keyword, page, per_page_batch)
+        items_for_batch, total_items_batch = get_items_by_category_for_batch(category_keyword, page, per_page_batch)
+        total_pages_batch = (total_items_batch.count + per_page_batch - 1) // per_page_batch
     return render_template('admin/admin_batch_register.html',
                            items=items_for_batch, category_keyword=category_keyword, page=page,
-                           per_page=per_page_batch, total_pages=total_pages_batch, total_items=total_items_batch)
+                           per_page=per_page_batch, total_pages=total_pages_batch,
+                           total_items=total_items_batch.count, total_items_exact=total_items_batch.exact)
 
 # ...(中略)...CSVインポートや製品マスタ管理など、他の既存関数は変更ありません...
 @bp.route('/import_csv', methods=('GET', 'POST'))
@@ -233,217 +244,219 @@ def admin_import_csv():
 
         total_files_processed_count = 0
         overall_summary_stats = {'added': 0, 'updated_info': 0, 'skipped_no_change': 0, 'skipped_error_row': 0, 'rows_processed_total':0}
-        error_file_messages = {}
-
-        current_app.logger.info(f"CSV import process started by user '{session.get('username', 'unknown_user')}'. Uploaded {len(files)} file(s).")
+        # エラーのあったファイル名。行ごとのエラー・警告の内容はインポートレポート (import_reports.py) に保存する
+        files_with_errors = set()
+        # レポートを保存できない場合 (マイグレーション未適用など) だけ、先頭の数件をフラッシュメッセージに含める
+        fallback_issue_messages = []
+        fallback_issue_overflow = 0
+
+        username = session.get('username', 'unknown_user')
+        current_app.logger.info(f"CSV import process started by user '{username}'. Uploaded {len(files)} file(s).")
         conn_outer = None
         made_committable_changes_in_any_file = False
+        sources = []
+        pipeline = None
+
+        report_conn = None
+        report = None
+        try:
+            report_conn = get_db_connection()
+            report = import_reports.ImportReport.start(report_conn, username, len(files))
+        except (Exception, psycopg2.Error) as e_report:
+            current_app.logger.warning(f"Import report could not be started (run apply_migrations.py to enable reports): {e_report}")
+            if report_conn and not report_conn.closed:
+                report_conn.rollback()
+
+        def record_issue(filename, row_number, severity, message, row_data=None):
+            nonlocal report, fallback_issue_overflow
+            if severity == import_reports.ERROR:
+                files_with_errors.add(filename)
+            if report is not None:
+                try:
+                    report.add_issue(filename, row_number, severity, message, row_data)
+                    return
+                except psycopg2.Error as e_report:
+                    current_app.logger.error(f"Failed to write import report issues (run {report.run_id}): {e_report}")
+                    report_conn.rollback()
+                    report = None
+            current_app.logger.warning(f"File '{filename}' Row {row_number}: {message} Data: {row_data}")
+            if severity != import_reports.ERROR:
+                return
+            if len(fallback_issue_messages) < config.IMPORT_FLASH_MAX_ISSUES:
+                location = f" 行 {row_number}" if row_number is not None else ""
+                fallback_issue_messages.append(f"ファイル '{filename}'{location}: {message}")
+            else:
+                fallback_issue_overflow += 1
+
+        def finish_report(status, summary):
+            if report is None:
+                return
+            try:
+                report.finish(status, {
+                    'rows_processed': overall_summary_stats['rows_processed_total'],
+                    'added': overall_summary_stats['added'],
+                    'updated': overall_summary_stats['updated_info'],
+                    'skipped_no_change': overall_summary_stats['skipped_no_change'],
+                    'skipped_error': overall_summary_stats['skipped_error_row'],
+                }, summary)
+            except psycopg2.Error as e_report:
+                current_app.logger.error(f"Failed to finish import report (run {report.run_id}): {e_report}")
+
         try:
-            conn_outer = get_db_connection()
             for file_idx, file_obj in enumerate(files):
                 if file_obj and allowed_file(file_obj.filename):
-                    original_filename_for_display = file_obj.filename
-                    base_fn, _ = os.path.splitext(original_filename_for_display)
-                    safe_base_fn = re.sub(r'[^a-zA-Z0-9_]', '_', base_fn)
-                    savepoint_name = f"sp_file_{file_idx}_{secure_filename(safe_base_fn)[:20]}"
-                    category_name_from_filename = os.path.splitext(original_filename_for_display)[0] 
-
-                    total_files_processed_count += 1
-                    file_processing_summary = {'added': 0, 'updated_info': 0, 'skipped_no_change': 0, 'skipped_error_row': 0, 'rows_processed_in_file':0}
-                    current_csv_row_num_for_log = 0
-                    file_had_db_error_preventing_commit = False
-                    file_had_committable_change_this_file = False
-                    num_total_rows_in_file = 0
-
-                    current_app.logger.info(f"--- Processing CSV file #{file_idx + 1}/{len(files)}: '{original_filename_for_display}' (Savepoint: {savepoint_name}) ---")
-                    current_app.logger.info(f"Derived category name for this file (fallback): '{category_name_from_filename}'")
+                    # ファイル名 (拡張子なし) は、CSV にカテゴリ列がない行のカテゴリとして使う
+                    category_name_from_filename = os.path.splitext(file_obj.filename)[0]
+                    sources.append(import_pipeline.ImportSource(
+                        (file_idx, file_obj.filename), csv_ingest.UploadTextStream(file_obj.stream), category_name_from_filename
+                    ))
+                elif file_obj and not allowed_file(file_obj.filename):
+                    err_msg = f"拡張子不正 ({os.path.splitext(file_obj.filename)[1]})。CSVファイルのみ許可。"
+                    record_issue(file_obj.filename, None, import_reports.ERROR, err_msg)
+                    overall_summary_stats['skipped_error_row'] += 1
 
-                    try:
-                        with conn_outer.cursor() as cur:
-                            try:
-                                cur.execute(f"SAVEPOINT {savepoint_name}")
-                                current_app.logger.debug(f"Successfully created savepoint {savepoint_name}")
-                            except psycopg2.Error as e_sp_create:
-                                current_app.logger.error(f"Failed to create savepoint {savepoint_name} for file '{original_filename_for_display}': {e_sp_create}")
-                                if original_filename_for_display not in error_file_messages: error_file_messages[original_filename_for_display] = []
-                                error_file_messages[original_filename_for_display].append(f"セーブポイント作成失敗: {e_sp_create}。このファイルはスキップされました。")
-                                overall_summary_stats['skipped_error_row'] += 1
-                                continue
+            conn_outer = get_db_connection()
+            # 行の検証・変換はパイプライン (大きなアップロードではプロセスプール) で行い、ここでは順番どおりに書き込むだけにする
+            pipeline = import_pipeline.build_pipeline(sources)
+            upload_streams = {source.key: source.upload_stream for source in sources}
+            current_file_key = None
+
+            with conn_outer.cursor() as cur:
+                for file_key, event_kind, payload in pipeline:
+                    file_idx, original_filename_for_display = file_key
+
+                    if file_key != current_file_key:
+                        # --- 新しいファイルの開始 ---
+                        current_file_key = file_key
+                        base_fn, _ = os.path.splitext(original_filename_for_display)
+                        safe_base_fn = re.sub(r'[^a-zA-Z0-9_]', '_', base_fn)
+                        savepoint_name = f"sp_file_{file_idx}_{secure_filename(safe_base_fn)[:20]}"
+
+                        total_files_processed_count += 1
+                        file_processing_summary = {'added': 0, 'updated_info': 0, 'skipped_no_change': 0, 'skipped_error_row': 0, 'rows_processed_in_file':0}
+                        file_had_db_error_preventing_commit = False
+                        file_had_committable_change_this_file = False
+                        file_savepoint_failed = False
+                        next_progress_row = config.CSV_IMPORT_PROGRESS_INTERVAL_ROWS
+
+                        current_app.logger.info(f"--- Processing CSV file #{file_idx + 1}/{len(files)}: '{original_filename_for_display}' (Savepoint: {savepoint_name}) ---")
+                        current_app.logger.info(f"File '{original_filename_for_display}' is {upload_streams[file_key].total_bytes} bytes.")
+                        try:
+                            cur.execute(f"SAVEPOINT {savepoint_name}")
+                            current_app.logger.debug(f"Successfully created savepoint {savepoint_name}")
+                        except psycopg2.Error as e_sp_create:
+                            current_app.logger.error(f"Failed to create savepoint {savepoint_name} for file '{original_filename_for_display}': {e_sp_create}")
+                            record_issue(original_filename_for_display, None, import_reports.ERROR,
+                                         f"セーブポイント作成失敗: {e_sp_create}。このファイルはスキップされました。")
+                            overall_summary_stats['skipped_error_row'] += 1
+                            file_savepoint_failed = True
+                            pipeline.discard(file_key)
+
+                    if file_savepoint_failed:
+                        continue
 
+                    if event_kind == import_pipeline.ROWS:
+                        if file_had_db_error_preventing_commit:
+                            continue
+                        for (current_csv_row_num_for_log, card_name, final_card_id_for_db, converted_rarity, stock_csv,
+                             final_category, name_normalized, card_id_normalized, row_problem) in payload:
+                            file_processing_summary['rows_processed_in_file'] += 1
+
+                            if row_problem is not None:
+                                problem_kind, _, problem_value = row_problem
+                                if problem_kind == csv_ingest.MISSING_REQUIRED:
+                                    record_issue(original_filename_for_display, current_csv_row_num_for_log, import_reports.ERROR,
+                                                 "名前またはレアリティが空です。スキップします。",
+                                                 (card_name, final_card_id_for_db, converted_rarity, stock_csv, final_category))
+                                    file_processing_summary['skipped_error_row'] +=1
+                                    continue
+                                record_issue(original_filename_for_display, current_csv_row_num_for_log, import_reports.WARNING,
+                                             f"在庫数「{problem_value}」が不正なため、0 として扱います。")
+                            if final_category == import_pipeline.UNKNOWN_CATEGORY:
+                                record_issue(original_filename_for_display, current_csv_row_num_for_log, import_reports.WARNING,
+                                             f"カテゴリを判定できなかったため、「{final_category}」として登録します。")
+
+                            existing_card_data = None
                             try:
-                                file_content_for_count = file_obj.read()
-                                file_obj.seek(0)
-                                
-                                temp_file_like_object_for_count = io.StringIO(file_content_for_count.decode('utf-8-sig'))
-                                temp_reader_for_count = csv.reader(temp_file_like_object_for_count)
-                                try:
-                                    header_for_count = next(temp_reader_for_count) 
-                                    num_total_rows_in_file = sum(1 for row in temp_reader_for_count)
-                                    current_app.logger.info(f"File '{original_filename_for_display}' has approx. {num_total_rows_in_file} data rows.")
-                                except StopIteration: 
-                                    num_total_rows_in_file = 0
-                                    current_app.logger.info(f"File '{original_filename_for_display}' appears to be empty or header-only.")
-                                file_stream = io.StringIO(file_content_for_count.decode('utf-8-sig'))
-                                
-                                csv_reader = csv.DictReader(file_stream)
-                                csv_headers_original = csv_reader.fieldnames or []
-
-                                normalized_header_map = {} 
-                                csv_headers_lower_stripped = [h.strip().lower() for h in csv_headers_original if h]
-
-                                for internal_key, possible_headers in CSV_HEADER_MAP.items():
-                                    found_header = None
-                                    for p_header in possible_headers:
-                                        if p_header.lower() in csv_headers_lower_stripped:
-                                            original_idx = csv_headers_lower_stripped.index(p_header.lower())
-                                            found_header = csv_headers_original[original_idx]
-                                            break
-                                    if found_header:
-                                        normalized_header_map[internal_key] = found_header
-                                
-                                required_internal_keys = ['name', 'rare'] 
-                                missing_headers = [
-                                    key for key in required_internal_keys if key not in normalized_header_map
-                                ]
-
-                                if missing_headers:
-                                    missing_headers_display = []
-                                    for key in missing_headers:
-                                        expected_options = CSV_HEADER_MAP.get(key, [key])
-                                        missing_headers_display.append(f"'{key}' (例: {', '.join(expected_options)})")
-                                    err_msg = (f"ヘッダー不正。必須列 ({', '.join(missing_headers_display)}) "
-                                               f"が見つかりません。検出されたヘッダー: {csv_headers_original}")
-                                    raise ValueError(err_msg)
-
-                                def get_val_from_row(row_dict, internal_key, default_val=''):
-                                    original_header_name = normalized_header_map.get(internal_key)
-                                    if original_header_name:
-                                        val = row_dict.get(original_header_name, default_val)
-                                        return val.strip() if isinstance(val, str) else val
-                                    return default_val
-                                
-                                report_interval = 1000 
-                                if num_total_rows_in_file > 0 and num_total_rows_in_file < report_interval * 5: 
-                                    report_interval = max(100, num_total_rows_in_file // 10) 
-                                if report_interval == 0 and num_total_rows_in_file > 0 :
-                                     report_interval = 1
-
-                                for row_idx_in_file, row_data_dict in enumerate(csv_reader):
-                                    current_csv_row_num_for_log = row_idx_in_file + 1
-                                    file_processing_summary['rows_processed_in_file'] += 1
-                                    
-                                    if num_total_rows_in_file > 0 and report_interval > 0 and \
-                                       (current_csv_row_num_for_log % report_interval == 0 or current_csv_row_num_for_log == num_total_rows_in_file):
-                                        progress_percent = (current_csv_row_num_for_log / num_total_rows_in_file * 100)
-                                        current_app.logger.info(
-                                            f"  File '{original_filename_for_display}': Processing row {current_csv_row_num_for_log}/{num_total_rows_in_file} "
-                                            f"({progress_percent:.2f}%)"
-                                        )
-                                    elif num_total_rows_in_file == 0 and (row_idx_in_file + 1) % 1000 == 0 :
-                                        current_app.logger.info(f"  File '{original_filename_for_display}': Processing row {row_idx_in_file + 1}...")
-                                    
-                                    card_name = get_val_from_row(row_data_dict, 'name')
-                                    card_id_csv = get_val_from_row(row_data_dict, 'card_id')
-                                    raw_rarity = get_val_from_row(row_data_dict, 'rare')
-                                    stock_csv_str = get_val_from_row(row_data_dict, 'stock')
-                                    category_from_csv_row = get_val_from_row(row_data_dict, 'category')
-                                    
-                                    try:
-                                        stock_csv = int(stock_csv_str) if stock_csv_str and stock_csv_str.strip() else 0
-                                    except (ValueError, TypeError):
-                                        current_app.logger.warning(
-                                            f"File '{original_filename_for_display}' Row {current_csv_row_num_for_log}: "
-                                            f"Invalid stock value '{stock_csv_str}' (type: {type(stock_csv_str).__name__}). Defaulting to 0."
-                                        )
-                                        stock_csv = 0
-
-                                    if not card_name or not raw_rarity:
-                                        msg = f"行 {current_csv_row_num_for_log}: 名前またはレアリティが空です。スキップします。"
-                                        current_app.logger.warning(f"File '{original_filename_for_display}' {msg} Data: {row_data_dict}")
-                                        if original_filename_for_display not in error_file_messages: error_file_messages[original_filename_for_display] = []
-                                        error_file_messages[original_filename_for_display].append(msg)
-                                        file_processing_summary['skipped_error_row'] +=1
-                                        continue
-
-                                    converted_rarity = config.RARITY_CONVERSION_MAP.get(raw_rarity.lower(), raw_rarity)
-                                    final_card_id_for_db = card_id_csv if card_id_csv else None
-                                    
-                                    final_category = category_from_csv_row if category_from_csv_row else category_name_from_filename
-                                    if not final_category: 
-                                        final_category = "不明カテゴリ" 
-                                        current_app.logger.warning(f"File '{original_filename_for_display}' Row {current_csv_row_num_for_log}: Category could not be determined. Defaulting to '{final_category}'.")
-
-                                    existing_card_data = None
-                                    try:
-                                        if final_card_id_for_db is not None:
-                                            cur.execute("SELECT id, name, rare, stock, category FROM items WHERE card_id = %s AND rare = %s", (str(final_card_id_for_db), converted_rarity))
-                                            existing_card_data = cur.fetchone()
-
-                                        if existing_card_data:
-                                            db_name = existing_card_data['name']
-                                            db_category = existing_card_data['category']
-                                            csv_name_val = card_name
-                                            name_changed = (db_name != csv_name_val)
-                                            category_changed = (str(db_category or '').strip().lower() != str(final_category or '').strip().lower())
-                                            needs_db_update = name_changed or category_changed
-
-                                            if needs_db_update:
-                                                cur.execute("UPDATE items SET name = %s, category = %s WHERE id = %s", (csv_name_val, final_category, existing_card_data['id']))
-                                                if cur.rowcount > 0:
-                                                    file_processing_summary['updated_info'] += 1
-                                                    file_had_committable_change_this_file = True
-                                            else:
-                                                file_processing_summary['skipped_no_change'] +=1
-                                        else:
-                                            cur.execute("INSERT INTO items (name, card_id, rare, stock, category) VALUES (%s, %s, %s, %s, %s)",
-                                                        (card_name, final_card_id_for_db, converted_rarity, stock_csv, final_category))
-                                            file_processing_summary['added'] += 1
+                                if final_card_id_for_db is not None:
+                                    cur.execute("SELECT id, name, rare, stock, category FROM items WHERE card_id = %s AND rare = %s", (final_card_id_for_db, converted_rarity))
+                                    existing_card_data = cur.fetchone()
+
+                                if existing_card_data:
+                                    db_name = existing_card_data['name']
+                                    db_category = existing_card_data['category']
+                                    name_changed = (db_name != card_name)
+                                    category_changed = (str(db_category or '').strip().lower() != str(final_category or '').strip().lower())
+                                    needs_db_update = name_changed or category_changed
+
+                                    if needs_db_update:
+                                        cur.execute("UPDATE items SET name = %s, category = %s, name_normalized = %s WHERE id = %s",
+                                                    (card_name, final_category, name_normalized, existing_card_data['id']))
+                                        if cur.rowcount > 0:
+                                            file_processing_summary['updated_info'] += 1
                                             file_had_committable_change_this_file = True
-
-                                    except psycopg2.Error as e_db_row:
-                                        current_app.logger.error(
-                                            f"File '{original_filename_for_display}' Row {current_csv_row_num_for_log}: "
-                                            f"DB Error ({type(e_db_row).__name__}): {str(e_db_row).strip()}. "
-                                            f"Card: '{card_name}', ID: '{final_card_id_for_db}', Rare: '{converted_rarity}', Stock_CSV_Attempted: '{stock_csv_str}' (became {stock_csv})."
-                                        )
-                                        pgcode = getattr(e_db_row, 'pgcode', None)
-                                        current_app.logger.error(f"  PostgreSQL error code (pgcode): {pgcode}")
-                                        if original_filename_for_display not in error_file_messages: error_file_messages[original_filename_for_display] = []
-                                        error_file_messages[original_filename_for_display].append(f"行 {current_csv_row_num_for_log}: DBエラー ({type(e_db_row).__name__})。このファイルの処理を中断。")
-                                        file_had_db_error_preventing_commit = True
-                                        break 
-
-                            except (UnicodeDecodeError, csv.Error, ValueError) as e_file_read:
-                                current_app.logger.error(f"Critical error processing file '{original_filename_for_display}' (before or during row processing): {e_file_read}\n{traceback.format_exc()}")
-                                if original_filename_for_display not in error_file_messages: error_file_messages[original_filename_for_display] = []
-                                error_file_messages[original_filename_for_display].append(f"ファイル読み込み/解析エラー: {e_file_read}")
+                                    else:
+                                        file_processing_summary['skipped_no_change'] +=1
+                                else:
+                                    cur.execute("INSERT INTO items (name, card_id, rare, stock, category, name_normalized, card_id_normalized) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                                                (card_name, final_card_id_for_db, converted_rarity, stock_csv, final_category, name_normalized, card_id_normalized))
+                                    file_processing_summary['added'] += 1
+                                    file_had_committable_change_this_file = True
+
+                            except psycopg2.Error as e_db_row:
+                                current_app.logger.error(
+                                    f"File '{original_filename_for_display}' Row {current_csv_row_num_for_log}: "
+                                    f"DB Error ({type(e_db_row).__name__}): {str(e_db_row).strip()}. "
+                                    f"Card: '{card_name}', ID: '{final_card_id_for_db}', Rare: '{converted_rarity}', Stock: {stock_csv}."
+                                )
+                                pgcode = getattr(e_db_row, 'pgcode', None)
+                                current_app.logger.error(f"  PostgreSQL error code (pgcode): {pgcode}")
+                                record_issue(original_filename_for_display, current_csv_row_num_for_log, import_reports.ERROR,
+                                             f"DBエラー ({type(e_db_row).__name__}: {str(e_db_row).strip()})。このファイルの処理を中断。",
+                                             (card_name, final_card_id_for_db, converted_rarity, stock_csv, final_category))
                                 file_had_db_error_preventing_commit = True
+                                # このファイルの残りの行は読まずに終える
+                                pipeline.discard(file_key)
+                                break
+
+                        if file_processing_summary['rows_processed_in_file'] >= next_progress_row:
+                            upload_stream = upload_streams[file_key]
+                            current_app.logger.info(
+                                f"  File '{original_filename_for_display}': Processed {file_processing_summary['rows_processed_in_file']} rows "
+                                f"({upload_stream.bytes_read()}/{upload_stream.total_bytes} bytes read, {upload_stream.progress_percent():.2f}%)"
+                            )
+                            next_progress_row += config.CSV_IMPORT_PROGRESS_INTERVAL_ROWS
+                        continue
 
-                            if file_had_db_error_preventing_commit:
-                                cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint_name}")
-                                current_app.logger.warning(f"Rolled back to savepoint {savepoint_name} for file '{original_filename_for_display}' due to errors.")
-                                file_processing_summary['added'] = 0
-                                file_processing_summary['updated_info'] = 0
-                                if file_processing_summary['rows_processed_in_file'] > 0:
-                                     file_processing_summary['skipped_error_row'] = file_processing_summary['rows_processed_in_file'] - (file_processing_summary['added'] + file_processing_summary['updated_info'] + file_processing_summary['skipped_no_change'])
-                                else:
-                                    file_processing_summary['skipped_error_row'] = 1
+                    if event_kind == import_pipeline.ERROR:
+                        current_app.logger.error(f"Critical error processing file '{original_filename_for_display}' (before or during row processing): {payload}")
+                        record_issue(original_filename_for_display, None, import_reports.ERROR, f"ファイル読み込み/解析エラー: {payload}")
+                        file_had_db_error_preventing_commit = True
 
-                            elif file_had_committable_change_this_file:
-                                cur.execute(f"RELEASE SAVEPOINT {savepoint_name}")
-                                made_committable_changes_in_any_file = True
-                                current_app.logger.info(f"Released savepoint {savepoint_name} for file '{original_filename_for_display}' with changes.")
+                    # --- ファイルの終了 (END / ERROR) ---
+                    try:
+                        if file_had_db_error_preventing_commit:
+                            cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint_name}")
+                            current_app.logger.warning(f"Rolled back to savepoint {savepoint_name} for file '{original_filename_for_display}' due to errors.")
+                            file_processing_summary['added'] = 0
+                            file_processing_summary['updated_info'] = 0
+                            if file_processing_summary['rows_processed_in_file'] > 0:
+                                 file_processing_summary['skipped_error_row'] = file_processing_summary['rows_processed_in_file'] - (file_processing_summary['added'] + file_processing_summary['updated_info'] + file_processing_summary['skipped_no_change'])
                             else:
-                                cur.execute(f"RELEASE SAVEPOINT {savepoint_name}")
-                                current_app.logger.info(f"Released savepoint {savepoint_name} for file '{original_filename_for_display}', no changes made.")
-
+                                file_processing_summary['skipped_error_row'] = 1
+
+                        elif file_had_committable_change_this_file:
+                            cur.execute(f"RELEASE SAVEPOINT {savepoint_name}")
+                            made_committable_changes_in_any_file = True
+                            current_app.logger.info(f"Released savepoint {savepoint_name} for file '{original_filename_for_display}' with changes.")
+                        else:
+                            cur.execute(f"RELEASE SAVEPOINT {savepoint_name}")
+                            current_app.logger.info(f"Released savepoint {savepoint_name} for file '{original_filename_for_display}', no changes made.")
                     except psycopg2.Error as e_cursor_or_sp_level:
                         current_app.logger.error(f"Error at cursor or savepoint level for file '{original_filename_for_display}': {e_cursor_or_sp_level}\n{traceback.format_exc()}")
-                        if original_filename_for_display not in error_file_messages: error_file_messages[original_filename_for_display] = []
-                        error_file_messages[original_filename_for_display].append(f"ファイル処理の準備/終了処理中にDBエラー: {e_cursor_or_sp_level}。このファイルはスキップされました。")
+                        record_issue(original_filename_for_display, None, import_reports.ERROR,
+                                     f"ファイル処理の準備/終了処理中にDBエラー: {e_cursor_or_sp_level}。このファイルはスキップされました。")
                         overall_summary_stats['skipped_error_row'] += file_processing_summary.get('rows_processed_in_file', 1)
-                    finally:
-                        pass
 
                     overall_summary_stats['added'] += file_processing_summary['added']
                     overall_summary_stats['updated_info'] += file_processing_summary['updated_info']
@@ -451,14 +464,6 @@ def admin_import_csv():
                     overall_summary_stats['skipped_error_row'] += file_processing_summary['skipped_error_row']
                     overall_summary_stats['rows_processed_total'] += file_processing_summary['rows_processed_in_file']
 
-                elif file_obj and not allowed_file(file_obj.filename):
-                    err_msg = f"拡張子不正 ({os.path.splitext(file_obj.filename)[1]})。CSVファイルのみ許可。"
-                    key_for_error_msg = file_obj.filename
-                    if key_for_error_msg not in error_file_messages: error_file_messages[key_for_error_msg] = []
-                    error_file_messages[key_for_error_msg].append(err_msg)
-                    overall_summary_stats['skipped_error_row'] += 1
-
-
             if made_committable_changes_in_any_file:
                 conn_outer.commit()
                 current_app.logger.info("Main transaction committed.")
@@ -474,7 +479,7 @@ def admin_import_csv():
             summary_parts.append(f"エラースキップ行/ファイル問題: {overall_summary_stats['skipped_error_row']}件。")
 
             flash_cat = 'success'
-            if error_file_messages or overall_summary_stats['skipped_error_row'] > 0 :
+            if files_with_errors or overall_summary_stats['skipped_error_row'] > 0 :
                 flash_cat = 'warning'
             if not made_committable_changes_in_any_file and \
                overall_summary_stats['added'] == 0 and \
@@ -483,32 +488,47 @@ def admin_import_csv():
                  flash_cat = 'info'
                  if overall_summary_stats['skipped_no_change'] > 0 :
                      summary_parts.append("全ての処理対象データは既に登録済みか、変更の必要がありませんでした。")
-                 elif overall_summary_stats['rows_processed_total'] == 0 and total_files_processed_count > 0 and not error_file_messages:
+                 elif overall_summary_stats['rows_processed_total'] == 0 and total_files_processed_count > 0 and not files_with_errors:
                      summary_parts.append("処理対象データが含まれていないファイルでした。")
                  elif total_files_processed_count == 0 :
                      summary_parts.append("処理対象ファイルがありませんでした。")
 
 
-            if error_file_messages:
-                summary_parts.append("ファイルごとのエラー/警告詳細:")
-                for fname, reasons in error_file_messages.items():
-                    summary_parts.append(f"  ファイル '{fname}': {', '.join(reasons)}")
-
             final_flash_message = " ".join(summary_parts)
-            flash(final_flash_message, flash_cat)
             current_app.logger.info(f"CSV Import Overall Summary: {final_flash_message}")
+            finish_report(flash_cat, final_flash_message)
+            if report is not None:
+                # 行ごとの詳細はレポート画面に任せ、フラッシュメッセージ (= Cookie) には件数とリンクだけを入れる
+                if report.issue_count:
+                    final_flash_message = Markup('{} エラー {} 件・警告 {} 件の詳細は<a href="{}" class="alert-link">インポートレポート</a>を確認してください。').format(
+                        final_flash_message, report.counts[import_reports.ERROR], report.counts[import_reports.WARNING],
+                        url_for('admin.import_report', run_id=report.run_id))
+            elif fallback_issue_messages:
+                summary_parts = [final_flash_message, "エラー詳細:"] + fallback_issue_messages
+                if fallback_issue_overflow:
+                    summary_parts.append(f"ほか {fallback_issue_overflow} 件 (ログを参照してください)。")
+                final_flash_message = " ".join(summary_parts)
+            flash(final_flash_message, flash_cat)
 
         except psycopg2.Error as e_db_main_conn:
             if conn_outer: conn_outer.rollback()
             error_message = f"CSVインポート処理中にデータベース接続または主要なトランザクションエラーが発生しました: {e_db_main_conn}"
             current_app.logger.error(f"Main DB Error during CSV import: {error_message}\n{traceback.format_exc()}")
+            finish_report(import_reports.FAILED, error_message)
             flash(error_message, 'danger')
         except Exception as e_general_main:
             if conn_outer: conn_outer.rollback()
             error_message = f"CSVインポート処理中に予期せぬエラーが発生しました: {e_general_main}"
             current_app.logger.error(f"Main General Error during CSV import: {error_message}\n{traceback.format_exc()}")
+            finish_report(import_reports.FAILED, error_message)
             flash(error_message, 'danger')
         finally:
+            if pipeline is not None:
+                pipeline.close()
+            for source in sources:
+                source.upload_stream.close()
+            if report_conn and not report_conn.closed:
+                report_conn.close()
             if conn_outer and not conn_outer.closed:
                 conn_outer.close()
                 current_app.logger.info("Closed main database connection after CSV import process.")
@@ -517,35 +537,142 @@ def admin_import_csv():
 
     return render_template('admin/admin_import_csv.html')
 
+@bp.route('/import_reports')
+@login_required
+@read_only
+def import_report_list():
+    """ 最近のCSVインポートの結果の一覧 """
+    conn = None
+    runs = []
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        runs = import_reports.fetch_recent_runs(cur)
+    except psycopg2.errors.UndefinedTable:
+        flash("インポートレポートのテーブルがありません。apply_migrations.py を実行してください。", "warning")
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Error fetching import runs: {e}\n{traceback.format_exc()}")
+        flash("インポートレポートの取得中にエラーが発生しました。", "danger")
+    finally:
+        if conn:
+            if 'cur' in locals() and cur and not cur.closed:
+                cur.close()
+            conn.close()
+    return render_template('admin/import_reports.html', runs=runs, max_runs=config.IMPORT_REPORT_RECENT_RUNS)
+
+@bp.route('/import_reports/<int:run_id>')
+@login_required
+@read_only
+def import_report(run_id):
+    """ 1回のCSVインポートの結果と、行ごとのエラー・警告 (キーセット方式でページング) """
+    severity = request.args.get('severity')
+    if severity not in import_reports.SEVERITIES:
+        severity = None
+    conn = None
+    run = None
+    file_counts = []
+    issues, previous_cursor, next_cursor = [], None, None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        run = import_reports.fetch_run(cur, run_id)
+        if run is not None:
+            file_counts = import_reports.fetch_issue_counts_by_file(cur, run_id)
+            issues, previous_cursor, next_cursor = import_reports.fetch_issue_page(
+                cur, run_id, severity,
+                after=request.args.get('after', type=int), before=request.args.get('before', type=int)
+            )
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Error fetching import report {run_id}: {e}\n{traceback.format_exc()}")
+        flash("インポートレポートの取得中にエラーが発生しました。", "danger")
+        return redirect(url_for('admin.import_report_list'))
+    finally:
+        if conn:
+            if 'cur' in locals() and cur and not cur.closed:
+                cur.close()
+            conn.close()
+    if run is None:
+        flash(f"インポートレポート (ID: {run_id}) が見つかりません。", "warning")
+        return redirect(url_for('admin.import_report_list'))
+    return render_template('admin/import_report.html', run=run, file_counts=file_counts, issues=issues,
+                           severity=severity, previous_cursor=previous_cursor, next_cursor=next_cursor)
+
+def _has_pg_trgm(cur):
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    return cur.fetchone() is not None
+
+def suggest_products_for_categories(cur, categories):
+    """
+    製品マスタにないカテゴリごとに、名前の近い製品を {カテゴリ: [(製品名, 類似度), ...]} で返す。
+    pg_trgm があれば1回の SQL でまとめて求め、なければ製品名を読み込んで similarity.py で計算する。
+    """
+    if not categories:
+        return {}
+    limit = config.CATEGORY_SUGGESTION_LIMIT
+    threshold = config.CATEGORY_SUGGESTION_MIN_SIMILARITY
+    if not _has_pg_trgm(cur):
+        cur.execute("SELECT name FROM products WHERE name IS NOT NULL AND name != ''")
+        product_names = [row['name'] for row in cur.fetchall()]
+        return similarity.suggest(categories, product_names, limit, threshold)
+
+    # % 演算子 (索引を使う) の閾値を、このトランザクションの間だけ設定に合わせる
+    cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", (str(threshold),))
+    cur.execute("""
+        SELECT u.category, s.name, s.score
+        FROM unnest(%s::text[]) AS u(category)
+        CROSS JOIN LATERAL (
+            SELECT p.name, similarity(LOWER(TRIM(p.name)), LOWER(TRIM(u.category))) AS score
+            FROM products p
+            WHERE LOWER(TRIM(p.name)) %% LOWER(TRIM(u.category))
+            ORDER BY score DESC, p.name
+            LIMIT %s
+        ) AS s
+        ORDER BY u.category, s.score DESC, s.name
+    """, (list(categories), limit))
+    suggestions = {category: [] for category in categories}
+    for row in cur.fetchall():
+        suggestions[row['category']].append((row['name'], row['score']))
+    return suggestions
+
 @bp.route('/check_categories')
 @login_required
 def admin_check_categories():
     conn = None
     unmatched_categories = []
     matched_but_null_date = []
+    suggestions = {}
     
     try:
         conn = get_db_connection()
         cur = conn.cursor()
 
-        cur.execute("SELECT DISTINCT category FROM items WHERE category IS NOT NULL AND category != '' ORDER BY category")
-        items_categories_raw = [row['category'] for row in cur.fetchall()]
-        
-        cur.execute("SELECT name, release_date FROM products WHERE name IS NOT NULL AND name != ''")
-        products_raw = cur.fetchall()
-
-        products_map_normalized = {
-            row['name'].strip().lower(): row for row in products_raw
-        }
-
-        for category in items_categories_raw:
-            normalized_cat = category.strip().lower()
-            matching_product = products_map_normalized.get(normalized_cat)
+        # 製品マスタと対応しない (anti-join)、または発売日のない製品に対応するカテゴリを1回の SQL で求める。
+        # 比較は一覧画面と同じ LOWER(TRIM(...)) で、両側とも式の索引 (migrations/005) を使える
+        cur.execute("""
+            WITH categories AS (
+                SELECT category, COUNT(*) AS item_count
+                FROM items
+                WHERE category IS NOT NULL AND category != ''
+                GROUP BY category
+            )
+            SELECT c.category, c.item_count, p.name AS product_name
+            FROM categories c
+            LEFT JOIN LATERAL (
+                SELECT name, release_date FROM products
+                WHERE LOWER(TRIM(name)) = LOWER(TRIM(c.category))
+                ORDER BY name
+                LIMIT 1
+            ) AS p ON TRUE
+            WHERE p.name IS NULL OR p.release_date IS NULL
+            ORDER BY c.category
+        """)
+        for row in cur.fetchall():
+            if row['product_name'] is None:
+                unmatched_categories.append(row)
+            else:
+                matched_but_null_date.append(row)
 
-            if not matching_product:
-                unmatched_categories.append(category)
-            elif matching_product['release_date'] is None:
-                matched_but_null_date.append(category)
+        suggestions = suggest_products_for_categories(cur, [row['category'] for row in unmatched_categories])
 
         total_issues = len(unmatched_categories) + len(matched_but_null_date)
         if total_issues > 0:
@@ -566,44 +693,231 @@ def admin_check_categories():
     return render_template(
         'admin/admin_check_categories.html', 
         unmatched_categories=unmatched_categories,
-        matched_but_null_date=matched_but_null_date
+        matched_but_null_date=matched_but_null_date,
+        suggestions=suggestions
     )
 
+@bp.route('/check_categories/remap', methods=['POST'])
+@login_required
+def remap_category():
+    """ あるカテゴリのカードを、まとめて既存の製品のカテゴリに付け替える (1回の UPDATE) """
+    from_category = request.form.get('from_category', '')
+    to_product = request.form.get('to_product', '').strip()
+    if not from_category or not to_product:
+        flash('付け替え元のカテゴリと付け替え先の製品を指定してください。', 'warning')
+        return redirect(url_for('admin.admin_check_categories'))
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM products WHERE name = %s", (to_product,))
+        if cur.fetchone() is None:
+            flash(f'製品「{to_product}」は製品マスタに登録されていません。', 'danger')
+            return redirect(url_for('admin.admin_check_categories'))
+        cur.execute("UPDATE items SET category = %s WHERE category = %s", (to_product, from_category))
+        remapped = cur.rowcount
+        conn.commit()
+        current_app.logger.info(f"Category '{from_category}' remapped to '{to_product}' ({remapped} items) by user '{session.get('username', 'unknown_user')}'.")
+        flash(f'カテゴリ「{from_category}」の {remapped} 件のカードを「{to_product}」に付け替えました。', 'success')
+    except (Exception, psycopg2.Error) as error:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error remapping category '{from_category}' to '{to_product}': {error}")
+        flash(f'カテゴリの付け替え中にエラーが発生しました: {error}', 'danger')
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+    return redirect(url_for('admin.admin_check_categories'))
+
+@bp.route('/duplicates')
+@login_required
+def admin_duplicates():
+    """ 重複・ほぼ重複のカード (正規化したカードID・カード名とレアリティが同じ行) の一覧 """
+    conn = None
+    clusters = []
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        clusters = duplicates.find_duplicate_clusters(cur, limit=config.DUPLICATE_REPORT_MAX_CLUSTERS)
+    except (Exception, psycopg2.Error) as error:
+        current_app.logger.error(f"Error in admin_duplicates: {error}")
+        traceback.print_exc()
+        flash(f"重複チェック中にエラーが発生しました: {error}", "danger")
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+
+    return render_template('admin/admin_duplicates.html', clusters=clusters,
+                           max_clusters=config.DUPLICATE_REPORT_MAX_CLUSTERS)
+
+@bp.route('/duplicates/merge', methods=['POST'])
+@login_required
+def merge_duplicates():
+    """
+    選択したクラスタごとに、残す行へ在庫を足して他の行を削除する (全クラスタを1回の SQL で処理する)。
+    クラスタはここで求め直し、フォームからは「どのクラスタか (先頭の id)」と「残す行」だけを受け取る。
+    """
+    selected = {int(value) for value in request.form.getlist('cluster') if value.isdigit()}
+    if not selected:
+        flash('まとめるカードを選択してください。', 'warning')
+        return redirect(url_for('admin.admin_duplicates'))
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        merges = []
+        for cluster in duplicates.find_duplicate_clusters(cur):
+            key = cluster.ids[0]
+            if key not in selected:
+                continue
+            survivor = request.form.get(f'survivor_{key}', '')
+            survivor_id = int(survivor) if survivor.isdigit() else cluster.survivor_id
+            if survivor_id not in cluster.ids:
+                survivor_id = cluster.survivor_id
+            merges.append((survivor_id, cluster.ids))
+        survivors, merged = duplicates.merge_clusters(cur, merges)
+        conn.commit()
+        current_app.logger.info(f"Merged {merged} duplicate items into {survivors} items by user '{session.get('username', 'unknown_user')}'.")
+        flash(f'{merged} 件の重複カードを {survivors} 件のカードにまとめました (削除した行は items_archive に退避しています)。', 'success')
+    except (Exception, psycopg2.Error) as error:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error merging duplicates: {error}")
+        flash(f'重複カードのまとめ中にエラーが発生しました: {error}', 'danger')
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+    return redirect(url_for('admin.admin_duplicates'))
+
+# 製品マスタ管理の一覧で指定できるソートキー: (並べ替えに使う式, 型)
+# キーセット方式のページングでは行の比較が成り立つよう NULL を埋めた式で並べ、同じ値の中は name (主キー) 順にする。
+# 式は migrations/006_product_list_indexes.sql の索引と揃えておくこと
+PRODUCT_LIST_SORT_KEYS = {
+    'release_date': ("COALESCE(release_date, DATE '0001-01-01')", 'date'),
+    'name': ("name", 'text'),
+    'display_name': ("COALESCE(display_name, '')", 'text'),
+    'era': ("COALESCE(era, -1)", 'integer'),
+    'show_in_sidebar': ("show_in_sidebar", 'boolean'),
+}
+
+def encode_product_cursor(sort_key, sort_order, sort_value, name):
+    if isinstance(sort_value, datetime.date):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_key, sort_order, sort_value, name], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _is_product_sort_value(sort_value, value_type):
+    """ カーソルのソート値が PRODUCT_LIST_SORT_KEYS の型 (value_type) として使えるか """
+    if value_type == 'date':
+        try:
+            datetime.date.fromisoformat(sort_value)
+        except (TypeError, ValueError):
+            return False
+        return True
+    if value_type == 'integer':
+        # bool は int の一種なので別に除く
+        return isinstance(sort_value, int) and not isinstance(sort_value, bool)
+    if value_type == 'boolean':
+        return isinstance(sort_value, bool)
+    return isinstance(sort_value, str)
+
+def decode_product_cursor(cursor, sort_key, sort_order):
+    """
+    カーソルを (ソート値, 製品名) に戻す。不正か、ソート条件が違えば None。
+    書き換えられたカーソルで DB のエラーにならないよう、ソート値の型もここで確かめる。
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort_key, cursor_sort_order, sort_value, name = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        return None
+    if (cursor_sort_key, cursor_sort_order) != (sort_key, sort_order) or not isinstance(name, str):
+        return None
+    if sort_key not in PRODUCT_LIST_SORT_KEYS or not _is_product_sort_value(sort_value, PRODUCT_LIST_SORT_KEYS[sort_key][1]):
+        return None
+    return sort_value, name
+
+def fetch_product_page(cur, search_keyword, sort_key, sort_order, after=None, before=None, page_size=None):
+    """
+    製品マスタの1ページ分を返す。after / before はそれぞれ次・前のページのカーソル。
+    戻り値: (製品の行, 前のページのカーソル or None, 次のページのカーソル or None)
+    """
+    page_size = page_size or config.PRODUCT_LIST_PAGE_SIZE
+    expression, value_type = PRODUCT_LIST_SORT_KEYS[sort_key]
+    ascending = sort_order == 'asc'
+
+    conditions = []
+    params = []
+    if search_keyword:
+        conditions.append("(LOWER(name) LIKE %s OR LOWER(display_name) LIKE %s)")
+        params += [f"%{search_keyword.lower()}%"] * 2
+
+    position = decode_product_cursor(before or after, sort_key, sort_order) if (before or after) else None
+    backward = position is not None and before is not None
+    if position is not None:
+        # 前のページは、並び順を逆にして取得してから元の順に戻す
+        operator = '>' if ascending != backward else '<'
+        conditions.append(f"({expression}, name) {operator} (%s::{value_type}, %s)")
+        params += list(position)
+
+    direction = 'ASC' if ascending != backward else 'DESC'
+    query = f"SELECT name, display_name, release_date, era, show_in_sidebar, LOWER(TRIM(name)) AS category_key, {expression} AS sort_value FROM products"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {expression} {direction}, name {direction} LIMIT %s"
+    cur.execute(query, tuple(params) + (page_size + 1,))
+    products = cur.fetchall()
+
+    has_more = len(products) > page_size
+    products = products[:page_size]
+    if backward:
+        products.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = position is not None, has_more
+
+    previous_cursor = next_cursor = None
+    if products and has_previous:
+        previous_cursor = encode_product_cursor(sort_key, sort_order, products[0]['sort_value'], products[0]['name'])
+    if products and has_next:
+        next_cursor = encode_product_cursor(sort_key, sort_order, products[-1]['sort_value'], products[-1]['name'])
+    return products, previous_cursor, next_cursor
+
 @bp.route('/products')
 @login_required
+@read_only
 def manage_products():
-    """製品マスタの一覧表示ページ"""
+    """製品マスタの一覧表示ページ (キーセット方式でページング)"""
     conn = None
     search_keyword = request.args.get('keyword', '').strip()
     sort_key = request.args.get('sort_key', 'release_date')
     sort_order = request.args.get('sort_order', 'desc')
+    if sort_key not in PRODUCT_LIST_SORT_KEYS:
+        sort_key = 'release_date'
+    if sort_order not in ['asc', 'desc']:
+        sort_order = 'desc'
+    previous_cursor = next_cursor = None
 
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        
-        query = "SELECT name, display_name, release_date, era, show_in_sidebar FROM products"
-        params = []
-        
-        if search_keyword:
-            query += " WHERE LOWER(name) LIKE %s OR LOWER(display_name) LIKE %s"
-            params.append(f"%{search_keyword.lower()}%")
-            params.append(f"%{search_keyword.lower()}%")
-            
-        valid_sort_keys = ['name', 'display_name', 'release_date', 'era', 'show_in_sidebar']
-        if sort_key not in valid_sort_keys:
-            sort_key = 'release_date'
-        if sort_order not in ['asc', 'desc']:
-            sort_order = 'desc'
-            
-        query += f" ORDER BY {sort_key} {sort_order.upper()}"
-        
-        cur.execute(query, tuple(params))
-        products = cur.fetchall()
+        products, previous_cursor, next_cursor = fetch_product_page(
+            cur, search_keyword, sort_key, sort_order,
+            after=request.args.get('after'), before=request.args.get('before')
+        )
+        # 在庫の集計はトリガーで更新している集計テーブルから、このページの製品の分だけ読む (items は走査しない)
+        product_rollups = rollups.fetch_rollups(cur, [p['category_key'] for p in products])
 
     except (Exception, psycopg2.Error) as error:
         flash(f'製品リストの取得中にエラーが発生しました: {error}', 'danger')
         products = []
+        product_rollups = None
     finally:
         if conn:
             cur.close()
@@ -611,9 +925,12 @@ def manage_products():
 
     return render_template('admin/manage_products.html', 
                            products=products, 
+                           rollups=product_rollups,
                            keyword=search_keyword,
                            sort_key=sort_key,
-                           sort_order=sort_order)
+                           sort_order=sort_order,
+                           previous_cursor=previous_cursor,
+                           next_cursor=next_cursor)
 
 @bp.route('/products/add', methods=['GET', 'POST'])
 @login_required
@@ -709,16 +1026,40 @@ def edit_product(product_name):
                                    page_title=f'製品の編集: {original_name}')
         
         new_era = calculate_era(new_release_date_str)
+        renaming = new_name != original_name
         conn = None
         try:
             conn = get_db_connection()
             cur = conn.cursor()
+
+            # 製品名を変えると、カテゴリに旧製品名を持つカードが製品と対応しなくなる。
+            # 書き換わるカードがあれば、件数を確認画面に出してから実行する
+            if renaming and request.form.get('confirm_rename') != '1':
+                item_count = count_items_to_rename(cur, original_name, new_name)
+                if item_count > 0:
+                    return render_template('admin/confirm_rename_product.html',
+                                           original_name=original_name,
+                                           product=product_for_form,
+                                           item_count=item_count)
+
             cur.execute(
                 "UPDATE products SET name=%s, display_name=%s, release_date=%s, era=%s, show_in_sidebar=%s WHERE name=%s",
                 (new_name, new_display_name or new_name, new_release_date_str, new_era, new_show_in_sidebar, original_name)
             )
+            renamed_items = 0
+            if renaming and cur.rowcount:
+                total_items = count_items_to_rename(cur, original_name, new_name)
+
+                def log_progress(updated):
+                    current_app.logger.info(f"Renaming category '{original_name}' to '{new_name}': {updated}/{total_items} items updated")
+
+                renamed_items = rename_category_in_batches(cur, original_name, new_name, on_batch=log_progress)
             conn.commit()
-            flash(f'製品「{original_name}」の情報を更新しました。', 'success')
+            if renamed_items:
+                current_app.logger.info(f"Product '{original_name}' renamed to '{new_name}' with {renamed_items} items by user '{session.get('username', 'unknown_user')}'.")
+                flash(f'製品「{original_name}」の情報を更新し、{renamed_items} 件のカードのカテゴリを「{new_name}」に変更しました。', 'success')
+            else:
+                flash(f'製品「{original_name}」の情報を更新しました。', 'success')
             return redirect(url_for('admin.manage_products'))
         except psycopg2.IntegrityError:
             if conn: conn.rollback()
@@ -767,14 +1108,25 @@ def edit_product(product_name):
 
 @bp.route('/products/export')
 @login_required
+@read_only
 def export_products():
     """製品マスタをCSVファイルとしてエクスポートする"""
+    # products が前回のエクスポートから変わっていなければ 304 を返す
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    etag = modified_at = None
+    if versions:
+        modified_at = versioning.last_modified(versions, 'products')
+        etag = versioning.make_etag('export_products', versioning.version_key(versions, 'products'))
+        not_modified = versioning.not_modified_response(etag, modified_at)
+        if not_modified is not None:
+            return not_modified
+
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT name, display_name, release_date, era, show_in_sidebar FROM products ORDER BY release_date DESC")
-        products = cur.fetchall()
+        cur = records.tuple_cursor(conn)
+        cur.execute(f"SELECT {', '.join(records.PRODUCT_COLUMNS)} FROM products ORDER BY release_date DESC")
+        products = records.fetch_records(cur, records.ProductRow)
     except (Exception, psycopg2.Error) as error:
         flash(f'製品データのエクスポート中にエラーが発生しました: {error}', 'danger')
         return redirect(url_for('admin.manage_products'))
@@ -788,20 +1140,20 @@ def export_products():
     si.write('\ufeff') 
     cw = csv.writer(si)
     
-    headers = ['name', 'display_name', 'release_date', 'era', 'show_in_sidebar']
-    cw.writerow(headers)
+    cw.writerow(records.PRODUCT_COLUMNS)
 
     for product in products:
-        row = list(product)
-        if isinstance(row[2], datetime.date):
-            row[2] = row[2].strftime('%Y-%m-%d')
-        cw.writerow(row)
+        if isinstance(product.release_date, datetime.date):
+            product = product._replace(release_date=product.release_date.strftime('%Y-%m-%d'))
+        cw.writerow(product)
     
     output = make_response(si.getvalue())
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"products_export_{timestamp}.csv"
     output.headers["Content-Disposition"] = f"attachment; filename=\"{filename}\""
     output.headers["Content-type"] = "text/csv; charset=utf-8"
+    if etag:
+        versioning.set_validators(output, etag, modified_at)
     
     return output
 
@@ -846,40 +1198,29 @@ def process_products_csv(file_stream):
     errors = []
     
     try:
-        content = file_stream.read().decode('utf-8-sig')
-        reader = csv.DictReader(io.StringIO(content))
-        
-        header_map = {
-            'name': ['name', '製品名'],
-            'release_date': ['release_date', '発売日'],
-            'display_name': ['display_name', '表示名'],
-            'show_in_sidebar': ['show_in_sidebar', 'サイドバー表示']
-        }
-        
-        normalized_headers = {h.lower(): h for h in reader.fieldnames}
-        
-        mapped_cols = {}
-        for key, possible_names in header_map.items():
-            for name in possible_names:
-                if name.lower() in normalized_headers:
-                    mapped_cols[key] = normalized_headers[name.lower()]
-                    break
-        
-        if 'name' not in mapped_cols or 'release_date' not in mapped_cols:
+        upload_stream = csv_ingest.UploadTextStream(file_stream)
+        reader = csv.reader(upload_stream.text)
+
+        try:
+            compiled_header = csv_ingest.read_header(reader, csv_ingest.PRODUCT_CSV_SPEC)
+        except csv_ingest.CsvHeaderError:
+            compiled_header = None
+        if compiled_header is None:
             errors.append("CSVヘッダーに 'name' (製品名) と 'release_date' (発売日) が必要です。")
             stats['error'] = 1
             return stats, errors
+        has_display_name = compiled_header.has('display_name')
+        has_show_in_sidebar = compiled_header.has('show_in_sidebar')
 
         conn = get_db_connection()
         with conn.cursor() as cur:
-            for i, row in enumerate(reader):
+            for data_row_num, row_values, row_problem in csv_ingest.iter_rows(reader, compiled_header):
                 stats['total'] += 1
-                row_num = i + 2
+                row_num = data_row_num + 1
                 
-                product_name = row.get(mapped_cols['name'], '').strip()
-                release_date_str = row.get(mapped_cols['release_date'], '').strip()
+                product_name, release_date_str, display_name, show_val = row_values
 
-                if not product_name or not release_date_str:
+                if row_problem is not None:
                     errors.append(f"行 {row_num}: 製品名または発売日が空です。スキップしました。")
                     stats['error'] += 1
                     continue
@@ -902,11 +1243,11 @@ def process_products_csv(file_stream):
                     'era': new_era
                 }
                 
-                if 'display_name' in mapped_cols and row.get(mapped_cols['display_name']):
-                    updates['display_name'] = row.get(mapped_cols['display_name'], '').strip()
+                if has_display_name and display_name:
+                    updates['display_name'] = display_name
                 
-                if 'show_in_sidebar' in mapped_cols:
-                    show_val = row.get(mapped_cols['show_in_sidebar'], '').strip().lower()
+                if has_show_in_sidebar:
+                    show_val = show_val.lower()
                     if show_val in ['true', '1', 'yes', 't']:
                         updates['show_in_sidebar'] = True
                     elif show_val in ['false', '0', 'no', 'f', '']:
@@ -934,6 +1275,8 @@ def process_products_csv(file_stream):
         errors.append(f"致命的なエラーが発生しました: {e}")
         stats['error'] += 1
     finally:
+        if 'upload_stream' in locals():
+            upload_stream.close()
         if 'conn' in locals() and conn:
             conn.close()
 
@@ -1050,6 +1393,14 @@ def scrape_wiki_page(url):
     ページ内の全セクションを探索し、リスト形式とテーブル形式の両方に個別に対応する。
     成功した場合は (カテゴリ名, カードリスト)、失敗した場合は (None, エラーメッセージ) を返す。
     """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from webdriver_manager.chrome import ChromeDriverManager
+    from bs4 import BeautifulSoup
+
     options = webdriver.ChromeOptions()
     options.add_argument('--headless')
     options.add_argument('--no-sandbox')
@@ -1266,4 +1617,49 @@ def manage_config():
     # テンプレートに設定値を渡して表示
     return render_template('admin/manage_config.html',
                            config_items=config_items,
-                           page_title='アプリケーション設定管理')
\ No newline at end of file
+                           page_title='アプリケーション設定管理')
+
+@bp.route('/analytics')
+@login_required
+@read_only
+def inventory_analytics():
+    """ 期・レアリティ・製品ごとの在庫枚数と在庫ありの割合 """
+    summary, elapsed_ms, cached = None, 0.0, False
+    try:
+        summary, elapsed_ms, cached = analytics.get_inventory_summary()
+    except (Exception, psycopg2.Error) as error:
+        current_app.logger.error(f"Error in inventory_analytics: {error}")
+        flash(f"在庫分析の集計中にエラーが発生しました: {error}", "danger")
+
+    return render_template('admin/analytics.html',
+                           summary=summary,
+                           elapsed_ms=elapsed_ms,
+                           cached=cached,
+                           top_n=config.ANALYTICS_TOP_PRODUCTS,
+                           era_names=config.ERA_DISPLAY_NAMES,
+                           page_title='在庫分析')
+
+@bp.route('/performance')
+@login_required
+def performance():
+    """
+    SQL の累計実行時間ランキングと、エンドポイントごとのレイテンシ分布を表示するページ。
+    集計はワーカープロセスごとに行われる。
+    """
+    return render_template('admin/performance.html',
+                           top_statements=instrumentation.query_stats.top(50),
+                           endpoint_latencies=instrumentation.endpoint_latency.summary(),
+                           latency_buckets=instrumentation.LATENCY_BUCKETS_MS,
+                           stats_started_at=datetime.datetime.fromtimestamp(instrumentation.query_stats.started_at),
+                           worker_pid=os.getpid(),
+                           slow_query_threshold_ms=config.SLOW_QUERY_THRESHOLD_MS,
+                           page_title='パフォーマンス計測')
+
+@bp.route('/performance/reset', methods=['POST'])
+@login_required
+def reset_performance():
+    """計測結果の集計をリセットする"""
+    instrumentation.query_stats.reset()
+    instrumentation.endpoint_latency.reset()
+    flash('計測結果をリセットしました。', 'info')
+    return redirect(url_for('admin.performance'))
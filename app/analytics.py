@@ -0,0 +1,151 @@
+# app/analytics.py
+# 管理画面の在庫分析 (期・レアリティ・製品ごとの在庫枚数と在庫ありの割合) を求める処理。
+# 製品ごと・レアリティごとの集計 (product_stock_rollups、migrations/004 と 010) を products と結合し、
+# GROUPING SETS を使った1回の SQL で、全体・期別・レアリティ別・期×レアリティ別・製品別の集計をまとめて求める。
+# 集計テーブルがない (マイグレーション未適用) 場合は、同じ形の集計を items から求める。
+# 結果は items / products の版番号をキーにキャッシュするので、データが変わるまでは SQL を実行しない。
+import heapq
+import time
+
+import psycopg2.errors
+
+from . import config, versioning
+from .cache import analytics_cache
+from .db import get_db_connection
+
+_ROLLUP_SOURCE = "SELECT category_key, rare, item_rows, in_stock_rows, total_stock FROM product_stock_rollups"
+_ITEMS_SOURCE = """
+    SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+           COUNT(*) AS item_rows, COUNT(*) FILTER (WHERE stock > 0) AS in_stock_rows,
+           COALESCE(SUM(stock), 0) AS total_stock
+    FROM items
+    GROUP BY 1, 2
+"""
+
+# GROUPING(era, rare, category_key) のビット: 集計でまとめた (GROUP BY に含まれない) 列が 1
+_BY_ALL = 0b111
+_BY_ERA = 0b011
+_BY_RARE = 0b101
+_BY_ERA_RARE = 0b001
+_BY_PRODUCT = 0b010
+
+_SUMMARY_QUERY = """
+    WITH source AS ({source}),
+    keyed AS (
+        SELECT s.*, p.era, p.name AS product_name, p.display_name
+        FROM source s
+        LEFT JOIN products p ON LOWER(TRIM(p.name)) = s.category_key
+    )
+    SELECT GROUPING(era, rare, category_key) AS grouping, era, rare, category_key,
+           MAX(product_name) AS product_name, MAX(display_name) AS display_name,
+           SUM(item_rows) AS item_rows, SUM(in_stock_rows) AS in_stock_rows, SUM(total_stock) AS total_stock
+    FROM keyed
+    GROUP BY GROUPING SETS ((), (era), (rare), (era, rare), (era, category_key))
+"""
+
+
+class StockStats:
+    """ 集計の1行: カード種類数・在庫ありの種類数・在庫枚数 """
+    __slots__ = ('item_rows', 'in_stock_rows', 'total_stock')
+
+    def __init__(self, item_rows=0, in_stock_rows=0, total_stock=0):
+        self.item_rows = int(item_rows or 0)
+        self.in_stock_rows = int(in_stock_rows or 0)
+        self.total_stock = int(total_stock or 0)
+
+    @property
+    def in_stock_percent(self):
+        if not self.item_rows:
+            return 0.0
+        return self.in_stock_rows * 100.0 / self.item_rows
+
+
+class InventorySummary:
+    """
+    在庫分析の結果。
+    by_era: {期 (製品マスタにないカテゴリは None): StockStats}
+    by_rarity: {レアリティ: StockStats}
+    by_era_rarity: {(期, レアリティ): StockStats}
+    products: [(製品名, 表示名, 期, StockStats), ...] (製品マスタにないカテゴリはカテゴリ名を製品名にする)
+    """
+
+    def __init__(self, total, by_era, by_rarity, by_era_rarity, products):
+        self.total = total
+        self.by_era = by_era
+        self.by_rarity = by_rarity
+        self.by_era_rarity = by_era_rarity
+        self.products = products
+
+    def top_products(self, limit=10, era=None):
+        """ 在庫枚数の多い製品 limit 件 (era を指定するとその期の製品だけ) """
+        candidates = self.products if era is None else (p for p in self.products if p[2] == era)
+        return heapq.nlargest(limit, candidates, key=lambda p: (p[3].total_stock, p[3].in_stock_rows))
+
+    def rarities(self):
+        """ 在庫枚数の多い順のレアリティ """
+        return sorted(self.by_rarity, key=lambda rare: -self.by_rarity[rare].total_stock)
+
+    def eras(self):
+        """ ERA_DISPLAY_ORDER の順に、集計に現れた期 (製品マスタにないカテゴリの None は最後) """
+        eras = [era for era in config.ERA_DISPLAY_ORDER if era in self.by_era]
+        eras += sorted(era for era in self.by_era if era is not None and era not in eras)
+        if None in self.by_era:
+            eras.append(None)
+        return eras
+
+
+def build_summary(rows):
+    """ _SUMMARY_QUERY の結果の行から InventorySummary を組み立てる """
+    total = StockStats()
+    by_era, by_rarity, by_era_rarity, products = {}, {}, {}, []
+    for row in rows:
+        stats = StockStats(row['item_rows'], row['in_stock_rows'], row['total_stock'])
+        grouping = row['grouping']
+        if grouping == _BY_ALL:
+            total = stats
+        elif grouping == _BY_ERA:
+            by_era[row['era']] = stats
+        elif grouping == _BY_RARE:
+            by_rarity[row['rare']] = stats
+        elif grouping == _BY_ERA_RARE:
+            by_era_rarity[(row['era'], row['rare'])] = stats
+        elif grouping == _BY_PRODUCT:
+            name = row['product_name'] or row['category_key']
+            products.append((name, row['display_name'] or name, row['era'], stats))
+    return InventorySummary(total, by_era, by_rarity, by_era_rarity, products)
+
+def compute_summary(cur):
+    """ 集計テーブルから (なければ items から) 在庫分析を求める """
+    try:
+        cur.execute(_SUMMARY_QUERY.format(source=_ROLLUP_SOURCE))
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        cur.execute(_SUMMARY_QUERY.format(source=_ITEMS_SOURCE))
+    return build_summary(cur.fetchall())
+
+
+def get_inventory_summary():
+    """
+    (InventorySummary, 求めるのにかかった時間 (ミリ秒), キャッシュから返したか) を返す。
+    items / products の版番号が前回と同じなら、キャッシュした結果をそのまま返す。
+    """
+    started_at = time.perf_counter()
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    version = versioning.version_key(versions, 'items', 'products') if versions else None
+    summary = analytics_cache.get('inventory', version) if version else None
+    cached = summary is not None
+    if summary is None:
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            summary = compute_summary(cur)
+            conn.rollback()
+        finally:
+            if conn:
+                if 'cur' in locals() and not cur.closed:
+                    cur.close()
+                conn.close()
+        if version:
+            analytics_cache.set('inventory', version, summary)
+    return summary, (time.perf_counter() - started_at) * 1000, cached
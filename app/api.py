@@ -0,0 +1,263 @@
+# app/api.py
+# 外部の連携ツール向けの読み取り用 JSON API。
+# - /api/v1/items (/api/items は同じもの): 一覧画面と同じ検索条件で在庫を返す
+# - fields= で返す項目を絞れる
+# - ページングは不透明なカーソル (next_cursor をそのまま cursor= に渡す) によるキーセット方式
+# - JSON は少しずつ組み立てて送り、クライアントが対応していれば gzip で圧縮する
+# - /api/v1/changes/items, /api/v1/changes/products: ウォーターマーク以降の変更 (更新・削除) を返す変更フィード
+# - /api/products/suggest: 製品名の前方一致候補 (カード追加・編集フォームの入力補完用)
+# - 変更フィード以外は、DATABASE_REPLICA_URL があればレプリカから読む (replica.py)
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+import zlib
+
+import psycopg2
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from . import changefeed, config, product_index, queries, versioning
+from .db import get_db_connection
+from .replica import read_only
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+# 返すことのできる項目 (fields= で指定できる名前)
+ITEM_FIELDS = ('id', 'name', 'card_id', 'rare', 'stock', 'category', 'release_date', 'era', 'display_name')
+
+# 1回に送る JSON の行数
+_STREAM_BATCH_ROWS = 200
+
+
+class ApiError(Exception):
+    """ クライアントの指定が不正な場合のエラー (400 で返す) """
+
+
+@bp.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({'success': False, 'message': str(error)}), 400
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _parse_fields(value):
+    if not value:
+        return ITEM_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in ITEM_FIELDS]
+    if unknown:
+        raise ApiError(f"不明な項目です: {', '.join(unknown)} (指定できる項目: {', '.join(ITEM_FIELDS)})")
+    return fields
+
+def _parse_limit(value, default, maximum):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiError("limit は整数で指定してください。")
+    if limit < 1:
+        raise ApiError("limit は1以上で指定してください。")
+    return min(limit, maximum)
+
+
+def _filters_digest(search_field, filter_shape, filter_params, sort_by, sort_order):
+    """ カーソルを別の検索条件で使い回されないよう、条件から作る短い値 """
+    return hashlib.sha1(repr((search_field, filter_shape, filter_params, sort_by, sort_order)).encode('utf-8')).hexdigest()[:16]
+
+def encode_cursor(sort_by, sort_order, sort_value, item_id, digest):
+    payload = json.dumps([sort_by, sort_order, sort_value, item_id, digest], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """ カーソルを (ソートキー, 並び順, ソート値, id, 条件の値) に戻す。不正なら ApiError """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_by, sort_order, sort_value, item_id, digest = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise ApiError("cursor が不正です。")
+    if sort_by not in queries.ITEM_API_SORT_KEYS or sort_order not in ('asc', 'desc') or not isinstance(item_id, int):
+        raise ApiError("cursor が不正です。")
+    return sort_by, sort_order, sort_value, item_id, digest
+
+
+def _is_cursor_sort_value(sort_value, value_type):
+    """ カーソルのソート値が ITEM_API_SORT_KEYS の型 (value_type) として使えるか """
+    if value_type == 'integer':
+        # bool は int の一種なので別に除く
+        return isinstance(sort_value, int) and not isinstance(sort_value, bool)
+    return isinstance(sort_value, str)
+
+def _sort_value(row, sort_by):
+    """ ITEM_API_SORT_KEYS の式と同じ値を行から求める """
+    if sort_by == 'name':
+        return row['name'] or ''
+    if sort_by == 'stock':
+        return row['stock'] or 0
+    return row['id']
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _iter_json(rows, fields, next_cursor):
+    """ 応答の JSON を少しずつ組み立てて返す """
+    yield '{"items":['
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json_default).encode
+    for start in range(0, len(rows), _STREAM_BATCH_ROWS):
+        batch = rows[start:start + _STREAM_BATCH_ROWS]
+        encoded = ','.join(dumps({field: row[field] for field in fields}) for row in batch)
+        yield (',' if start else '') + encoded
+    yield '],"count":' + str(len(rows)) + ',"next_cursor":' + json.dumps(next_cursor) + '}'
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(config.API_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@bp.route('/v1/items')
+@bp.route('/items')
+@read_only
+def list_items():
+    """
+    在庫の一覧を返す。
+    クエリ引数: show_zero, keyword, search_field, category, sort (id/name/stock), order (asc/desc), fields, limit, cursor
+    """
+    show_zero = _parse_bool(request.args.get('show_zero', ''))
+    keyword = request.args.get('keyword', '').strip()
+    search_field = request.args.get('search_field', 'all')
+    category = request.args.get('category') or None
+    fields = _parse_fields(request.args.get('fields'))
+    limit = _parse_limit(request.args.get('limit'), config.API_DEFAULT_PAGE_SIZE, config.API_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+
+    sort_by = request.args.get('sort', 'id')
+    sort_order = request.args.get('order', 'asc').lower()
+    if sort_by not in queries.ITEM_API_SORT_KEYS:
+        raise ApiError(f"sort は {', '.join(queries.ITEM_API_SORT_KEYS)} のいずれかで指定してください。")
+    if sort_order not in ('asc', 'desc'):
+        raise ApiError("order は asc か desc で指定してください。")
+
+    search_field, filter_shape, filter_params = queries.item_list_filter_params(show_zero, keyword, search_field, category)
+    digest = _filters_digest(search_field, filter_shape, filter_params, sort_by, sort_order)
+
+    if cursor:
+        cursor_sort_by, cursor_sort_order, sort_value, after_id, cursor_digest = decode_cursor(cursor)
+        if (cursor_sort_by, cursor_sort_order, cursor_digest) != (sort_by, sort_order, digest):
+            raise ApiError("cursor は同じ検索条件・並び順でのみ使えます。")
+        if not _is_cursor_sort_value(sort_value, queries.ITEM_API_SORT_KEYS[sort_by][1]):
+            raise ApiError("cursor が不正です。")
+        query_name = queries.item_api_query_name(search_field, filter_shape, sort_by, sort_order, True)
+        params = filter_params + (sort_value, after_id, limit + 1)
+    else:
+        query_name = queries.item_api_query_name(search_field, filter_shape, sort_by, sort_order, False)
+        params = filter_params + (limit + 1,)
+
+    # 内容が変わっていなければ 304 を返す
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    etag = modified_at = None
+    if versions:
+        modified_at = versioning.last_modified(versions, 'items', 'products')
+        etag = versioning.make_etag('api_items', versioning.version_key(versions, 'items', 'products'),
+                                    sorted(request.args.items(multi=True)))
+        not_modified = versioning.not_modified_response(etag, modified_at)
+        if not_modified is not None:
+            return not_modified
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        queries.execute(cur, query_name, params)
+        rows = cur.fetchall()
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Error fetching items for API: {e}")
+        return jsonify({'success': False, 'message': 'データベースエラーが発生しました。'}), 500
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_by, sort_order, _sort_value(last, sort_by), last['id'], digest)
+
+    body = _iter_json(rows, fields, next_cursor)
+    response = Response(content_type='application/json; charset=utf-8')
+    if 'gzip' in request.accept_encodings:
+        response.response = _gzip_stream(body)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.response = (chunk.encode('utf-8') for chunk in body)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if etag:
+        versioning.set_validators(response, etag, modified_at)
+    return response
+
+
+@bp.route('/v1/changes/<entity>')
+def list_changes(entity):
+    """
+    ウォーターマーク (since) より後の変更を返す。応答の next を次の since に渡し、has_more が false になるまで繰り返す。
+    クエリ引数: since, limit
+    """
+    if entity not in changefeed.ENTITIES:
+        return jsonify({'success': False, 'message': f"不明な種類です: {entity}"}), 404
+    limit = _parse_limit(request.args.get('limit'), config.CHANGE_FEED_BATCH_SIZE, config.CHANGE_FEED_MAX_BATCH_SIZE)
+    since = request.args.get('since')
+    try:
+        changefeed.decode_watermark(since, entity)
+    except changefeed.WatermarkError as e:
+        raise ApiError(str(e))
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        changes = changefeed.fetch_changes(cur, entity, since, limit)
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Error fetching change feed for {entity}: {e}")
+        return jsonify({'success': False, 'message': 'データベースエラーが発生しました。'}), 500
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+
+    body = json.dumps(changes, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+    response = Response(content_type='application/json; charset=utf-8')
+    if 'gzip' in request.accept_encodings:
+        response.response = _gzip_stream([body])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(body)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@bp.route('/v1/products/suggest')
+@bp.route('/products/suggest')
+@read_only
+def suggest_products():
+    """
+    製品名・表示名が q で始まる製品を返す (プロセス内のインデックスを引くだけで、DB は版番号の確認のみ)。
+    クエリ引数: q, limit
+    """
+    query = request.args.get('q', '').strip()
+    limit = _parse_limit(request.args.get('limit'), config.PRODUCT_SUGGEST_DEFAULT_LIMIT, config.PRODUCT_SUGGEST_MAX_LIMIT)
+    index = product_index.get_product_index()
+    names = index.search(query, limit)
+    return jsonify({
+        'suggestions': [{'name': name, 'display_name': index.display_names.get(name)} for name in names],
+    })
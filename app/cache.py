@@ -0,0 +1,56 @@
+# app/cache.py
+# テーブルの版番号 (versioning.py) と組み合わせて使う、プロセス内の小さな LRU キャッシュ。
+# 値は保存したときの版番号と一緒に持ち、取り出すときに版番号が変わっていれば捨てる。
+# 古い版の値は LRU で自然に追い出されるので、明示的な無効化は不要。
+import collections
+import threading
+
+from . import config
+
+
+class VersionedLRUCache:
+    """ 件数に上限のある、スレッドセーフな版番号付きキャッシュ """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """ key に対応する値を返す。ないか、保存時と版番号が違えば None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 一覧画面の1ページ分の結果 (検索条件・ソート・ページ -> 行と件数)
+item_list_cache = VersionedLRUCache(config.ITEM_LIST_CACHE_MAX_ENTRIES)
+# サイドバーに表示する製品の一覧
+sidebar_cache = VersionedLRUCache(1)
+# 管理画面の在庫分析の結果
+analytics_cache = VersionedLRUCache(1)
@@ -0,0 +1,137 @@
+# app/changefeed.py
+# 「ある時点より後に変わった行」を返す変更フィード (migrations/003_change_feed.sql の updated_at と tombstone を使う)。
+# API (/api/v1/changes/...) と sync_changes.py の両方から使うので、Flask には依存させずカーソルだけを受け取る。
+#
+# ウォーターマークは (更新日時, キー) と (削除日時, tombstone_id) の組で、前回の応答の next をそのまま渡す。
+# まだコミットされていないトランザクションが古い更新日時の行を後から見せることがあるので、
+#   - 書き込み中のトランザクションのうち最も古い開始時刻 (pg_stat_activity で見える範囲)
+#   - 現在時刻から CHANGE_FEED_SAFETY_LAG_SECONDS 秒前
+# のうち早い方より前の変更だけを返し、取りこぼしが起きないようにしている。
+import base64
+import binascii
+import datetime
+import json
+
+from . import config
+
+ENTITIES = {
+    'items': {
+        'table': 'items',
+        'key': 'id',
+        'columns': ('id', 'name', 'card_id', 'rare', 'stock', 'category', 'updated_at'),
+        'tombstones': 'item_tombstones',
+        'tombstone_columns': ('id', 'card_id', 'rare', 'deleted_at'),
+        'initial_key': 0,
+    },
+    'products': {
+        'table': 'products',
+        'key': 'name',
+        'columns': ('name', 'display_name', 'release_date', 'era', 'show_in_sidebar', 'updated_at'),
+        'tombstones': 'product_tombstones',
+        'tombstone_columns': ('name', 'deleted_at'),
+        'initial_key': '',
+    },
+}
+
+
+class WatermarkError(ValueError):
+    """ ウォーターマークが不正な場合のエラー """
+
+
+def encode_watermark(changed_at, changed_key, deleted_at, deleted_id):
+    payload = json.dumps([
+        changed_at.isoformat() if changed_at else None, changed_key,
+        deleted_at.isoformat() if deleted_at else None, deleted_id,
+    ], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_watermark(watermark, entity):
+    """ ウォーターマークを (更新日時, キー, 削除日時, tombstone_id) に戻す。None なら最初から """
+    spec = ENTITIES[entity]
+    if not watermark:
+        return None, spec['initial_key'], None, 0
+    try:
+        padded = watermark + '=' * (-len(watermark) % 4)
+        changed_at, changed_key, deleted_at, deleted_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        changed_at = datetime.datetime.fromisoformat(changed_at) if changed_at else None
+        deleted_at = datetime.datetime.fromisoformat(deleted_at) if deleted_at else None
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise WatermarkError("ウォーターマークが不正です。")
+    if type(changed_key) is not type(spec['initial_key']) or not isinstance(deleted_id, int):
+        raise WatermarkError("ウォーターマークが不正です。")
+    return changed_at, changed_key, deleted_at, deleted_id
+
+
+def safe_upper_bound(cur):
+    """ この時刻より前の変更は、もう後から現れることがない (フィードで返してよい) 上限 """
+    cur.execute("""
+        SELECT LEAST(
+            clock_timestamp() - make_interval(secs => %s),
+            (SELECT min(xact_start) FROM pg_stat_activity
+             WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid())
+        )
+    """, (config.CHANGE_FEED_SAFETY_LAG_SECONDS,))
+    return cur.fetchone()[0]
+
+def _rows_as_dicts(cur):
+    names = [column[0] for column in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+def fetch_changes(cur, entity, watermark=None, limit=None):
+    """
+    ウォーターマークより後の変更を最大 limit 件 (更新・削除それぞれ) 返す。
+    戻り値: {'upserts': [...], 'deletes': [...], 'next': 次のウォーターマーク, 'has_more': まだ続きがあるか}
+    """
+    spec = ENTITIES[entity]
+    limit = limit or config.CHANGE_FEED_BATCH_SIZE
+    changed_at, changed_key, deleted_at, deleted_id = decode_watermark(watermark, entity)
+    upper_bound = safe_upper_bound(cur)
+
+    cur.execute(f"""
+        SELECT {', '.join(spec['columns'])} FROM {spec['table']}
+        WHERE (updated_at, {spec['key']}) > (COALESCE(%s, '-infinity'::timestamptz), %s)
+          AND updated_at < %s
+        ORDER BY updated_at, {spec['key']}
+        LIMIT %s
+    """, (changed_at, changed_key, upper_bound, limit + 1))
+    upserts = _rows_as_dicts(cur)
+
+    # 削除後に同じキーで作り直された行は、更新として返るので削除としては返さない
+    cur.execute(f"""
+        SELECT t.tombstone_id, {', '.join('t.' + c for c in spec['tombstone_columns'])}
+        FROM {spec['tombstones']} t
+        WHERE (t.deleted_at, t.tombstone_id) > (COALESCE(%s, '-infinity'::timestamptz), %s)
+          AND t.deleted_at < %s
+          AND NOT EXISTS (SELECT 1 FROM {spec['table']} x WHERE x.{spec['key']} = t.{spec['key']})
+        ORDER BY t.deleted_at, t.tombstone_id
+        LIMIT %s
+    """, (deleted_at, deleted_id, upper_bound, limit + 1))
+    deletes = _rows_as_dicts(cur)
+
+    has_more = len(upserts) > limit or len(deletes) > limit
+    upserts = upserts[:limit]
+    deletes = deletes[:limit]
+    if upserts:
+        changed_at, changed_key = upserts[-1]['updated_at'], upserts[-1][spec['key']]
+    if deletes:
+        deleted_at, deleted_id = deletes[-1]['deleted_at'], deletes[-1]['tombstone_id']
+    for row in deletes:
+        del row['tombstone_id']
+
+    return {
+        'upserts': upserts,
+        'deletes': deletes,
+        'next': encode_watermark(changed_at, changed_key, deleted_at, deleted_id),
+        'has_more': has_more,
+    }
+
+def prune_tombstones(cur, older_than_days):
+    """ 指定した日数より前の tombstone を削除し、削除した件数を返す """
+    total = 0
+    for spec in ENTITIES.values():
+        cur.execute(
+            f"DELETE FROM {spec['tombstones']} WHERE deleted_at < now() - make_interval(days => %s)",
+            (older_than_days,)
+        )
+        total += cur.rowcount
+    return total
@@ -0,0 +1,104 @@
+# app/columnar.py
+# 分析用に、items と対応する products を列指向の形式 (Parquet / Arrow IPC) で書き出す処理。
+# CSV と違い、在庫数は整数、発売日は日付のまま型付きで保存され、レアリティとカテゴリは辞書エンコードされる。
+# 行はサーバー側カーソルで batch_size 件ずつ読み、各列を型付きの配列にしてから1つのテーブルにまとめる。
+# pyarrow は任意の依存関係なので、使うときに読み込む (入っていなければ ColumnarExportUnavailable)。
+import datetime
+
+import psycopg2.extensions
+
+from . import config
+
+# 書き出せる形式: {形式名: (拡張子, MIME タイプ)}
+FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+# items の1行に、カテゴリと対応する製品の情報を付けたもの (一覧画面と同じ LOWER(TRIM(...)) での対応付け)
+SNAPSHOT_QUERY = """
+    SELECT i.id, i.name, i.card_id, i.rare, i.stock, i.category,
+           p.display_name AS product_display_name, p.release_date, p.era
+    FROM items i
+    LEFT JOIN products p ON LOWER(TRIM(i.category)) = LOWER(TRIM(p.name))
+    ORDER BY i.id
+"""
+
+
+class ColumnarExportUnavailable(Exception):
+    """ pyarrow が入っていないため、列指向の形式で書き出せない """
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ColumnarExportUnavailable("pyarrow がインストールされていません (pip install pyarrow)。") from e
+    return pyarrow
+
+def snapshot_schema(pa):
+    """ 書き出すテーブルの列と型。値の種類が少ない列は辞書エンコードする """
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('id', pa.int32()),
+        ('name', pa.string()),
+        ('card_id', pa.string()),
+        ('rare', dictionary),
+        ('stock', pa.int32()),
+        ('category', dictionary),
+        ('product_display_name', dictionary),
+        ('release_date', pa.date32()),
+        ('era', pa.int16()),
+    ])
+
+
+def _record_batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=field.type.value_type).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def read_snapshot_table(conn, batch_size=None):
+    """
+    SNAPSHOT_QUERY の結果を pyarrow.Table にして返す。
+    サーバー側カーソルで batch_size 件ずつ読むので、行を全部 Python のオブジェクトとして持つことはない。
+    バッチごとにできた辞書は、最後に1つにまとめる (Arrow IPC のファイル形式では列ごとに1つの辞書しか持てないため)。
+    """
+    pa = _pyarrow()
+    schema = snapshot_schema(pa)
+    batch_size = batch_size or config.COLUMNAR_EXPORT_BATCH_SIZE
+    batches = []
+    # 名前付きカーソル = サーバー側カーソル。タプルで受け取れば十分なので、接続の DictCursor は使わない
+    with conn.cursor(name='columnar_snapshot', cursor_factory=psycopg2.extensions.cursor) as cur:
+        cur.itersize = batch_size
+        cur.execute(SNAPSHOT_QUERY)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            batches.append(_record_batch(pa, schema, rows))
+    if not batches:
+        return schema.empty_table()
+    return pa.Table.from_batches(batches, schema=schema).unify_dictionaries().combine_chunks()
+
+def write_snapshot(table, sink, fmt):
+    """ table を sink (ファイルのパスか、書き込み可能なファイルオブジェクト) に fmt の形式で書く """
+    pa = _pyarrow()
+    if fmt == 'parquet':
+        pa.parquet.write_table(table, sink, compression='zstd', use_dictionary=True)
+    elif fmt == 'arrow':
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+
+def snapshot_filename(fmt, now=None):
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return f"yugioh_inventory_snapshot_{now.strftime('%Y%m%d_%H%M%S')}.{FORMATS[fmt][0]}"
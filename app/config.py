@@ -8,6 +8,156 @@
 DEFAULT_PER_PAGE = 20
 DEFAULT_SORT_KEY = 'release_date'
 DEFAULT_SORT_ORDER = 'desc'
+# 製品マスタ管理の一覧で1ページに表示する製品数
+PRODUCT_LIST_PAGE_SIZE = 50
+
+# --- データベース接続プール設定 ---
+# プロセスごとに保持しておく接続数 (この数まではアイドル状態でも切断せず再利用する)
+DB_POOL_MIN_CONN = 2
+# プロセスごとの最大接続数 (超えた分はプール外の接続で処理する)
+DB_POOL_MAX_CONN = 10
+# この秒数以上使われていなかった接続は、貸し出す前に SELECT 1 で生存確認する
+DB_POOL_PING_AFTER_SECONDS = 30
+# よく使う SQL を接続ごとに PREPARE して再利用するか
+# (PgBouncer のトランザクションモード経由で接続する場合は False にする)
+DB_USE_PREPARED_STATEMENTS = True
+
+# --- 読み取りレプリカ設定 (環境変数 DATABASE_REPLICA_URL を設定したときだけ使う) ---
+# レプリカの遅延がこの秒数を超えている間は、読み取りもプライマリで行う
+REPLICA_MAX_LAG_SECONDS = 5
+# レプリカの遅延を測り直す間隔 (秒)
+REPLICA_LAG_CHECK_INTERVAL_SECONDS = 2
+# 更新系のリクエストの後、この秒数はそのセッションの読み取りもプライマリで行う (自分の変更がすぐ見えるように)
+REPLICA_READ_YOUR_WRITES_SECONDS = 10
+
+# --- ウォームアップ設定 ---
+# ワーカーの起動時に前もってコンパイルしておくテンプレート (アクセスの多い画面)
+WARMUP_TEMPLATES = [
+    'layout.html',
+    'main/index.html',
+    'main/add_item.html',
+    'main/edit_item.html',
+    'auth/login.html',
+    'admin/manage_products.html',
+]
+# ウォームアップが失敗したワーカーで、/readyz へのアクセス時にやり直すまでの間隔 (秒)
+WARMUP_RETRY_INTERVAL_SECONDS = 5
+
+# --- 計測・スローログ設定 ---
+# この時間 (ミリ秒) 以上かかった SQL をスローログに出力する
+SLOW_QUERY_THRESHOLD_MS = 200
+# スローログに出力する割合 (0.0〜1.0)。1.0 なら閾値を超えた全ての SQL を出力する
+SLOW_QUERY_SAMPLE_RATE = 1.0
+# この時間 (ミリ秒) 以上かかったリクエストを、遅い SQL の内訳付きでログに出力する
+SLOW_REQUEST_THRESHOLD_MS = 1000
+# レスポンスに Server-Timing ヘッダーを付けるか
+SERVER_TIMING_ENABLED = True
+# 1リクエストあたりに記録する SQL の最大件数
+REQUEST_QUERY_LOG_MAX_ENTRIES = 200
+# 文ごとの集計で保持する文の種類の上限 (超えた分は「その他」にまとめる)
+QUERY_STATS_MAX_STATEMENTS = 500
+# 集計・ログに残す SQL の最大文字数
+QUERY_STATS_STATEMENT_MAX_LENGTH = 500
+
+# --- キャッシュ設定 ---
+# テーブルの版番号を使った ETag / Last-Modified と、サーバー側の結果キャッシュを使うか
+RESPONSE_CACHE_ENABLED = True
+# 一覧画面の結果をキャッシュしておくページ数 (プロセスごと)
+ITEM_LIST_CACHE_MAX_ENTRIES = 256
+# 検索条件ごとの件数をキャッシュしておく数 (プロセスごと)
+COUNT_CACHE_MAX_ENTRIES = 512
+
+# --- 件数表示設定 ---
+# プランナーの見積もりがこの件数未満なら COUNT(*) で正確に数え、以上なら見積もりを「約 N 件」と表示する
+COUNT_EXACT_THRESHOLD = 20000
+
+# --- API設定 ---
+# /api/v1/items で1回に返す件数の既定値と上限
+API_DEFAULT_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+# gzip の圧縮レベル (1〜9)
+API_GZIP_LEVEL = 6
+# /api/products/suggest で返す候補数の既定値と上限
+PRODUCT_SUGGEST_DEFAULT_LIMIT = 10
+PRODUCT_SUGGEST_MAX_LIMIT = 50
+# 版番号が読めない場合に、製品名の候補インデックスを作り直す間隔 (秒)
+PRODUCT_INDEX_FALLBACK_TTL_SECONDS = 60
+
+# --- 検索インデックス設定 ---
+# 一覧のカード名・カードIDの部分一致検索を、プロセス内の n-gram インデックス (search_index.py) で解決するか
+# (ワーカーごとにカード数に比例したメモリを使う。2万件で 10 MB 程度)
+ITEM_SEARCH_INDEX_ENABLED = False
+# インデックスに登録する部分文字列の最大の長さ。これより長い検索語は、最も行の少ない n-gram の候補を確かめる
+ITEM_SEARCH_INDEX_GRAM_SIZE = 3
+# 一致した id がこの件数を超える検索は、id の配列を渡すより LIKE の方が速いので SQL で探す
+ITEM_SEARCH_INDEX_MAX_IDS = 5000
+# 更新・削除で無効になった位置がこの数以上、かつ有効な行より多くなったらインデックスを作り直す
+ITEM_SEARCH_INDEX_COMPACT_MIN_DEAD = 1000
+
+# --- 変更フィード設定 ---
+# 1回に返す更新・削除の件数 (それぞれ) の既定値と上限
+CHANGE_FEED_BATCH_SIZE = 500
+CHANGE_FEED_MAX_BATCH_SIZE = 5000
+# この秒数より新しい変更は、まだコミット前のトランザクションと前後する可能性があるので次回に回す
+CHANGE_FEED_SAFETY_LAG_SECONDS = 5
+
+# --- カテゴリ診断設定 ---
+# 製品マスタにないカテゴリごとに表示する、似た製品名の候補数
+CATEGORY_SUGGESTION_LIMIT = 3
+# 候補に出す類似度 (トライグラム、0.0〜1.0) の下限
+CATEGORY_SUGGESTION_MIN_SIMILARITY = 0.3
+
+# --- 在庫分析設定 ---
+# 在庫分析の画面で、全体・期ごとに表示する在庫枚数の多い製品の数
+ANALYTICS_TOP_PRODUCTS = 10
+
+# --- 列指向エクスポート設定 ---
+# Parquet / Arrow で書き出すときに、サーバー側カーソルから1回に読む行数
+COLUMNAR_EXPORT_BATCH_SIZE = 10000
+
+# --- 重複チェック設定 ---
+# 重複チェックの画面に表示するクラスタ (同じカードとみなした行の集まり) の最大数
+DUPLICATE_REPORT_MAX_CLUSTERS = 200
+
+# --- 削除処理設定 ---
+# 一括削除・在庫0パージで1トランザクションあたりに削除する最大件数
+DELETE_BATCH_SIZE = 1000
+# 在庫0パージでバッチ間に入れる待機秒数 (稼働中のアプリへの影響を抑える)
+PURGE_BATCH_PAUSE_SECONDS = 0.5
+
+# --- 製品名変更設定 ---
+# 製品名を変更したときに、カードのカテゴリを1回の UPDATE で書き換える最大件数
+PRODUCT_RENAME_BATCH_SIZE = 5000
+
+# --- CSVインポート設定 ---
+# ヘッダー行の並びごとに組み立てた列の対応を、いくつまでキャッシュしておくか
+CSV_HEADER_CACHE_SIZE = 64
+# アップロードを受け付ける最大サイズ (MB)。環境変数 MAX_CONTENT_LENGTH_MB で上書きできる
+UPLOAD_MAX_CONTENT_LENGTH_MB = 512
+# 一時ファイルに移す前にメモリ上に置いておく最大バイト数
+CSV_UPLOAD_SPOOL_MEMORY_BYTES = 1024 * 1024
+# インポートの進捗をログに出す間隔 (行数)
+CSV_IMPORT_PROGRESS_INTERVAL_ROWS = 5000
+# 行の検証・変換を並列に行うワーカープロセス数 (0 なら CPU 数と CSV_IMPORT_MAX_DEFAULT_WORKERS の小さい方、1 ならプロセスプールを使わない)
+CSV_IMPORT_WORKERS = 0
+# CSV_IMPORT_WORKERS = 0 の場合のワーカー数の上限 (Web ワーカーごとにプールを起動するので、CPU 数までは増やさない)
+CSV_IMPORT_MAX_DEFAULT_WORKERS = 4
+# ワーカーに一度に渡す行数
+CSV_IMPORT_CHUNK_ROWS = 5000
+# アップロードの合計サイズがこれより小さい場合は、プロセスプールを使わずにその場で変換する
+CSV_IMPORT_PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+
+# --- インポートレポート設定 ---
+# CSVインポートの行ごとのエラー・警告を、この件数ずつまとめて import_run_issues に書き込む
+IMPORT_REPORT_ISSUE_BATCH_SIZE = 500
+# インポートレポートの画面に1ページで表示するエラー・警告の件数
+IMPORT_REPORT_PAGE_SIZE = 100
+# インポートレポートの一覧に表示する実行の数
+IMPORT_REPORT_RECENT_RUNS = 50
+# この日数より前のインポートの記録は、次のインポートの開始時に削除する
+IMPORT_REPORT_RETENTION_DAYS = 90
+# レポートを保存できない場合に、フラッシュメッセージに含めるエラーの最大件数
+IMPORT_FLASH_MAX_ISSUES = 5
 
 
 # =================================================================
@@ -0,0 +1,72 @@
+# app/counting.py
+# 一覧画面のページ数を出すための件数の求め方。
+# 件数を毎回 COUNT(*) で数えると、結果が多いときはページ本体より件数の方が重くなるので、
+#   1. 同じ検索条件で数えた件数が、テーブルの版番号が変わらないうちはキャッシュから返す
+#   2. プランナーの見積もり (EXPLAIN の行数) が COUNT_EXACT_THRESHOLD 未満なら、正確に数える
+#   3. それ以上なら見積もりをそのまま使い、画面には「約 N 件」と表示する
+# 見積もりは実際の件数と大きくずれることがあるので、呼び出し側は取得したページが途中で終わっていれば
+# exact_from_page() で正確な件数に置き換える。
+from . import config, queries
+from .cache import VersionedLRUCache
+
+# 検索条件 -> 件数
+count_cache = VersionedLRUCache(config.COUNT_CACHE_MAX_ENTRIES)
+
+
+class RowCount:
+    """ 件数と、それが正確に数えた値か (False なら見積もり) """
+    __slots__ = ('count', 'exact')
+
+    def __init__(self, count, exact):
+        self.count = count
+        self.exact = exact
+
+    def __repr__(self):
+        return f"RowCount({self.count}, exact={self.exact})"
+
+
+def _round_estimate(count):
+    """ 見積もりは細かい桁に意味がないので、上から2桁に丸める """
+    if count < 100:
+        return count
+    step = 10 ** (len(str(count)) - 2)
+    return round(count / step) * step
+
+def count_rows(cur, count_query, estimate_query, params, version=None, force_exact=False):
+    """
+    登録済みの文で件数を求める。
+    count_query は COUNT(*) を1行返す文、estimate_query は同じ条件で行そのものを返す文 (見積もりにだけ使う)。
+    version にテーブルの版番号を渡すと、同じ版のうちは結果をキャッシュする。
+    force_exact が真なら、見積もりを使わずに必ず数える。
+    """
+    # id の配列 (検索インデックスで解決した場合) はそのままではキーにできないのでタプルにする
+    cache_key = (count_query, tuple(tuple(p) if isinstance(p, list) else p for p in params))
+    if version is not None:
+        cached = count_cache.get(cache_key, version)
+        if cached is not None and (cached.exact or not force_exact):
+            return cached
+
+    estimate = None if force_exact else queries.estimate_rows(cur, estimate_query, params)
+    if estimate is None or estimate < config.COUNT_EXACT_THRESHOLD:
+        queries.execute(cur, count_query, params)
+        result = RowCount(cur.fetchone()[0], True)
+    else:
+        result = RowCount(_round_estimate(estimate), False)
+
+    if version is not None:
+        count_cache.set(cache_key, version, result)
+    return result
+
+def exact_from_page(row_count, offset, page_rows, per_page):
+    """
+    取得したページが per_page 件に満たなければ、そこで結果が終わっているので件数が確定する。
+    見積もりの件数がずれていた場合に使う。確定できなければ row_count をそのまま返す。
+    """
+    if row_count.exact or per_page <= 0:
+        return row_count
+    if 0 < page_rows < per_page or (page_rows == 0 and offset == 0):
+        return RowCount(offset + page_rows, True)
+    if page_rows == per_page and offset + page_rows >= row_count.count:
+        # 見積もりより先まで行があった。少なくとも次のページがあることだけ分かるようにしておく
+        return RowCount(offset + page_rows + 1, False)
+    return row_count
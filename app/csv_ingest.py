@@ -0,0 +1,202 @@
+# app/csv_ingest.py
+# CSVインポートで共通に使う、ヘッダーの対応付けと行の読み取り処理。
+# - ヘッダー行の並び (シグネチャ) ごとに、項目名 -> 列番号の対応を一度だけ組み立ててキャッシュする
+# - 各行は辞書を作らず、列番号でそのまま値を取り出してタプルにする
+# - 必須項目の空チェックと整数項目の変換を、行ループの中でまとめて行う
+# - アップロードされたファイルは全体をメモリに読み込まず、先頭から1回だけ順に読んで処理する
+import functools
+import io
+import os
+import shutil
+import tempfile
+
+from . import config
+
+# iter_rows が返す問題の種類
+MISSING_REQUIRED = 'missing_required'
+INVALID_INTEGER = 'invalid_integer'
+
+
+class CsvHeaderError(ValueError):
+    """ 必須の列がヘッダーに見つからない場合のエラー """
+
+    def __init__(self, spec, missing, header):
+        self.missing = missing
+        self.header = header
+        missing_display = [f"'{key}' (例: {', '.join(spec.aliases[key])})" for key in missing]
+        super().__init__(f"ヘッダー不正。必須列 ({', '.join(missing_display)}) が見つかりません。検出されたヘッダー: {list(header)}")
+
+
+class HeaderSpec:
+    """
+    インポートする CSV の項目定義。
+    fields は (項目名, 受け付けるヘッダー名のリスト) の並びで、iter_rows が返すタプルもこの順になる。
+    """
+
+    def __init__(self, fields, required=(), integer_fields=None):
+        self.keys = tuple(key for key, _ in fields)
+        self.aliases = {key: tuple(names) for key, names in fields}
+        self.required = tuple(required)
+        # 整数に変換する項目と、空・不正な値のときの既定値
+        self.integer_fields = dict(integer_fields or {})
+
+    def index_of(self, key):
+        """ iter_rows が返すタプルの中での、項目の位置 """
+        return self.keys.index(key)
+
+
+class CompiledHeader:
+    """ あるヘッダー行に対して組み立てた、項目ごとの列番号 (見つからない項目は -1) """
+    __slots__ = ('spec', 'header', 'columns', 'width', 'required_positions', 'integer_positions')
+
+    def __init__(self, spec, header):
+        self.spec = spec
+        self.header = header
+        lowered = [h.strip().lower() for h in header]
+        columns = []
+        for key in spec.keys:
+            column = -1
+            for name in spec.aliases[key]:
+                if name.lower() in lowered:
+                    column = lowered.index(name.lower())
+                    break
+            columns.append(column)
+        self.columns = tuple(columns)
+        self.width = max(columns) + 1 if columns else 0
+        self.required_positions = tuple(spec.keys.index(key) for key in spec.required)
+        self.integer_positions = tuple((spec.keys.index(key), key, default) for key, default in spec.integer_fields.items())
+
+    def has(self, key):
+        return self.columns[self.spec.index_of(key)] >= 0
+
+    def decode(self, row):
+        """ 1行分のリストを、項目の順に前後の空白を除いた文字列のタプルにする (列がない項目は '') """
+        if len(row) >= self.width:
+            return tuple([row[column].strip() if column >= 0 else '' for column in self.columns])
+        row_length = len(row)
+        return tuple([row[column].strip() if 0 <= column < row_length else '' for column in self.columns])
+
+
+@functools.lru_cache(maxsize=config.CSV_HEADER_CACHE_SIZE)
+def compile_header(spec, header):
+    """
+    ヘッダー行 (タプル) に対する列の対応を返す。同じ並びのヘッダーには組み立て済みのものを再利用する。
+    必須の列が見つからなければ CsvHeaderError を送出する。
+    """
+    compiled = CompiledHeader(spec, header)
+    missing = [key for key in spec.required if not compiled.has(key)]
+    if missing:
+        raise CsvHeaderError(spec, missing, header)
+    return compiled
+
+
+def read_header(reader, spec):
+    """
+    csv.reader からヘッダー行を読み、対応付けを返す。ヘッダー行がない (空のファイル) 場合は None。
+    """
+    header = next(reader, None)
+    if header is None:
+        return None
+    return compile_header(spec, tuple(header))
+
+
+def iter_rows(reader, compiled, first_row_number=1):
+    """
+    read_header の後の csv.reader から行を読み、(データ行番号, 値のタプル, 問題) を順に返すジェネレーター。
+    データ行番号はヘッダーの次の行を 1 とする (空行は数えない)。
+    ファイルを分割して処理する場合は、最初の行の番号を first_row_number で渡す。
+    問題は None か (種類, 項目名, 元の値):
+      - MISSING_REQUIRED: 必須項目が空 (呼び出し側でスキップする想定)
+      - INVALID_INTEGER: 整数項目が不正で、既定値に置き換えた
+    """
+    decode = compiled.decode
+    keys = compiled.spec.keys
+    required_positions = compiled.required_positions
+    integer_positions = compiled.integer_positions
+
+    row_number = first_row_number - 1
+    for row in reader:
+        if not row:
+            continue
+        row_number += 1
+        values = decode(row)
+        problem = None
+        if integer_positions:
+            values = list(values)
+            for position, key, default in integer_positions:
+                raw = values[position]
+                if not raw:
+                    values[position] = default
+                    continue
+                try:
+                    values[position] = int(raw)
+                except ValueError:
+                    values[position] = default
+                    problem = (INVALID_INTEGER, key, raw)
+            values = tuple(values)
+        for position in required_positions:
+            if not values[position]:
+                problem = (MISSING_REQUIRED, keys[position], values[position])
+                break
+        yield row_number, values, problem
+
+
+class UploadTextStream:
+    """
+    アップロードされたファイル (バイト列のストリーム) を、UTF-8 (BOM 付き可) のテキストとして順に読むためのラッパー。
+    Werkzeug は大きなアップロードを一時ファイルに書き出しているので、それをそのまま少しずつデコードして読む。
+    進捗は、行数を事前に数える代わりに読み取り済みのバイト位置から求める。
+    """
+
+    def __init__(self, binary_stream):
+        if not (hasattr(binary_stream, 'readable') and hasattr(binary_stream, 'seekable') and binary_stream.seekable()):
+            # TextIOWrapper で包めないストリームは、一時ファイルに移してから読む
+            spooled = tempfile.SpooledTemporaryFile(max_size=config.CSV_UPLOAD_SPOOL_MEMORY_BYTES)
+            shutil.copyfileobj(binary_stream, spooled)
+            binary_stream = spooled
+        self.binary = binary_stream
+        self.binary.seek(0, os.SEEK_END)
+        self.total_bytes = self.binary.tell()
+        self.binary.seek(0)
+        # csv モジュールの推奨どおり newline='' で開き、引用符内の改行をそのまま渡す
+        self.text = io.TextIOWrapper(self.binary, encoding='utf-8-sig', newline='')
+
+    def bytes_read(self):
+        """ これまでに読み取ったバイト数 (デコード用の先読みの分だけ実際より進むことがある) """
+        return min(self.binary.tell(), self.total_bytes)
+
+    def progress_percent(self):
+        if not self.total_bytes:
+            return 100.0
+        return self.bytes_read() / self.total_bytes * 100
+
+    def close(self):
+        """ テキストのラッパーだけを外す (元のストリームは呼び出し元が閉じる) """
+        if self.text is not None:
+            self.text.detach()
+            self.text = None
+
+
+# --- カード (items) のインポート ---
+ITEM_CSV_SPEC = HeaderSpec(
+    fields=[
+        ('name', ['name', '名前', '名称']),
+        ('card_id', ['card_id', 'カードid', 'カードID', '型番']),
+        ('rare', ['rare', 'レアリティ', 'レア度']),
+        ('stock', ['stock', '在庫', '在庫数']),
+        ('category', ['category', 'カテゴリ', '分類']),
+    ],
+    required=['name', 'rare'],
+    integer_fields={'stock': 0},
+)
+
+# --- 製品マスタ (products) の更新 ---
+PRODUCT_CSV_SPEC = HeaderSpec(
+    fields=[
+        ('name', ['name', '製品名']),
+        ('release_date', ['release_date', '発売日']),
+        ('display_name', ['display_name', '表示名']),
+        ('show_in_sidebar', ['show_in_sidebar', 'サイドバー表示']),
+    ],
+    required=['name', 'release_date'],
+)
@@ -1,51 +1,276 @@
 # app/db.py
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 import os
 import sys
+import threading
+import time
 
-def get_db_connection():
+from . import config
+from .instrumentation import InstrumentedDictCursor
+
+# items テーブルから削除・退避するときに扱う列 (items_archive と同じ並び)
+ITEM_ARCHIVE_COLUMNS = ('id', 'name', 'card_id', 'rare', 'stock', 'category', 'name_normalized', 'card_id_normalized')
+
+class PooledConnection(psycopg2.extensions.connection):
     """
-    Establishes a connection to the PostgreSQL database.
-    Uses the DATABASE_URL environment variable.
-    The cursor factory is set to DictCursor to return rows as dictionaries.
+    接続プールから貸し出される接続。
+    close() を呼ぶと切断せずにプールへ返却するので、既存の conn.close() の呼び出しはそのまま使える。
+    この接続で PREPARE 済みの文の名前を prepared_statements に保持する。
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.pool = None
+        self.last_used_at = time.monotonic()
+
+    def close(self):
+        pool, self.pool = self.pool, None
+        if pool is None or self.closed:
+            super().close()
+            return
+        self.last_used_at = time.monotonic()
+        try:
+            pool.putconn(self)
+        except psycopg2.pool.PoolError:
+            # fork 後に作り直されたプールなど、返却先が見つからない場合は単に切断する
+            super().close()
+
+# 接続先ごと ('primary' / 'replica') のプール: {接続先: (プール, 作成したプロセスの pid)}
+_pools = {}
+_pool_lock = threading.Lock()
+# 読み取り専用のリクエストをレプリカに振り分けるかを決める関数 (replica.init_app が設定する)
+_read_router = None
+
+def _get_database_url():
     db_url = os.environ.get("DATABASE_URL")
     if not db_url:
         print("FATAL: DATABASE_URL environment variable not set.", file=sys.stderr)
         raise ValueError("DATABASE_URL environment variable is not set. Application cannot connect to the database.")
+    return db_url
+
+def get_replica_url():
+    """ 読み取り専用のレプリカの接続先。設定されていなければ None (すべてプライマリで処理する) """
+    return os.environ.get("DATABASE_REPLICA_URL") or None
+
+def _report_connection_error(db_url, e):
+    db_url_display = db_url[:db_url.find('@')] + "@..." if '@' in db_url else "URL (details hidden)"
+    print(f"FATAL: Database connection failed. DB_URL might be incorrect or database not accessible.", file=sys.stderr)
+    print(f"Used DB_URL: {db_url_display}", file=sys.stderr)
+    print(f"Error details: {e}", file=sys.stderr)
+
+def _connect(db_url):
+    return psycopg2.connect(db_url, connection_factory=PooledConnection, cursor_factory=InstrumentedDictCursor)
+
+def _get_url(target):
+    return get_replica_url() if target == 'replica' else _get_database_url()
 
+def get_pool(target='primary'):
+    """
+    プロセスごとの接続プールを返す（初回呼び出し時に作成）。
+    gunicorn などで fork された子プロセスでは親のプールを使わず、新しく作り直す。
+    target に 'replica' を指定すると、DATABASE_REPLICA_URL への接続プールを返す。
+    """
+    pid = os.getpid()
+    entry = _pools.get(target)
+    if entry is not None and entry[1] == pid:
+        return entry[0]
+    with _pool_lock:
+        entry = _pools.get(target)
+        if entry is None or entry[1] != pid:
+            db_url = _get_url(target)
+            pool = psycopg2.pool.ThreadedConnectionPool(
+                config.DB_POOL_MIN_CONN, config.DB_POOL_MAX_CONN, db_url,
+                connection_factory=PooledConnection, cursor_factory=InstrumentedDictCursor
+            )
+            entry = _pools[target] = (pool, pid)
+    return entry[0]
+
+def _is_alive(conn):
+    """ しばらく使われていなかった接続が、サーバー側で切断されていないか確認する """
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used_at < config.DB_POOL_PING_AFTER_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _borrow(target):
+    db_url = _get_url(target)
+    pool = get_pool(target)
+    for _ in range(config.DB_POOL_MAX_CONN + 1):
+        try:
+            conn = pool.getconn()
+        except psycopg2.pool.PoolError:
+            # プールが使い切られている場合は、プール外の接続で処理を続ける
+            return _connect(db_url)
+        if _is_alive(conn):
+            conn.pool = pool
+            return conn
+        pool.putconn(conn, close=True)
+    return _connect(db_url)
+
+def get_replica_connection():
+    """
+    レプリカへの接続を返す。レプリカが設定されていないか、接続できない場合は None。
+    """
+    if not get_replica_url():
+        return None
     try:
-        conn = psycopg2.connect(db_url, cursor_factory=psycopg2.extras.DictCursor)
-        return conn
+        return _borrow('replica')
     except psycopg2.Error as e:
-        db_url_display = db_url[:db_url.find('@')] + "@..." if '@' in db_url else "URL (details hidden)"
-        print(f"FATAL: Database connection failed. DB_URL might be incorrect or database not accessible.", file=sys.stderr)
-        print(f"Used DB_URL: {db_url_display}", file=sys.stderr)
-        print(f"Error details: {e}", file=sys.stderr)
+        print(f"WARNING: Replica connection failed, falling back to the primary: {e}", file=sys.stderr)
+        return None
+
+def set_read_router(router):
+    """ router() が True を返すあいだ、get_db_connection はレプリカの接続を返す (None で解除) """
+    global _read_router
+    _read_router = router
+
+def get_db_connection():
+    """
+    Establishes a connection to the PostgreSQL database.
+    Uses the DATABASE_URL environment variable.
+    The cursor factory is set to DictCursor (with query timing) to return rows as dictionaries.
+    Connections are borrowed from a per-process pool; conn.close() returns them to the pool.
+    Read-only requests are sent to DATABASE_REPLICA_URL when the read router allows it (see replica.py).
+    """
+    if _read_router is not None and _read_router():
+        conn = get_replica_connection()
+        if conn is not None:
+            return conn
+    return get_primary_connection()
+
+def get_primary_connection():
+    """
+    読み取り専用のリクエストの中でも、常にプライマリへの接続を返す。
+    レプリカでは正しく求められない処理 (変更フィードの上限など) に使う。
+    """
+    db_url = _get_database_url()
+    try:
+        return _borrow('primary')
+    except psycopg2.Error as e:
+        _report_connection_error(db_url, e)
         raise
 
+def delete_items_batch(cur, condition_sql, params, archive_reason=None):
+    """
+    条件に一致する items の行を1バッチ分削除し、削除した行を (列順は ITEM_ARCHIVE_COLUMNS) のタプルで返す。
+    archive_reason を指定すると、同じ文の中で items_archive に退避してから削除する。
+    condition_sql には LIMIT 付きのサブクエリなど、1バッチに収まる条件を渡すこと。
+    """
+    columns = ', '.join(ITEM_ARCHIVE_COLUMNS)
+    if archive_reason is not None:
+        sql = f"""
+            WITH moved AS (
+                DELETE FROM items WHERE {condition_sql} RETURNING {columns}
+            ), archived AS (
+                INSERT INTO items_archive ({columns}, archive_reason)
+                SELECT {columns}, %s FROM moved
+            )
+            SELECT {columns} FROM moved ORDER BY id
+        """
+        cur.execute(sql, tuple(params) + (archive_reason,))
+    else:
+        cur.execute(f"DELETE FROM items WHERE {condition_sql} RETURNING {columns}", tuple(params))
+    return [tuple(row) for row in cur.fetchall()]
+
+def delete_items_in_batches(conn, item_ids, batch_size=None, pause_seconds=0, archive_reason=None, on_batch=None,
+                            commit_each_batch=True):
+    """
+    指定された item_id のリストを batch_size 件ずつ削除し、バッチごとにコミットする。
+    1回のトランザクションで保持するロックと WAL を小さく抑えるため、大量の ID を渡されたときに使う。
+    commit_each_batch=False の場合はコミットせず、全バッチを呼び出し側の1つのトランザクションで削除する
+    (1文あたりの ID の数だけを抑える)。
+    on_batch(deleted_rows, done_ids, total_ids) はバッチのコミット後に呼ばれる（進捗表示や CSV 退避用）。
+    削除した件数の合計を返す。
+    """
+    batch_size = batch_size or config.DELETE_BATCH_SIZE
+    unique_ids = sorted(set(item_ids))
+    deleted_total = 0
+    with conn.cursor() as cur:
+        for start in range(0, len(unique_ids), batch_size):
+            chunk = unique_ids[start:start + batch_size]
+            deleted_rows = delete_items_batch(cur, "id = ANY(%s)", (chunk,), archive_reason)
+            if commit_each_batch:
+                conn.commit()
+            deleted_total += len(deleted_rows)
+            if on_batch:
+                on_batch(deleted_rows, start + len(chunk), len(unique_ids))
+            if pause_seconds and start + batch_size < len(unique_ids):
+                time.sleep(pause_seconds)
+    return deleted_total
+
+def count_items_to_rename(cur, old_category, new_category):
+    """ rename_category_in_batches で書き換わる items の件数 (製品名変更の確認画面に表示する) """
+    cur.execute(
+        "SELECT COUNT(*) FROM items WHERE LOWER(TRIM(category)) = LOWER(TRIM(%s)) AND category IS DISTINCT FROM %s",
+        (old_category, new_category)
+    )
+    return cur.fetchone()[0]
+
+def rename_category_in_batches(cur, old_category, new_category, batch_size=None, on_batch=None):
+    """
+    カテゴリが old_category と一致する items のカテゴリを new_category に書き換える。
+    id 順に batch_size 件ずつ更新するが、コミットはしない (製品名の変更と同じトランザクションにするため、呼び出し側でコミットする)。
+    on_batch(updated_so_far) はバッチごとに呼ばれる (進捗表示用)。更新した件数の合計を返す。
+    """
+    batch_size = batch_size or config.PRODUCT_RENAME_BATCH_SIZE
+    updated_total = 0
+    last_id = 0
+    while True:
+        cur.execute(
+            """
+            WITH batch AS (
+                SELECT id FROM items
+                WHERE LOWER(TRIM(category)) = LOWER(TRIM(%s)) AND category IS DISTINCT FROM %s AND id > %s
+                ORDER BY id
+                LIMIT %s
+            )
+            UPDATE items SET category = %s
+            FROM batch
+            WHERE items.id = batch.id
+            RETURNING items.id
+            """,
+            (old_category, new_category, last_id, batch_size, new_category)
+        )
+        updated_ids = [row[0] for row in cur.fetchall()]
+        if not updated_ids:
+            break
+        updated_total += len(updated_ids)
+        last_id = max(updated_ids)
+        if on_batch:
+            on_batch(updated_total)
+        if len(updated_ids) < batch_size:
+            break
+    return updated_total
+
 def delete_items_by_ids(item_ids):
-    """ 複数の item_id に基づいてアイテムを削除する """
+    """
+    複数の item_id に基づいてアイテムを削除する。
+    画面からの一括削除は、途中でエラーになったときに一部だけ消えた状態を残さないよう、
+    1つのトランザクションで削除する (エラーの場合は何も削除せずに例外をそのまま送り、画面でエラーを表示させる)。
+    """
     if not item_ids:
         return 0
     
     conn = get_db_connection()
-    # PostgreSQL用のプレースホルダ '%s' を使用
-    placeholders = ','.join(['%s'] * len(item_ids))
-    sql = f'DELETE FROM items WHERE id IN ({placeholders})'
-    
+    deleted_count = 0
     try:
-        cursor = conn.cursor()
-        # パラメータはタプルとして渡す
-        cursor.execute(sql, tuple(item_ids))
+        deleted_count = delete_items_in_batches(conn, item_ids, commit_each_batch=False)
         conn.commit()
-        deleted_count = cursor.rowcount
     except Exception as e:
         conn.rollback()
         print(f"データベースエラー: {e}")
-        deleted_count = 0
+        raise
     finally:
         conn.close()
         
-    return deleted_count
\ No newline at end of file
+    return deleted_count
@@ -0,0 +1,171 @@
+# app/duplicates.py
+# CSV や Wiki からの取り込みでできた、重複・ほぼ重複のカードを見つけてまとめる処理。
+# (card_id, rare) の一意制約では、全角/半角や区切り文字の違うカードIDの行を防げないため、
+# 次のどちらかに当てはまる行どうしを同じカードとみなす。
+#   1. 正規化したカードID (card_id_normalized) とレアリティが同じ
+#   2. 正規化したカード名 (name_normalized) とレアリティが同じで、カードIDの英数字部分が同じ (LOB-JP001 と LOBJP001 など)
+# どちらも SQL の GROUP BY で同じキーの行をまとめる (ブロッキング) だけなので、全行どうしを比べる必要はない。
+# 2つの規則で見つかったグループに共通の行があれば、union-find で1つのクラスタにつなげる。
+# rebuild_rollups.py と同じく、Flask には依存させずカーソルだけを受け取る。
+from .db import ITEM_ARCHIVE_COLUMNS
+
+# 重複をまとめて削除した行を items_archive に退避するときの理由
+MERGE_ARCHIVE_REASON = 'duplicate_merge'
+
+_RARE_KEY = "LOWER(TRIM(COALESCE(rare, '')))"
+_CARD_ID_KEY = "COALESCE(card_id_normalized, LOWER(TRIM(card_id)))"
+_NAME_KEY = "COALESCE(name_normalized, LOWER(TRIM(name)))"
+
+# 同じキーを持つ行の id の配列 (2行以上のものだけ)
+_BLOCKS_QUERY = f"""
+    SELECT array_agg(id ORDER BY id) AS ids
+    FROM items
+    WHERE {_CARD_ID_KEY} <> ''
+    GROUP BY {_CARD_ID_KEY}, {_RARE_KEY}
+    HAVING COUNT(*) > 1
+    UNION ALL
+    SELECT array_agg(id ORDER BY id) AS ids
+    FROM items
+    WHERE {_NAME_KEY} <> '' AND regexp_replace({_CARD_ID_KEY}, '[^[:alnum:]]', '', 'g') <> ''
+    GROUP BY {_NAME_KEY}, {_RARE_KEY}, regexp_replace({_CARD_ID_KEY}, '[^[:alnum:]]', '', 'g')
+    HAVING COUNT(*) > 1
+"""
+
+
+class UnionFind:
+    """ 要素をつないでいき、つながっているもの (同じ集合) をまとめるための構造 """
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent.setdefault(x, x)
+        if parent != x:
+            # 経路圧縮: たどった要素を根に直接つなぐ
+            root = x
+            while self.parent[root] != root:
+                root = self.parent[root]
+            while self.parent[x] != root:
+                self.parent[x], x = root, self.parent[x]
+            return root
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # 小さい id を根にしておく (結果の順序を安定させるため)
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        """ {根: [要素, ...]} """
+        groups = {}
+        for x in self.parent:
+            groups.setdefault(self.find(x), []).append(x)
+        return groups
+
+
+def cluster_blocks(blocks):
+    """ id のリストのリスト (ブロック) から、共通の id を持つものをつないだクラスタ (id のソート済みリスト) のリストを返す """
+    union_find = UnionFind()
+    for ids in blocks:
+        first = ids[0]
+        union_find.find(first)
+        for other in ids[1:]:
+            union_find.union(first, other)
+    return sorted((sorted(ids) for ids in union_find.groups().values()), key=lambda ids: ids[0])
+
+
+class DuplicateCluster:
+    """ 同じカードとみなした行の集まり。rows は id 順、survivor_id はまとめるときに残す行 """
+    __slots__ = ('rows', 'survivor_id')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.survivor_id = choose_survivor(rows)
+
+    @property
+    def ids(self):
+        return [row['id'] for row in self.rows]
+
+    @property
+    def total_stock(self):
+        return sum(row['stock'] or 0 for row in self.rows)
+
+
+def choose_survivor(rows):
+    """ まとめるときに残す行: 在庫の多い行、同じなら先に登録された (id の小さい) 行 """
+    return min(rows, key=lambda row: (-(row['stock'] or 0), row['id']))['id']
+
+
+def find_duplicate_clusters(cur, limit=None):
+    """
+    重複とみなした行のクラスタ (DuplicateCluster) のリストを、行数の多い順に返す。
+    limit を指定すると、その数のクラスタだけ行の内容を読む。
+    """
+    cur.execute(_BLOCKS_QUERY)
+    clusters = cluster_blocks([row[0] for row in cur.fetchall()])
+    clusters.sort(key=lambda ids: (-len(ids), ids[0]))
+    if limit is not None:
+        clusters = clusters[:limit]
+    if not clusters:
+        return []
+
+    cur.execute(
+        "SELECT id, name, card_id, rare, stock, category FROM items WHERE id = ANY(%s)",
+        ([item_id for ids in clusters for item_id in ids],)
+    )
+    rows_by_id = {row['id']: dict(row) for row in cur.fetchall()}
+    result = []
+    for ids in clusters:
+        rows = [rows_by_id[item_id] for item_id in ids if item_id in rows_by_id]
+        if len(rows) > 1:
+            result.append(DuplicateCluster(rows))
+    return result
+
+
+def merge_clusters(cur, merges):
+    """
+    merges: [(残す行の id, [まとめる行の id, ...]), ...]
+    まとめる行の在庫を残す行に足し、まとめる行は items_archive に退避してから削除する。
+    すべてのクラスタを1つの文で処理する (コミットは呼び出し側で行う)。
+    戻り値: (在庫を足した残す行の数, 削除した行の数)
+    """
+    member_ids = []
+    survivor_ids = []
+    for survivor_id, ids in merges:
+        for item_id in ids:
+            if item_id != survivor_id:
+                member_ids.append(item_id)
+                survivor_ids.append(survivor_id)
+    if not member_ids:
+        return 0, 0
+
+    columns = ', '.join(ITEM_ARCHIVE_COLUMNS)
+    moved_columns = ', '.join(f'i.{column}' for column in ITEM_ARCHIVE_COLUMNS)
+    cur.execute(f"""
+        WITH mapping AS (
+            SELECT * FROM unnest(%s::integer[], %s::integer[]) AS m(member_id, survivor_id)
+        ), moved AS (
+            DELETE FROM items i
+            USING mapping m
+            WHERE i.id = m.member_id
+              AND EXISTS (SELECT 1 FROM items s WHERE s.id = m.survivor_id)
+            RETURNING {moved_columns}, m.survivor_id
+        ), archived AS (
+            INSERT INTO items_archive ({columns}, archive_reason)
+            SELECT {columns}, %s FROM moved
+        ), totals AS (
+            SELECT survivor_id, SUM(COALESCE(stock, 0)) AS stock, COUNT(*) AS merged_rows
+            FROM moved
+            GROUP BY survivor_id
+        )
+        UPDATE items i
+        SET stock = COALESCE(i.stock, 0) + t.stock
+        FROM totals t
+        WHERE i.id = t.survivor_id
+        RETURNING t.merged_rows
+    """, (member_ids, survivor_ids, MERGE_ARCHIVE_REASON))
+    merged_rows = [row[0] for row in cur.fetchall()]
+    return len(merged_rows), sum(merged_rows)
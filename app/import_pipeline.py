@@ -0,0 +1,165 @@
+# app/import_pipeline.py
+# 複数ファイルのCSVインポートで、行の検証・レアリティ変換・検索用の正規化をプロセスプールで並列に行う仕組み。
+# - 親プロセスはアップロードを先頭から読み、空行を除いた生の行をチャンク (CSV_IMPORT_CHUNK_ROWS 行) にまとめてワーカーに渡す
+# - ワーカーはチャンクを DB にそのまま書ける形のタプルのリストにして返す
+# - 親プロセスはファイル・チャンクの順番どおりに結果を受け取り、1本の接続で書き込む (書き込み側は admin_import_csv)
+# 同時に処理中のチャンク数には上限があるので、大きなファイルでもメモリ使用量は増え続けない。
+# プロセスプールはインポートごとに起動し、終わったら止める (Web ワーカーにアイドルのプロセスを残さない)。
+import collections
+import concurrent.futures
+import csv
+import multiprocessing
+import os
+
+from . import config
+from . import csv_ingest
+from .utils import normalize_for_search
+
+# カテゴリが決められない行に使うカテゴリ名
+UNKNOWN_CATEGORY = "不明カテゴリ"
+
+# ItemImportPipeline が返すイベントの種類
+ROWS = 'rows'    # 変換済みの行のリスト
+END = 'end'      # ファイルを最後まで読み終えた
+ERROR = 'error'  # ファイルの読み込み・解析に失敗した (それまでの行も取り消す想定)
+
+
+class ImportSource:
+    """ インポートする1ファイル分の情報 """
+
+    def __init__(self, key, upload_stream, fallback_category):
+        self.key = key
+        self.upload_stream = upload_stream
+        # CSV にカテゴリ列がない行に使うカテゴリ (通常はファイル名)
+        self.fallback_category = fallback_category
+
+
+def prepare_item_rows(header, rows, first_row_number, fallback_category):
+    """
+    ワーカーで実行する、カードCSVのチャンクの変換処理。
+    (行番号, 名前, 型番 or None, レアリティ, 在庫数, カテゴリ, 名前の正規化, 型番の正規化, 問題) のタプルのリストを返す。
+    問題は csv_ingest.iter_rows と同じ形式で、必須項目が空の行は他の値を埋めずに返す。
+    """
+    compiled = csv_ingest.compile_header(csv_ingest.ITEM_CSV_SPEC, header)
+    rarity_map = config.RARITY_CONVERSION_MAP
+    prepared = []
+    for row_number, (name, card_id, raw_rarity, stock, category), problem in csv_ingest.iter_rows(iter(rows), compiled, first_row_number):
+        if problem is not None and problem[0] == csv_ingest.MISSING_REQUIRED:
+            prepared.append((row_number, name, card_id or None, raw_rarity, stock, category, None, None, problem))
+            continue
+        rare = rarity_map.get(raw_rarity.lower(), raw_rarity)
+        category = category or fallback_category or UNKNOWN_CATEGORY
+        prepared.append((
+            row_number, name, card_id or None, rare, stock, category,
+            normalize_for_search(name), normalize_for_search(card_id), problem
+        ))
+    return prepared
+
+
+def get_worker_count():
+    """ 設定のワーカー数 (0 なら CPU 数。ただし CSV_IMPORT_MAX_DEFAULT_WORKERS まで) """
+    return config.CSV_IMPORT_WORKERS or min(os.cpu_count() or 1, config.CSV_IMPORT_MAX_DEFAULT_WORKERS)
+
+def create_executor(workers):
+    """ 1回のインポート用のプロセスプールを作る (ItemImportPipeline が終わるときに止める) """
+    # スレッドを持つ Web ワーカーから fork すると固まることがあるので、spawn で起動する
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+class ItemImportPipeline:
+    """
+    ImportSource のリストを順に読み、(ファイルのキー, イベントの種類, 内容) を順番どおりに返す。
+    イベントは1ファイルにつき ROWS が0個以上と、最後に END か ERROR が1つ。
+    書き込み側でファイルの処理を打ち切ったら discard() を呼ぶと、そのファイルの残りは読まずに END を返す。
+    executor は最後まで読み終えたとき、または close() で止める (途中でやめる場合は呼び出し側で close() を呼ぶ)。
+    """
+
+    def __init__(self, sources, executor=None, workers=1, chunk_rows=None, max_pending_chunks=None):
+        self.sources = sources
+        self.executor = executor
+        self.chunk_rows = chunk_rows or config.CSV_IMPORT_CHUNK_ROWS
+        # 書き込み待ちのチャンクの上限。ワーカーが常に次のチャンクを処理できる程度にしておく
+        self.max_pending_chunks = max_pending_chunks or max(workers * 2, 1)
+        self._discarded = set()
+
+    def discard(self, key):
+        self._discarded.add(key)
+
+    def close(self):
+        """ プロセスプールを止める。処理中・待ち中のチャンクは取り消す """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _read_sources(self):
+        for source in self.sources:
+            try:
+                reader = csv.reader(source.upload_stream.text)
+                header = next(reader, None)
+                if header is None:
+                    raise ValueError("ヘッダー行がありません。")
+                header = tuple(header)
+                # 必須列の確認は親プロセスで先に行う (CsvHeaderError はファイルのエラーとして返す)
+                csv_ingest.compile_header(csv_ingest.ITEM_CSV_SPEC, header)
+
+                chunk = []
+                first_row_number = 1
+                for row in reader:
+                    if not row:
+                        continue
+                    chunk.append(row)
+                    if len(chunk) >= self.chunk_rows:
+                        if source.key in self._discarded:
+                            break
+                        yield source.key, ROWS, (header, chunk, first_row_number, source.fallback_category)
+                        first_row_number += len(chunk)
+                        chunk = []
+                if chunk and source.key not in self._discarded:
+                    yield source.key, ROWS, (header, chunk, first_row_number, source.fallback_category)
+                yield source.key, END, None
+            except (UnicodeDecodeError, csv.Error, ValueError) as e:
+                yield source.key, ERROR, e
+
+    def _submit(self, args):
+        if self.executor is None:
+            return prepare_item_rows(*args)
+        return self.executor.submit(prepare_item_rows, *args)
+
+    def __iter__(self):
+        pending = collections.deque()
+        pending_chunks = 0
+        try:
+            for key, kind, payload in self._read_sources():
+                if kind == ROWS:
+                    payload = self._submit(payload)
+                    pending_chunks += 1
+                pending.append((key, kind, payload))
+                while pending_chunks > self.max_pending_chunks:
+                    key, kind, payload = pending.popleft()
+                    if kind == ROWS:
+                        pending_chunks -= 1
+                    yield self._resolve(key, kind, payload)
+            while pending:
+                yield self._resolve(*pending.popleft())
+        finally:
+            self.close()
+
+    def _resolve(self, key, kind, payload):
+        if isinstance(payload, concurrent.futures.Future):
+            if key in self._discarded:
+                payload.cancel()
+                return key, kind, []
+            payload = payload.result()
+        return key, kind, payload
+
+
+def build_pipeline(sources):
+    """
+    インポート用のパイプラインを作る。
+    ワーカー数が1以下か、ファイルの合計サイズが小さければ、プロセスプールを使わずにその場で変換する。
+    """
+    workers = get_worker_count()
+    total_bytes = sum(source.upload_stream.total_bytes for source in sources)
+    if workers <= 1 or total_bytes < config.CSV_IMPORT_PARALLEL_MIN_BYTES:
+        return ItemImportPipeline(sources)
+    return ItemImportPipeline(sources, executor=create_executor(workers), workers=workers)
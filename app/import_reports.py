@@ -0,0 +1,151 @@
+# app/import_reports.py
+# CSVインポートの結果を import_runs / import_run_issues (migrations/007_import_reports.sql) に保存し、読み出す処理。
+# 行ごとのエラー・警告はフラッシュメッセージに詰め込まず、IMPORT_REPORT_ISSUE_BATCH_SIZE 件ずつまとめて書き込む。
+# インポート本体のトランザクションはファイル単位でロールバックされることがあるので、レポートは別の接続に書き、
+# 書き込むたびにコミットする (インポートが失敗しても、何が起きたかは残る)。
+# Flask には依存させず、接続またはカーソルだけを受け取る。
+import psycopg2.extras
+
+from . import config
+
+ERROR = 'error'
+WARNING = 'warning'
+SEVERITIES = (ERROR, WARNING)
+
+# 実行の状態 (import_runs.status)。完了した実行の状態は、フラッシュメッセージの種類と同じ値を使う
+RUNNING = 'running'
+FAILED = 'failed'
+
+_RUN_COLUMNS = ('id', 'started_at', 'finished_at', 'username', 'status', 'file_count', 'rows_processed',
+                'added', 'updated', 'skipped_no_change', 'skipped_error', 'error_count', 'warning_count', 'summary')
+
+
+class ImportReport:
+    """
+    1回のインポートの記録。start() で import_runs に行を作り、add_issue() で問題をためて、
+    バッチごとに import_run_issues へ書き込む。最後に finish() で件数と状態を書き込む。
+    """
+
+    def __init__(self, conn, run_id, batch_size=None):
+        self.conn = conn
+        self.run_id = run_id
+        self.batch_size = batch_size or config.IMPORT_REPORT_ISSUE_BATCH_SIZE
+        self.counts = {ERROR: 0, WARNING: 0}
+        self._pending = []
+
+    @classmethod
+    def start(cls, conn, username, file_count, batch_size=None):
+        """ 実行の記録を作ってコミットする。保存期間を過ぎた古い記録もここで削除する """
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM import_runs WHERE started_at < now() - make_interval(days => %s)",
+                (config.IMPORT_REPORT_RETENTION_DAYS,)
+            )
+            cur.execute(
+                "INSERT INTO import_runs (username, file_count) VALUES (%s, %s) RETURNING id",
+                (username, file_count)
+            )
+            run_id = cur.fetchone()[0]
+        conn.commit()
+        return cls(conn, run_id, batch_size)
+
+    @property
+    def issue_count(self):
+        return self.counts[ERROR] + self.counts[WARNING]
+
+    def add_issue(self, filename, row_number, severity, message, row_data=None):
+        """ 問題を1件追加する。batch_size 件たまったら書き込む """
+        self.counts[severity] += 1
+        self._pending.append((self.run_id, filename, row_number, severity, message,
+                              None if row_data is None else str(row_data)))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ ためている問題を1回の INSERT で書き込んでコミットする """
+        if not self._pending:
+            return
+        with self.conn.cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO import_run_issues (run_id, filename, row_number, severity, message, row_data) VALUES %s",
+                self._pending, page_size=self.batch_size
+            )
+        self.conn.commit()
+        self._pending = []
+
+    def finish(self, status, stats, summary):
+        """
+        残りの問題を書き込み、実行の結果を記録する。
+        stats: {'rows_processed', 'added', 'updated', 'skipped_no_change', 'skipped_error'}
+        """
+        self.flush()
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE import_runs
+                SET finished_at = now(), status = %s, rows_processed = %s, added = %s, updated = %s,
+                    skipped_no_change = %s, skipped_error = %s, error_count = %s, warning_count = %s, summary = %s
+                WHERE id = %s
+            """, (status, stats['rows_processed'], stats['added'], stats['updated'], stats['skipped_no_change'],
+                  stats['skipped_error'], self.counts[ERROR], self.counts[WARNING], summary, self.run_id))
+        self.conn.commit()
+
+
+def fetch_recent_runs(cur, limit=None):
+    """ 新しい順に最大 limit 件の実行の記録 """
+    cur.execute(
+        f"SELECT {', '.join(_RUN_COLUMNS)} FROM import_runs ORDER BY id DESC LIMIT %s",
+        (limit or config.IMPORT_REPORT_RECENT_RUNS,)
+    )
+    return cur.fetchall()
+
+def fetch_run(cur, run_id):
+    cur.execute(f"SELECT {', '.join(_RUN_COLUMNS)} FROM import_runs WHERE id = %s", (run_id,))
+    return cur.fetchone()
+
+def fetch_issue_counts_by_file(cur, run_id):
+    """ [(ファイル名, エラー件数, 警告件数), ...] (ファイル名順) """
+    cur.execute("""
+        SELECT filename, COUNT(*) FILTER (WHERE severity = 'error'), COUNT(*) FILTER (WHERE severity = 'warning')
+        FROM import_run_issues WHERE run_id = %s
+        GROUP BY filename ORDER BY filename
+    """, (run_id,))
+    return cur.fetchall()
+
+def fetch_issue_page(cur, run_id, severity=None, after=None, before=None, page_size=None):
+    """
+    実行 run_id の問題を id 順に1ページ分返す。after / before はそれぞれ次・前のページのカーソル (問題の id)。
+    戻り値: (問題の行, 前のページのカーソル or None, 次のページのカーソル or None)
+    """
+    page_size = page_size or config.IMPORT_REPORT_PAGE_SIZE
+    conditions = ["run_id = %s"]
+    params = [run_id]
+    if severity in SEVERITIES:
+        conditions.append("severity = %s")
+        params.append(severity)
+
+    position = before if before is not None else after
+    backward = before is not None
+    if position is not None:
+        # 前のページは、並び順を逆にして取得してから元の順に戻す
+        conditions.append("id < %s" if backward else "id > %s")
+        params.append(position)
+
+    cur.execute(
+        "SELECT id, filename, row_number, severity, message, row_data FROM import_run_issues"
+        f" WHERE {' AND '.join(conditions)} ORDER BY id {'DESC' if backward else 'ASC'} LIMIT %s",
+        tuple(params) + (page_size + 1,)
+    )
+    issues = cur.fetchall()
+
+    has_more = len(issues) > page_size
+    issues = issues[:page_size]
+    if backward:
+        issues.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = position is not None, has_more
+
+    previous_cursor = issues[0]['id'] if issues and has_previous else None
+    next_cursor = issues[-1]['id'] if issues and has_next else None
+    return issues, previous_cursor, next_cursor
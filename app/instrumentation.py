@@ -0,0 +1,226 @@
+# app/instrumentation.py
+# SQL の実行時間とリクエスト処理時間を計測するための仕組み。
+# - カーソルの execute をラップして、文・所要時間・行数をリクエストごとに記録する
+# - レスポンスに Server-Timing ヘッダーを付ける
+# - 閾値を超えた SQL をサンプリングしてスローログに出す
+# - 文ごとの累計時間と、エンドポイントごとのレイテンシ分布をプロセス内で集計する
+import bisect
+import logging
+import random
+import re
+import threading
+import time
+
+import psycopg2.extensions
+import psycopg2.extras
+from flask import g, has_request_context, request
+
+from . import config
+
+slow_query_logger = logging.getLogger('app.slow_query')
+
+# レイテンシ分布のバケット境界 (ミリ秒)。最後のバケットは上限なし。
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_statement(query):
+    """ 集計用に SQL の空白をまとめ、長すぎる文は切り詰める """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composed など
+        query = repr(query)
+    statement = _WHITESPACE_RE.sub(' ', query).strip()
+    if len(statement) > config.QUERY_STATS_STATEMENT_MAX_LENGTH:
+        statement = statement[:config.QUERY_STATS_STATEMENT_MAX_LENGTH] + ' ...'
+    return statement
+
+
+class QueryStats:
+    """ 文ごとの実行回数・累計時間・最大時間・行数をプロセス内で集計する """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started_at = time.time()
+
+    def record(self, statement, duration_ms, rows):
+        with self._lock:
+            entry = self._stats.get(statement)
+            if entry is None:
+                if len(self._stats) >= config.QUERY_STATS_MAX_STATEMENTS:
+                    statement = '(その他の文)'
+                    entry = self._stats.get(statement)
+                if entry is None:
+                    entry = self._stats[statement] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += duration_ms
+            entry[2] = max(entry[2], duration_ms)
+            entry[3] += max(rows, 0)
+
+    def top(self, limit=50):
+        """ 累計時間の長い順に集計結果を返す """
+        with self._lock:
+            rows = [
+                {
+                    'statement': statement,
+                    'calls': calls,
+                    'total_ms': total_ms,
+                    'mean_ms': total_ms / calls if calls else 0.0,
+                    'max_ms': max_ms,
+                    'rows': rows,
+                }
+                for statement, (calls, total_ms, max_ms, rows) in self._stats.items()
+            ]
+        rows.sort(key=lambda r: r['total_ms'], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+
+class LatencyHistogram:
+    """ エンドポイントごとのレイテンシを固定バケットで数え、p50/p95/p99 を推定する """
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.started_at = time.time()
+
+    def record(self, endpoint, duration_ms):
+        index = bisect.bisect_left(self.buckets_ms, duration_ms)
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {'counts': [0] * (len(self.buckets_ms) + 1), 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            entry['counts'][index] += 1
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+
+    def _percentile(self, counts, total, max_ms, q):
+        """ 該当バケット内を線形補間して q 分位点を推定する """
+        target = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= target:
+                lower = self.buckets_ms[index - 1] if index > 0 else 0.0
+                upper = self.buckets_ms[index] if index < len(self.buckets_ms) else max_ms
+                fraction = (target - cumulative) / count
+                return min(lower + (upper - lower) * fraction, max_ms)
+            cumulative += count
+        return max_ms
+
+    def summary(self):
+        with self._lock:
+            snapshot = {endpoint: dict(entry, counts=list(entry['counts'])) for endpoint, entry in self._endpoints.items()}
+        rows = []
+        for endpoint, entry in snapshot.items():
+            total = entry['count']
+            rows.append({
+                'endpoint': endpoint,
+                'count': total,
+                'mean_ms': entry['total_ms'] / total if total else 0.0,
+                'p50_ms': self._percentile(entry['counts'], total, entry['max_ms'], 0.50),
+                'p95_ms': self._percentile(entry['counts'], total, entry['max_ms'], 0.95),
+                'p99_ms': self._percentile(entry['counts'], total, entry['max_ms'], 0.99),
+                'max_ms': entry['max_ms'],
+                'counts': entry['counts'],
+            })
+        rows.sort(key=lambda r: r['count'] * r['mean_ms'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self.started_at = time.time()
+
+
+query_stats = QueryStats()
+endpoint_latency = LatencyHistogram()
+
+
+def record_query(query, duration_ms, rows):
+    """ 1回の SQL 実行を、リクエスト単位の記録・プロセス全体の集計・スローログに反映する """
+    statement = normalize_statement(query)
+    query_stats.record(statement, duration_ms, rows)
+
+    if has_request_context():
+        query_log = g.get('query_log')
+        if query_log is not None and len(query_log) < config.REQUEST_QUERY_LOG_MAX_ENTRIES:
+            query_log.append((statement, duration_ms, rows))
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_time_ms = g.get('query_time_ms', 0.0) + duration_ms
+
+    if duration_ms >= config.SLOW_QUERY_THRESHOLD_MS and random.random() < config.SLOW_QUERY_SAMPLE_RATE:
+        endpoint = request.endpoint if has_request_context() else None
+        slow_query_logger.warning(f"Slow query ({duration_ms:.1f} ms, {rows} rows, endpoint={endpoint}): {statement}")
+
+
+class InstrumentedCursorMixin:
+    """ execute / executemany の所要時間と行数を record_query に渡すカーソルの共通部分 """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+
+class InstrumentedDictCursor(InstrumentedCursorMixin, psycopg2.extras.DictCursor):
+    pass
+
+
+class InstrumentedCursor(InstrumentedCursorMixin, psycopg2.extensions.cursor):
+    """ 行をタプルで返すカーソル (records.py で軽い行に詰め替える一覧・エクスポート用) """
+
+
+def init_app(app):
+    """ リクエストの開始・終了時の計測処理をアプリに登録する """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+        g.query_log = []
+        g.query_count = 0
+        g.query_time_ms = 0.0
+
+    @app.after_request
+    def finish_request_timer(response):
+        started_at = g.get('request_started_at')
+        if started_at is None:
+            return response
+        total_ms = (time.perf_counter() - started_at) * 1000
+        db_ms = g.get('query_time_ms', 0.0)
+        query_count = g.get('query_count', 0)
+
+        endpoint_latency.record(request.endpoint or '(not found)', total_ms)
+
+        if config.SERVER_TIMING_ENABLED:
+            response.headers['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="{query_count} queries", '
+                f'app;dur={max(total_ms - db_ms, 0.0):.1f}, '
+                f'total;dur={total_ms:.1f}'
+            )
+
+        if total_ms >= config.SLOW_REQUEST_THRESHOLD_MS:
+            slowest = sorted(g.get('query_log', []), key=lambda entry: entry[1], reverse=True)[:5]
+            details = '; '.join(f"{duration:.1f} ms ({rows} rows) {statement[:200]}" for statement, duration, rows in slowest)
+            slow_query_logger.warning(
+                f"Slow request {request.method} {request.path} ({request.endpoint}): "
+                f"{total_ms:.1f} ms total, {db_ms:.1f} ms in {query_count} queries. Slowest: {details}"
+            )
+        return response
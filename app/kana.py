@@ -0,0 +1,34 @@
+# app/kana.py
+# 漢字・かなをひらがな/カタカナに変換する pykakasi の変換器。
+# 変換器の作成には辞書の読み込みで時間がかかるので、ワーカーの起動時ではなく最初に使うときに1つだけ作る。
+import functools
+import threading
+
+_lock = threading.Lock()
+
+
+def _make_converter(modes):
+    from pykakasi import kakasi
+
+    converter = kakasi()
+    for mode, value in modes:
+        converter.setMode(mode, value)
+    return converter
+
+@functools.lru_cache(maxsize=1)
+def _hira_converter():
+    return _make_converter([("J", "H"), ("K", "H"), ("s", False), ("C", False)])
+
+@functools.lru_cache(maxsize=1)
+def _kata_converter():
+    return _make_converter([("J", "K"), ("H", "K"), ("s", False), ("C", False)])
+
+def get_hira_converter():
+    """ 漢字・カタカナをひらがなにする変換器 """
+    with _lock:
+        return _hira_converter()
+
+def get_kata_converter():
+    """ 漢字・ひらがなをカタカナにする変換器 """
+    with _lock:
+        return _kata_converter()
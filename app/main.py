@@ -1,6 +1,6 @@
 # app/main.py
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for, current_app, abort, make_response, jsonify
+    Blueprint, flash, g, redirect, render_template, request, session, url_for, current_app, abort, make_response, jsonify, send_file
 )
 import psycopg2
 import psycopg2.extras
@@ -8,10 +8,13 @@ import traceback
 import csv
 import io
 import datetime
+import tempfile
 
 # --- ここから修正 ---
 # db, auth, utilsモジュールと、新しくconfigモジュールをインポート
-from . import db, config
+from . import db, columnar, config, counting, queries, records, search_index, versioning
+from .replica import read_only
+from .cache import item_list_cache
 from .auth import login_required
 from .utils import normalize_for_search
 # data_definitionsは不要になったので削除
@@ -20,91 +23,25 @@ from .utils import normalize_for_search
 
 bp = Blueprint('main', __name__)
 
-def get_all_product_names():
-    conn = None
-    names = []
-    try:
-        conn = db.get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM products WHERE name IS NOT NULL AND name != '' ORDER BY name ASC")
-        names = [row['name'] for row in cur.fetchall()]
-    except (Exception, psycopg2.Error) as error:
-        current_app.logger.error(f"Error fetching all product names: {error}")
-    finally:
-        if conn:
-            if 'cur' in locals() and not cur.closed:
-                cur.close()
-            conn.close()
-    return names
-
 def get_items_from_db(show_zero=True, keyword=None, search_field='all', sort_by="release_date", sort_order="desc", category=None):
+    """ 一覧用の行を返す。DB エラーの場合はメッセージを出して None を返す。 """
     conn = None
-    items_result = []
+    items_result = None
     try:
         conn = db.get_db_connection()
-        cur = conn.cursor()
-        
-        query_base = """
-            SELECT
-                i.id, i.name, i.card_id, i.rare, i.stock, i.category,
-                p.release_date, p.era, p.display_name, p.show_in_sidebar
-            FROM items i
-            LEFT JOIN products p ON LOWER(TRIM(i.category)) = LOWER(TRIM(p.name))
-        """
-        
-        conditions = []
-        params = []
+        # 行数が多くなるので、DictRow ではなく軽い行 (records.py) で受け取る
+        cur = records.tuple_cursor(conn)
 
-        if not show_zero:
-            conditions.append("i.stock > 0")
-        
-        if category:
-            conditions.append("i.category = %s")
-            params.append(category)
+        # 条件の組み合わせは queries.py で PREPARE 済みの形に寄せ、値だけを引数で渡す
+        search_field, filter_shape, filter_params = search_index.item_list_filter_params(show_zero, keyword, search_field, category)
 
-        if keyword:
-            normalized_keyword = normalize_for_search(keyword)
-            keyword_like = f"%{normalized_keyword}%"
-            
-            if search_field == 'name':
-                conditions.append("i.name_normalized LIKE %s")
-                params.append(keyword_like)
-            elif search_field == 'card_id':
-                conditions.append("i.card_id_normalized LIKE %s")
-                params.append(keyword_like)
-            elif search_field == 'category':
-                conditions.append("LOWER(i.category) LIKE %s")
-                params.append(f"%{keyword.lower()}%")
-            elif search_field == 'rare':
-                conditions.append("LOWER(i.rare) LIKE %s")
-                params.append(f"%{keyword.lower()}%")
-            else: # 'all'
-                keyword_conditions = [
-                    "i.name_normalized LIKE %s",
-                    "i.card_id_normalized LIKE %s",
-                    "LOWER(i.rare) LIKE %s",
-                    "LOWER(i.category) LIKE %s"
-                ]
-                conditions.append(f"({' OR '.join(keyword_conditions)})")
-                params.extend([keyword_like, keyword_like, f"%{keyword.lower()}%", f"%{keyword.lower()}%"])
-
-        if conditions:
-            query_base += " WHERE " + " AND ".join(conditions)
-        
-        valid_sort_keys = ["name", "card_id", "rare", "stock", "id", "category", "release_date"]
-        if sort_by not in valid_sort_keys:
+        if sort_by not in queries.ITEM_LIST_SORT_KEYS:
             sort_by = "release_date"
         if sort_order.lower() not in ["asc", "desc"]:
             sort_order = "desc"
 
-        if sort_by == "release_date":
-            query_base += f" ORDER BY CAST(p.release_date AS DATE) {sort_order.upper()} NULLS LAST, i.name ASC"
-        else:
-            sort_column = f"i.{sort_by}"
-            query_base += f" ORDER BY {sort_column} {sort_order.upper()}, i.name ASC"
-
-        cur.execute(query_base, tuple(params))
-        items_result = cur.fetchall()
+        queries.execute(cur, queries.item_list_query_name(search_field, filter_shape, sort_by, sort_order), filter_params)
+        items_result = records.fetch_records(cur, records.ItemListRow)
         
     except (psycopg2.Error, Exception) as e:
         current_app.logger.error(f"Database error in get_items_from_db: {e}\n{traceback.format_exc()}")
@@ -116,7 +53,55 @@ def get_items_from_db(show_zero=True, keyword=None, search_field='all', sort_by=
             conn.close()
     return items_result
 
+def get_item_page_from_db(show_zero, keyword, search_field, sort_by, sort_order, category, page, per_page, version=None):
+    """
+    一覧の1ページ分を SQL の LIMIT / OFFSET で取得し、(行, 件数 (counting.RowCount), ページ番号) を返す。
+    ページ番号は結果の範囲に収まるよう補正する。DB エラーの場合はメッセージを出して None を返す。
+    """
+    conn = None
+    result = None
+    try:
+        conn = db.get_db_connection()
+        cur = records.tuple_cursor(conn)
+
+        search_field, filter_shape, filter_params = search_index.item_list_filter_params(show_zero, keyword, search_field, category)
+        if sort_by not in queries.ITEM_LIST_SORT_KEYS:
+            sort_by = "release_date"
+        if sort_order.lower() not in ["asc", "desc"]:
+            sort_order = "desc"
+        count_query = queries.item_list_count_query_name(search_field, filter_shape)
+        estimate_query = queries.item_list_query_name(search_field, filter_shape, sort_by, sort_order)
+        page_query = queries.item_list_page_query_name(search_field, filter_shape, sort_by, sort_order)
+
+        total = counting.count_rows(cur, count_query, estimate_query, filter_params, version)
+        page = max(page, 1)
+        if total.exact:
+            page = min(page, max((total.count + per_page - 1) // per_page, 1))
+        offset = (page - 1) * per_page
+        queries.execute(cur, page_query, filter_params + (per_page, offset))
+        rows = records.fetch_records(cur, records.ItemListRow)
+
+        if not rows and offset > 0:
+            # 見積もりが実際より多く、結果の外のページを開いた。正確に数えて最後のページを出し直す
+            total = counting.count_rows(cur, count_query, estimate_query, filter_params, version, force_exact=True)
+            page = max((total.count + per_page - 1) // per_page, 1)
+            offset = (page - 1) * per_page
+            queries.execute(cur, page_query, filter_params + (per_page, offset))
+            rows = records.fetch_records(cur, records.ItemListRow)
+
+        result = (rows, counting.exact_from_page(total, offset, len(rows), per_page), page)
+    except (psycopg2.Error, Exception) as e:
+        current_app.logger.error(f"Database error in get_item_page_from_db: {e}\n{traceback.format_exc()}")
+        flash("データベースからのアイテム取得中にエラーが発生しました。", "danger")
+    finally:
+        if conn:
+            if 'cur' in locals() and cur and not cur.closed:
+                cur.close()
+            conn.close()
+    return result
+
 @bp.route('/')
+@read_only
 def index():
     # --- ここから修正 ---
     # デフォルト値をconfigから読み込むように変更
@@ -130,37 +115,58 @@ def index():
     category_filter = request.args.get('category', None)
     # --- ここまで修正 ---
 
-    all_items = get_items_from_db(show_zero, keyword, search_field, sort_by, sort_order, category_filter)
-    total_items_count = len(all_items)
-
-    if per_page > 0:
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_items = all_items[start:end]
-        total_pages = (total_items_count + per_page - 1) // per_page
+    # 版番号が変わっていなければ、ブラウザのキャッシュ (304) や、このプロセスに残っている結果をそのまま使う
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    etag = modified_at = list_version = None
+    if versions:
+        list_version = versioning.version_key(versions, 'items', 'products')
+        modified_at = versioning.last_modified(versions, 'items', 'products')
+        etag = versioning.make_etag('index', list_version, sorted(request.args.items(multi=True)), session.get('username'))
+        # 表示待ちのフラッシュメッセージがある場合は、必ず新しいページを返す
+        if not session.get('_flashes'):
+            not_modified = versioning.not_modified_response(etag, modified_at)
+            if not_modified is not None:
+                return not_modified
+
+    cache_key = (show_zero, keyword, search_field, sort_by, sort_order, category_filter, page, per_page)
+    cached_page = item_list_cache.get(cache_key, list_version) if list_version and per_page > 0 else None
+    if cached_page is not None:
+        paginated_items, total_items_count, total_items_exact, page, total_pages = cached_page
+    elif per_page > 0:
+        # 1ページ分だけを取得し、件数は counting.py の方法で求める (多い場合は見積もり)
+        page_result = get_item_page_from_db(show_zero, keyword, search_field, sort_by, sort_order, category_filter,
+                                            page, per_page, list_version)
+        if page_result is None:
+            paginated_items, total_items_count, total_items_exact, total_pages = [], 0, True, 0
+        else:
+            paginated_items, total, page = page_result
+            total_items_count, total_items_exact = total.count, total.exact
+            total_pages = (total_items_count + per_page - 1) // per_page
+            if list_version:
+                item_list_cache.set(cache_key, list_version,
+                                    (paginated_items, total_items_count, total_items_exact, page, total_pages))
     else:
-        paginated_items = all_items
+        # 全件表示
+        paginated_items = get_items_from_db(show_zero, keyword, search_field, sort_by, sort_order, category_filter) or []
+        total_items_count, total_items_exact = len(paginated_items), True
         total_pages = 1 if total_items_count > 0 else 0
-    
-    if page > total_pages and total_pages > 0:
-        page = total_pages
-        if per_page > 0:
-            start = (page - 1) * per_page
-            end = start + per_page
-            paginated_items = all_items[start:end]
-
-    return render_template('main/index.html',
+
+    response = make_response(render_template('main/index.html',
                            items=paginated_items,
                            page=page,
                            per_page=per_page,
                            total_pages=total_pages,
                            total_items=total_items_count,
+                           total_items_exact=total_items_exact,
                            show_zero=show_zero,
                            keyword=keyword,
                            search_field=search_field,
                            sort_key=sort_by,
                            sort_order=sort_order,
-                           category_filter=category_filter)
+                           category_filter=category_filter))
+    if etag:
+        versioning.set_validators(response, etag, modified_at)
+    return response
 
 @bp.route('/add_variant/<int:id>')
 @login_required
@@ -205,16 +211,13 @@ def add_item_variant(id):
                            prefill_card_id=item_data.get('card_id'),
                            prefill_category=item_data.get('category'),
                            prefill_stock=item_data.get('stock', 1),
-                           rarities=config.DEFINED_RARITIES,
-                           product_names=get_all_product_names()
+                           rarities=config.DEFINED_RARITIES
                            )
     # --- ここまで修正 ---
     
 @bp.route('/add', methods=('GET', 'POST'))
 @login_required
 def add_item():
-    product_names = get_all_product_names()
-
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
         card_id = request.form.get('card_id', '').strip() or None
@@ -231,8 +234,7 @@ def add_item():
             return render_template('main/add_item.html',
                                    prefill_name=name, prefill_card_id=card_id, prefill_category=category,
                                    prefill_stock=stock, rarities=config.DEFINED_RARITIES,
-                                   selected_rarity=rare_select, custom_rarity_value=rare_custom,
-                                   product_names=product_names)
+                                   selected_rarity=rare_select, custom_rarity_value=rare_custom)
             # --- ここまで修正 ---
 
         name_normalized = normalize_for_search(name)
@@ -265,22 +267,18 @@ def add_item():
         return render_template('main/add_item.html',
                                prefill_name=name, prefill_card_id=card_id, prefill_category=category,
                                prefill_stock=stock, rarities=config.DEFINED_RARITIES,
-                               selected_rarity=rare_select, custom_rarity_value=rare_custom,
-                               product_names=product_names)
+                               selected_rarity=rare_select, custom_rarity_value=rare_custom)
         # --- ここまで修正 ---
 
     # --- ここから修正 ---
     # raritiesをconfigから読み込むように変更
     return render_template('main/add_item.html',
-                           rarities=config.DEFINED_RARITIES,
-                           product_names=product_names)
+                           rarities=config.DEFINED_RARITIES)
     # --- ここまで修正 ---
 
 @bp.route('/edit/<int:item_id>', methods=('GET', 'POST'))
 @login_required
 def edit_item(item_id):
-    product_names = get_all_product_names()
-    
     def get_item(id):
         conn = db.get_db_connection()
         cur = conn.cursor()
@@ -334,8 +332,7 @@ def edit_item(item_id):
     # raritiesをconfigから読み込むように変更
     return render_template('main/edit_item.html',
                            item=item,
-                           rarities=config.DEFINED_RARITIES,
-                           product_names=product_names)
+                           rarities=config.DEFINED_RARITIES)
     # --- ここまで修正 ---
 
 # (以降の delete_item や API などの関数は変更なし)
@@ -412,18 +409,25 @@ def update_stock(item_id):
 
 @bp.route('/download_csv')
 @login_required
+@read_only
 def download_csv():
+    # items が前回のダウンロードから変わっていなければ 304 を返す
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    etag = modified_at = None
+    if versions:
+        modified_at = versioning.last_modified(versions, 'items')
+        etag = versioning.make_etag('download_csv', versioning.version_key(versions, 'items'))
+        not_modified = versioning.not_modified_response(etag, modified_at)
+        if not_modified is not None:
+            return not_modified
+
     conn = None
     items = []
     try:
         conn = db.get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT 
-                i.id, i.name, i.card_id, i.rare, i.stock, i.category
-            FROM items i
-            ORDER BY i.id
-        """)
+        # 全件を読むので、行はタプルのまま受け取り、そのまま CSV に書き出す
+        cur = records.tuple_cursor(conn)
+        cur.execute(f"SELECT {', '.join('i.' + c for c in records.ITEM_COLUMNS)} FROM items i ORDER BY i.id")
         items = cur.fetchall()
     except (psycopg2.Error, Exception) as e:
         current_app.logger.error(f"Error fetching items for CSV download: {e}\n{traceback.format_exc()}")
@@ -440,21 +444,68 @@ def download_csv():
     cw = csv.writer(si)
     
     headers = ['ID', '名前', 'カードID', 'レアリティ', '在庫数', 'カテゴリ']
-    column_keys = ['id', 'name', 'card_id', 'rare', 'stock', 'category']
     cw.writerow(headers)
-
-    for item_dict in items:
-        row_data = [item_dict[key] if item_dict[key] is not None else '' for key in column_keys]
-        cw.writerow(row_data)
+    # csv.writer は None を空文字として書く
+    cw.writerows(items)
 
     output = make_response(si.getvalue())
     timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d_%H%M%S")
     filename = f"yugioh_inventory_backup_{timestamp}.csv"
     output.headers["Content-Disposition"] = f"attachment; filename=\"{filename}\""
     output.headers["Content-type"] = "text/csv; charset=utf-8"
+    if etag:
+        versioning.set_validators(output, etag, modified_at)
     current_app.logger.info(f"CSV download generated: {filename}")
     return output
 
+@bp.route('/download_snapshot')
+@login_required
+@read_only
+def download_snapshot():
+    """
+    items と対応する製品の情報を、分析用に型付きの列指向形式 (format=parquet または arrow) でダウンロードする。
+    """
+    fmt = request.args.get('format', 'parquet')
+    if fmt not in columnar.FORMATS:
+        abort(400)
+
+    # items / products が前回のダウンロードから変わっていなければ 304 を返す
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    etag = modified_at = None
+    if versions:
+        modified_at = versioning.last_modified(versions, 'items', 'products')
+        etag = versioning.make_etag('download_snapshot', fmt, versioning.version_key(versions, 'items', 'products'))
+        not_modified = versioning.not_modified_response(etag, modified_at)
+        if not_modified is not None:
+            return not_modified
+
+    conn = None
+    try:
+        conn = db.get_db_connection()
+        table = columnar.read_snapshot_table(conn)
+        conn.rollback()
+    except columnar.ColumnarExportUnavailable as e:
+        flash(str(e), "danger")
+        return redirect(url_for('main.index'))
+    except (psycopg2.Error, Exception) as e:
+        current_app.logger.error(f"Error building columnar snapshot: {e}\n{traceback.format_exc()}")
+        flash("エクスポート用のデータ取得中にエラーが発生しました。", "danger")
+        return redirect(url_for('main.index'))
+    finally:
+        if conn:
+            conn.close()
+
+    # 大きなファイルもメモリに置き続けないよう、一時ファイルに書いてから送る
+    spool = tempfile.SpooledTemporaryFile(max_size=config.CSV_UPLOAD_SPOOL_MEMORY_BYTES)
+    columnar.write_snapshot(table, spool, fmt)
+    spool.seek(0)
+    filename = columnar.snapshot_filename(fmt)
+    response = send_file(spool, mimetype=columnar.FORMATS[fmt][1], as_attachment=True, download_name=filename)
+    if etag:
+        versioning.set_validators(response, etag, modified_at)
+    current_app.logger.info(f"Columnar snapshot generated: {filename} ({table.num_rows} rows)")
+    return response
+
 @bp.route('/api/update_stock/<int:item_id>', methods=['POST'])
 @login_required
 def api_update_stock(item_id):
@@ -471,7 +522,7 @@ def api_update_stock(item_id):
         conn = db.get_db_connection()
         with conn: 
             with conn.cursor() as cur:
-                cur.execute("SELECT stock FROM items WHERE id = %s FOR UPDATE", (item_id,))
+                queries.execute(cur, 'item_stock_for_update', (item_id,))
                 result = cur.fetchone()
                 
                 if not result:
@@ -484,7 +535,7 @@ def api_update_stock(item_id):
                 
                 new_stock = current_stock + delta
                 
-                cur.execute("UPDATE items SET stock = %s WHERE id = %s", (new_stock, item_id))
+                queries.execute(cur, 'item_set_stock', (new_stock, item_id))
                 current_app.logger.info(f"API: Stock updated for item ID {item_id} to {new_stock}")
         
         return jsonify({'success': True, 'new_stock': new_stock})
@@ -0,0 +1,105 @@
+# app/product_index.py
+# カード追加・編集フォームのカテゴリ入力で使う、製品名の前方一致候補のためのプロセス内インデックス。
+# 製品名と表示名を正規化したキーでソートした配列に持ち、bisect で前方一致の範囲を探す。
+# products の版番号 (versioning.py) が変わったときだけ作り直すので、候補の検索では DB を読まない。
+import bisect
+import threading
+import time
+
+import psycopg2
+from flask import current_app
+
+from . import config, queries, versioning
+from .db import get_db_connection
+from .utils import normalize_for_search
+
+
+class ProductNameIndex:
+    """ 製品名・表示名の前方一致検索用のソート済み配列 """
+
+    def __init__(self, rows):
+        entries = set()
+        self.display_names = {}
+        for name, display_name in rows:
+            self.display_names[name] = display_name
+            for text in (name, display_name):
+                key = normalize_for_search(text)
+                if key:
+                    entries.add((key, name))
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.names = [name for _, name in entries]
+
+    def __len__(self):
+        return len(self.display_names)
+
+    def search(self, query, limit=10):
+        """
+        正規化した query で始まる製品名を最大 limit 件返す。
+        完全に一致するものを先に、残りはキーの順に並べる。同じ製品は1回だけ返す。
+        """
+        prefix = normalize_for_search(query)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        exact = []
+        others = []
+        seen = set()
+        for position in range(start, len(self.keys)):
+            key = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            name = self.names[position]
+            if name in seen:
+                continue
+            seen.add(name)
+            (exact if key == prefix else others).append(name)
+            # prefix と一致するキーは範囲の先頭に並ぶので、これより後ろに完全一致は出てこない
+            if len(exact) + len(others) >= limit:
+                break
+        return (exact + others)[:limit]
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+_index_loaded_at = 0.0
+
+
+def _load_index():
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        queries.execute(cur, 'product_names')
+        return ProductNameIndex((row['name'], row['display_name']) for row in cur.fetchall())
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+
+def get_product_index():
+    """
+    現在の products に対応するインデックスを返す。
+    版番号が読めない場合 (マイグレーション未適用など) は、PRODUCT_INDEX_FALLBACK_TTL_SECONDS 秒ごとに作り直す。
+    読み込みに失敗した場合は、前回のインデックス (なければ空) を返す。
+    """
+    global _index, _index_version, _index_loaded_at
+    versions = versioning.current_versions()
+    version = versioning.version_key(versions, 'products') if versions else None
+    with _lock:
+        if _index is not None:
+            if version is not None and version == _index_version:
+                return _index
+            if version is None and time.monotonic() - _index_loaded_at < config.PRODUCT_INDEX_FALLBACK_TTL_SECONDS:
+                return _index
+        try:
+            _index = _load_index()
+            _index_version = version
+            _index_loaded_at = time.monotonic()
+        except (Exception, psycopg2.Error) as e:
+            current_app.logger.error(f"Error loading product name index: {e}")
+            if _index is None:
+                return ProductNameIndex([])
+        return _index
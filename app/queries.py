@@ -0,0 +1,278 @@
+# app/queries.py
+# 頻繁に実行される SQL を一度だけ定義し、接続ごとに PREPARE して名前で実行するためのレジストリ。
+# PostgreSQL の PREPARE はセッション (接続) 単位なので、プールされた接続が
+# PREPARE 済みの文の名前を prepared_statements に覚えておき、初回だけ PREPARE する。
+import re
+
+import psycopg2.errors
+
+from . import config
+from .utils import normalize_for_search
+
+# 一覧画面で指定できるソートキー (config.DEFAULT_SORT_KEY もこの中から選ぶ)
+ITEM_LIST_SORT_KEYS = ["name", "card_id", "rare", "stock", "id", "category", "release_date"]
+# 一覧画面のキーワード検索の対象 ('none' はキーワードなし)
+ITEM_LIST_SEARCH_FIELDS = ["none", "name", "card_id", "category", "rare", "all"]
+
+# 一覧系の文で共通の引数:
+#   $1 text     カテゴリ (絞り込みの形が category / in_stock_category の場合だけ使う)
+#   $2 text     正規化済みキーワードの LIKE パターン
+#   $3 text     小文字化したキーワードの LIKE パターン
+ITEM_LIST_PARAM_TYPES = ('text', 'text', 'text')
+
+_ITEM_LIST_SELECT = """
+    SELECT
+        i.id, i.name, i.card_id, i.rare, i.stock, i.category,
+        p.release_date, p.era, p.display_name, p.show_in_sidebar
+    FROM items i
+    LEFT JOIN products p ON LOWER(TRIM(i.category)) = LOWER(TRIM(p.name))
+    WHERE TRUE
+"""
+
+# 在庫0を表示するか・カテゴリで絞り込むかは、キーワードの検索対象と同じく文の形にする。
+# ($1 OR ...) / ($1 IS NULL OR ...) のような条件を引数で切り替えると、汎用の実行計画では索引を使えないため
+ITEM_LIST_FILTER_CONDITIONS = {
+    'all': "",
+    'in_stock': " AND i.stock > 0",
+    'category': " AND i.category = $1",
+    'in_stock_category': " AND i.stock > 0 AND i.category = $1",
+}
+
+_ITEM_LIST_KEYWORD_CONDITIONS = {
+    'none': "",
+    'name': " AND i.name_normalized LIKE $2",
+    'card_id': " AND i.card_id_normalized LIKE $2",
+    'category': " AND LOWER(i.category) LIKE $3",
+    'rare': " AND LOWER(i.rare) LIKE $3",
+    'all': """ AND (i.name_normalized LIKE $2
+                OR i.card_id_normalized LIKE $2
+                OR LOWER(i.rare) LIKE $3
+                OR LOWER(i.category) LIKE $3)""",
+    # キーワードを検索インデックス (search_index.py) で id に解決した場合。$2 は一致した id の配列
+    'ids': " AND i.id = ANY($2)",
+    'all_ids': """ AND (i.id = ANY($2)
+                OR LOWER(i.rare) LIKE $3
+                OR LOWER(i.category) LIKE $3)""",
+}
+
+# 検索インデックスで id に解決した場合に使う検索対象 (元の検索対象 -> 文の検索対象) と、その引数の型
+ITEM_LIST_ID_SEARCH_FIELDS = {'name': 'ids', 'card_id': 'ids', 'all': 'all_ids'}
+ITEM_LIST_ID_PARAM_TYPES = ('text', 'integer[]', 'text')
+
+
+class PreparedQuery:
+    """ PREPARE する文の定義。sql は $1, $2 ... 形式のプレースホルダを使う。 """
+    __slots__ = ('name', 'sql', 'param_types', 'direct_sql')
+
+    def __init__(self, name, sql, param_types=()):
+        self.name = name
+        self.sql = sql
+        self.param_types = tuple(param_types)
+        # PREPARE を使わない場合に psycopg2 へそのまま渡す形 ($1 -> %(p1)s)
+        self.direct_sql = re.sub(r'\$(\d+)', r'%(p\1)s', sql.replace('%', '%%'))
+
+    def prepare_statement(self):
+        if self.param_types:
+            return f"PREPARE {self.name} ({', '.join(self.param_types)}) AS {self.sql}"
+        return f"PREPARE {self.name} AS {self.sql}"
+
+    def execute_statement(self):
+        if self.param_types:
+            return f"EXECUTE {self.name} ({', '.join(['%s'] * len(self.param_types))})"
+        return f"EXECUTE {self.name}"
+
+    def direct_params(self, params):
+        return {f"p{i}": value for i, value in enumerate(params, start=1)}
+
+
+REGISTRY = {}
+
+def register(name, sql, param_types=()):
+    REGISTRY[name] = PreparedQuery(name, sql, param_types)
+    return REGISTRY[name]
+
+def execute(cur, name, params=()):
+    """
+    登録済みの文を名前で実行する。
+    この接続でまだ PREPARE していなければ、先に PREPARE する。
+    """
+    _execute(cur, REGISTRY[name], params)
+
+def estimate_rows(cur, name, params=()):
+    """
+    登録済みの文を実際には実行せず、プランナーが見積もった結果の行数 (EXPLAIN の Plan Rows) を返す。
+    統計情報 (pg_class.reltuples や列ごとの分布) から求めた値なので、正確な件数ではない。
+    """
+    _execute(cur, REGISTRY[name], params, prefix="EXPLAIN (FORMAT JSON) ")
+    plan = cur.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def _execute(cur, query, params, prefix=""):
+    if not config.DB_USE_PREPARED_STATEMENTS:
+        cur.execute(prefix + query.direct_sql, query.direct_params(params))
+        return
+
+    prepared = getattr(cur.connection, 'prepared_statements', None)
+    if prepared is None or query.name not in prepared:
+        cur.execute(query.prepare_statement())
+        if prepared is not None:
+            prepared.add(query.name)
+    try:
+        cur.execute(prefix + query.execute_statement(), tuple(params))
+    except psycopg2.errors.InvalidSqlStatementName:
+        # サーバー側で文が破棄されていた場合 (接続の張り直しなど)、次回は PREPARE し直す
+        if prepared is not None:
+            prepared.discard(query.name)
+        raise
+
+
+def item_list_filter_shape(show_zero, category):
+    """ 在庫0の表示とカテゴリの指定から、ITEM_LIST_FILTER_CONDITIONS の形を返す """
+    if category:
+        return 'category' if show_zero else 'in_stock_category'
+    return 'all' if show_zero else 'in_stock'
+
+def item_list_filter_params(show_zero, keyword, search_field, category):
+    """
+    一覧系の検索条件を、使う文の検索対象・絞り込みの形と $1〜$3 の引数にして返す。
+    キーワードがなければ 'none'、検索対象が不正なら 'all' として扱う。
+    """
+    normalized_keyword_like = None
+    lower_keyword_like = None
+    if keyword:
+        normalized_keyword_like = f"%{normalize_for_search(keyword)}%"
+        lower_keyword_like = f"%{keyword.lower()}%"
+        if search_field not in ITEM_LIST_SEARCH_FIELDS or search_field == 'none':
+            search_field = 'all'
+    else:
+        search_field = 'none'
+    filter_shape = item_list_filter_shape(show_zero, category)
+    return search_field, filter_shape, (category or None, normalized_keyword_like, lower_keyword_like)
+
+def _item_list_order_by(sort_by, sort_order):
+    if sort_by == "release_date":
+        return f" ORDER BY CAST(p.release_date AS DATE) {sort_order.upper()} NULLS LAST, i.name ASC"
+    return f" ORDER BY i.{sort_by} {sort_order.upper()}, i.name ASC"
+
+def _item_list_where(search_field, filter_shape):
+    return _ITEM_LIST_SELECT + ITEM_LIST_FILTER_CONDITIONS[filter_shape] + _ITEM_LIST_KEYWORD_CONDITIONS[search_field]
+
+def item_list_query_name(search_field, filter_shape, sort_by, sort_order):
+    """ 検索対象・絞り込みの形・ソート条件から、一覧用の文の名前を返す (引数は検証済みであること) """
+    return f"item_list_{search_field}_{filter_shape}_{sort_by}_{sort_order.lower()}"
+
+def _item_list_param_types(search_field):
+    if search_field in ITEM_LIST_ID_SEARCH_FIELDS.values():
+        return ITEM_LIST_ID_PARAM_TYPES
+    return ITEM_LIST_PARAM_TYPES
+
+def item_list_page_query_name(search_field, filter_shape, sort_by, sort_order):
+    """ 一覧画面の1ページ分 ($4 件数, $5 開始位置) を返す文の名前 """
+    return f"item_list_page_{search_field}_{filter_shape}_{sort_by}_{sort_order.lower()}"
+
+def item_list_count_query_name(search_field, filter_shape):
+    """ 一覧の検索条件に一致する件数を返す文の名前 (ソートには関係しない) """
+    return f"item_list_count_{search_field}_{filter_shape}"
+
+for _search_field in _ITEM_LIST_KEYWORD_CONDITIONS:
+    for _filter_shape in ITEM_LIST_FILTER_CONDITIONS:
+        _where = _item_list_where(_search_field, _filter_shape)
+        for _sort_by in ITEM_LIST_SORT_KEYS:
+            for _sort_order in ("asc", "desc"):
+                register(
+                    item_list_query_name(_search_field, _filter_shape, _sort_by, _sort_order),
+                    _where + _item_list_order_by(_sort_by, _sort_order),
+                    _item_list_param_types(_search_field)
+                )
+                register(
+                    item_list_page_query_name(_search_field, _filter_shape, _sort_by, _sort_order),
+                    _where + _item_list_order_by(_sort_by, _sort_order) + ", i.id ASC LIMIT $4 OFFSET $5",
+                    _item_list_param_types(_search_field) + ('integer', 'integer')
+                )
+        register(
+            item_list_count_query_name(_search_field, _filter_shape),
+            "SELECT COUNT(*) FROM (" + _where + ") AS matched",
+            _item_list_param_types(_search_field)
+        )
+
+# API (/api/v1/items) のキーセットページング用のソートキー: (ソートに使う式, 型)
+# NULL があると行の比較が成り立たないので、値を埋めた式で並べる
+ITEM_API_SORT_KEYS = {
+    'id': ('i.id', 'integer'),
+    'name': ("COALESCE(i.name, '')", 'text'),
+    'stock': ('COALESCE(i.stock, 0)', 'integer'),
+}
+
+def item_api_query_name(search_field, filter_shape, sort_by, sort_order, after_cursor):
+    """ API 用の文の名前。after_cursor が真なら、カーソルより後ろの行を返す形 """
+    return f"item_api_{search_field}_{filter_shape}_{sort_by}_{sort_order.lower()}_{'after' if after_cursor else 'first'}"
+
+# 引数は一覧系と共通の $1〜$3 に続けて、
+#   最初のページ:   $4 件数
+#   2ページ目以降: $4 カーソルのソート値, $5 カーソルの id, $6 件数
+for _search_field in ITEM_LIST_SEARCH_FIELDS:
+    for _filter_shape in ITEM_LIST_FILTER_CONDITIONS:
+        _where = _item_list_where(_search_field, _filter_shape)
+        for _sort_by, (_expression, _type) in ITEM_API_SORT_KEYS.items():
+            for _sort_order in ("asc", "desc"):
+                _order_by = f" ORDER BY {_expression} {_sort_order.upper()}, i.id {_sort_order.upper()}"
+                register(
+                    item_api_query_name(_search_field, _filter_shape, _sort_by, _sort_order, False),
+                    _where + _order_by + " LIMIT $4",
+                    ITEM_LIST_PARAM_TYPES + ('integer',)
+                )
+                register(
+                    item_api_query_name(_search_field, _filter_shape, _sort_by, _sort_order, True),
+                    _where + f" AND ({_expression}, i.id) {'>' if _sort_order == 'asc' else '<'} ($4, $5)"
+                    + _order_by + " LIMIT $6",
+                    ITEM_LIST_PARAM_TYPES + (_type, 'integer', 'integer')
+                )
+
+# 在庫一括登録画面 (カテゴリの部分一致)。$1 は小文字化したカテゴリの LIKE パターン
+register(
+    'category_items',
+    "SELECT id FROM items WHERE LOWER(category) LIKE $1",
+    ('text',)
+)
+
+register(
+    'category_items_count',
+    "SELECT COUNT(*) FROM items WHERE LOWER(category) LIKE $1",
+    ('text',)
+)
+
+register(
+    'item_stock_for_update',
+    "SELECT stock FROM items WHERE id = $1 FOR UPDATE",
+    ('integer',)
+)
+
+register(
+    'item_set_stock',
+    "UPDATE items SET stock = $1 WHERE id = $2",
+    ('integer', 'integer')
+)
+
+register(
+    'sidebar_products',
+    """
+    SELECT name, display_name, era, release_date, LOWER(TRIM(name)) AS category_key FROM products
+    WHERE show_in_sidebar = TRUE
+    ORDER BY era DESC NULLS LAST, release_date DESC, name ASC
+    """
+)
+
+register(
+    'product_names',
+    "SELECT name, display_name FROM products WHERE name IS NOT NULL AND name != '' ORDER BY name ASC"
+)
+
+register(
+    'table_versions',
+    # 接続ごとの行 (migrations/008_table_version_slots.sql) の合計が、そのテーブルの版番号
+    """
+    SELECT table_name, SUM(version)::bigint AS version, MAX(updated_at) AS updated_at
+    FROM table_version_slots
+    GROUP BY table_name
+    """
+)
@@ -0,0 +1,37 @@
+# app/records.py
+# 一覧・エクスポートなど、行数の多い処理で使う軽い行の表現。
+# 接続の既定のカーソル (DictCursor) は行ごとに列名の対応表を持つ DictRow を作るので、件数が多いとメモリと時間がかかる。
+# ここではタプルを返すカーソルで読み、列名で属性アクセスできる namedtuple の行に詰め替える。
+# テンプレートは item.name のような属性アクセスのまま使え、CSV にはタプルのまま書き出せる。
+# 列名の文字列での参照 (row['name']) はできないので、使う側は属性か位置で参照すること。
+import collections
+
+from .instrumentation import InstrumentedCursor
+
+# items の基本の列 (CSV バックアップ・在庫一括登録と同じ並び)
+ITEM_COLUMNS = ('id', 'name', 'card_id', 'rare', 'stock', 'category')
+# 一覧画面の列 (queries._ITEM_LIST_SELECT と同じ並び)
+ITEM_LIST_COLUMNS = ITEM_COLUMNS + ('release_date', 'era', 'display_name', 'show_in_sidebar')
+# 製品マスタのエクスポートの列
+PRODUCT_COLUMNS = ('name', 'display_name', 'release_date', 'era', 'show_in_sidebar')
+
+
+class ItemRow(collections.namedtuple('ItemRow', ITEM_COLUMNS)):
+    __slots__ = ()
+
+
+class ItemListRow(collections.namedtuple('ItemListRow', ITEM_LIST_COLUMNS)):
+    __slots__ = ()
+
+
+class ProductRow(collections.namedtuple('ProductRow', PRODUCT_COLUMNS)):
+    __slots__ = ()
+
+
+def tuple_cursor(conn):
+    """ 行をタプルで返す (計測付きの) カーソル """
+    return conn.cursor(cursor_factory=InstrumentedCursor)
+
+def fetch_records(cur, record_type):
+    """ tuple_cursor で実行した結果の残りの行を record_type のリストにして返す """
+    return list(map(record_type._make, cur.fetchall()))
@@ -0,0 +1,101 @@
+# app/replica.py
+# 一覧・検索・エクスポートなどの読み取り専用の画面を、読み取り専用のレプリカ (DATABASE_REPLICA_URL) に振り分ける。
+#   - @read_only を付けた画面の中で get_db_connection() を呼ぶと、レプリカの接続が返る
+#   - 更新系のリクエスト (GET/HEAD/OPTIONS 以外) の後しばらくは、そのセッションの読み取りもプライマリで行う
+#     (追加した直後に一覧へ戻ったとき、まだレプリカに届いていない変更が見えなくならないように)
+#   - レプリカの遅延が REPLICA_MAX_LAG_SECONDS を超えている間は、すべてプライマリで処理する
+# DATABASE_REPLICA_URL を設定しなければ、これまでどおりすべてプライマリで処理する。
+import functools
+import threading
+import time
+
+import psycopg2
+from flask import current_app, g, has_request_context, request, session
+
+from . import config, db
+
+# 最後に更新系のリクエストを処理した時刻 (time.time()) を入れるセッションのキー
+_LAST_WRITE_SESSION_KEY = 'last_write_at'
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_lag_lock = threading.Lock()
+# (遅延の秒数 (測れなかった場合は None), 測った時刻 (time.monotonic()))
+_lag_sample = (None, None)
+
+
+def read_only(view):
+    """ 画面の中で行う DB の読み取りを、可能ならレプリカで行う """
+    @functools.wraps(view)
+    def wrapped_view(*args, **kwargs):
+        g.read_only_request = True
+        return view(*args, **kwargs)
+    return wrapped_view
+
+
+def _measure_lag():
+    """
+    レプリカの遅延 (秒) を測る。受信済みの WAL をすべて適用済みなら 0。
+    レプリカでない (プライマリを指している) 場合も 0 になる。測れなかった場合は None。
+    """
+    conn = db.get_replica_connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COALESCE(
+                    CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                         ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                    END, 0)
+            """)
+            lag = float(cur.fetchone()[0])
+        conn.rollback()
+        return lag
+    except psycopg2.Error as e:
+        current_app.logger.warning(f"Could not measure replica lag: {e}")
+        return None
+    finally:
+        conn.close()
+
+def replica_lag_seconds():
+    """ レプリカの遅延 (秒)。REPLICA_LAG_CHECK_INTERVAL_SECONDS の間は前回測った値を使う """
+    global _lag_sample
+    lag, measured_at = _lag_sample
+    now = time.monotonic()
+    if measured_at is not None and now - measured_at < config.REPLICA_LAG_CHECK_INTERVAL_SECONDS:
+        return lag
+    with _lag_lock:
+        lag, measured_at = _lag_sample
+        if measured_at is None or now - measured_at >= config.REPLICA_LAG_CHECK_INTERVAL_SECONDS:
+            lag = _measure_lag()
+            _lag_sample = (lag, time.monotonic())
+            if lag is not None and lag > config.REPLICA_MAX_LAG_SECONDS:
+                current_app.logger.warning(f"Replica lag {lag:.1f}s exceeds {config.REPLICA_MAX_LAG_SECONDS}s; reading from the primary")
+    return lag
+
+def should_use_replica():
+    """ 現在のリクエストの読み取りをレプリカで行うか """
+    if not has_request_context() or not g.get('read_only_request') or not db.get_replica_url():
+        return False
+    if 'use_replica' in g:
+        return g.use_replica
+    use_replica = False
+    last_write_at = session.get(_LAST_WRITE_SESSION_KEY)
+    if last_write_at is None or time.time() - last_write_at >= config.REPLICA_READ_YOUR_WRITES_SECONDS:
+        lag = replica_lag_seconds()
+        use_replica = lag is not None and lag <= config.REPLICA_MAX_LAG_SECONDS
+    # 同じリクエストの中では、途中で接続先が変わらないようにする
+    g.use_replica = use_replica
+    return use_replica
+
+
+def init_app(app):
+    """ 更新系のリクエストの後にセッションへ時刻を記録する処理を登録し、get_db_connection の振り分けを有効にする """
+
+    @app.after_request
+    def remember_write(response):
+        if db.get_replica_url() and request.method not in _SAFE_METHODS:
+            session[_LAST_WRITE_SESSION_KEY] = time.time()
+        return response
+
+    db.set_read_router(should_use_replica)
@@ -0,0 +1,95 @@
+# app/rollups.py
+# 製品ごとの在庫の集計 (migrations/004_product_stock_rollups.sql, 010_product_stock_rollup_slots.sql) を読む処理。
+# 集計はトリガーが items の変更に合わせて接続ごとの行に増減を書き込み、product_stock_rollups (ビュー) がそれを合計する。
+# ここでは集計を読むだけで、items 全体は走査しない。
+# rebuild_rollups.py からも使うので、Flask には依存させずカーソルだけを受け取る。
+import psycopg2.errors
+
+
+class ProductRollup:
+    """ 1製品分の集計。by_rarity は {レアリティ: (カード種類数, 在庫ありの種類数, 在庫枚数)} """
+    __slots__ = ('item_rows', 'in_stock_rows', 'total_stock', 'by_rarity')
+
+    def __init__(self):
+        self.item_rows = 0
+        self.in_stock_rows = 0
+        self.total_stock = 0
+        self.by_rarity = {}
+
+    def add(self, rare, item_rows, in_stock_rows, total_stock):
+        self.item_rows += item_rows
+        self.in_stock_rows += in_stock_rows
+        self.total_stock += total_stock
+        self.by_rarity[rare] = (item_rows, in_stock_rows, total_stock)
+
+    @property
+    def completion_percent(self):
+        """ 登録されているカード (Wikiから取り込んだリストなど) のうち、在庫があるものの割合 """
+        if not self.item_rows:
+            return 0.0
+        return self.in_stock_rows * 100.0 / self.item_rows
+
+
+def fetch_rollups(cur, category_keys=None):
+    """
+    {category_key: ProductRollup} を返す。category_key は製品名を LOWER(TRIM(...)) したもの。
+    category_keys を渡すと、その製品の分だけを読む (一覧の1ページ分など)。
+    集計テーブルがまだない (マイグレーション未適用) 場合は None を返す。
+    呼び出し側の接続はエラーのまま残らないよう、その場合はロールバックする。
+    """
+    query = "SELECT category_key, rare, item_rows, in_stock_rows, total_stock FROM product_stock_rollups"
+    params = ()
+    if category_keys is not None:
+        query += " WHERE category_key = ANY(%s)"
+        params = (list(category_keys),)
+    try:
+        cur.execute(query + " ORDER BY category_key, rare", params)
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        return None
+    rollups = {}
+    for category_key, rare, item_rows, in_stock_rows, total_stock in cur.fetchall():
+        rollup = rollups.get(category_key)
+        if rollup is None:
+            rollup = rollups[category_key] = ProductRollup()
+        rollup.add(rare, item_rows, in_stock_rows, total_stock)
+    return rollups
+
+
+def find_drift(cur):
+    """
+    集計テーブルと、items から数え直した値が食い違っている (category_key, レアリティ) のリストを返す。
+    各要素は (category_key, レアリティ, 集計テーブルの値, 数え直した値) で、値は (種類数, 在庫ありの種類数, 在庫枚数) か None。
+    """
+    cur.execute("""
+        WITH actual AS (
+            SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+                   COUNT(*) AS item_rows, COUNT(*) FILTER (WHERE stock > 0) AS in_stock_rows,
+                   COALESCE(SUM(stock), 0) AS total_stock
+            FROM items
+            GROUP BY 1, 2
+        )
+        SELECT COALESCE(r.category_key, a.category_key), COALESCE(r.rare, a.rare),
+               r.item_rows, r.in_stock_rows, r.total_stock,
+               a.item_rows, a.in_stock_rows, a.total_stock
+        FROM product_stock_rollups r
+        FULL OUTER JOIN actual a ON a.category_key = r.category_key AND a.rare = r.rare
+        WHERE (r.item_rows, r.in_stock_rows, r.total_stock) IS DISTINCT FROM (a.item_rows, a.in_stock_rows, a.total_stock)
+        ORDER BY 1, 2
+    """)
+    drift = []
+    for row in cur.fetchall():
+        stored = tuple(row[2:5]) if row[2] is not None else None
+        actual = tuple(row[5:8]) if row[5] is not None else None
+        drift.append((row[0], row[1], stored, actual))
+    return drift
+
+def rebuild(cur):
+    """ 集計を items から作り直し、作った行数を返す (呼び出し側でコミットする) """
+    cur.execute("SELECT rebuild_product_stock_rollups()")
+    return cur.fetchone()[0]
+
+def compact(cur):
+    """ 接続ごとの増減の行を1行にまとめ、まとめた (製品, レアリティ) の数を返す (呼び出し側でコミットする) """
+    cur.execute("SELECT compact_product_stock_rollups()")
+    return cur.fetchone()[0]
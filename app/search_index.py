@@ -0,0 +1,258 @@
+# app/search_index.py
+# 一覧画面のキーワード検索 (カード名・カードIDの部分一致) をプロセス内で id に解決するための n-gram インデックス。
+# name_normalized / card_id_normalized の長さ 1〜ITEM_SEARCH_INDEX_GRAM_SIZE の部分文字列ごとに、
+# その部分文字列を含む行の位置を array('i') に持つ。検索語の n-gram のうち行の少ないものを重ねて候補にし、
+# 候補を部分文字列の一致で確かめるので、LIKE '%キーワード%' と同じ結果を DB を読まずに求められる。
+#
+# 起動時 (warmup.py) に items 全体から作り、以後は items の版番号 (versioning.py) が変わったときだけ、
+# 前回の読み込み以降に変わった行と削除された行 (migrations/003_change_feed.sql の updated_at と tombstone) を反映する。
+# 版番号が読めない・インデックスの更新中・一致が多すぎる場合などは None を返し、呼び出し側は従来どおり SQL の LIKE で探す。
+import threading
+from array import array
+
+import psycopg2
+import psycopg2.errors
+from flask import current_app
+
+from . import changefeed, config, queries, versioning
+from .db import get_primary_connection
+from .utils import normalize_for_search
+
+# インデックスで id に解決できる検索対象
+INDEXED_SEARCH_FIELDS = ('name', 'card_id', 'all')
+# LIKE のパターンとして特別な意味を持つ文字。含む場合は SQL と結果が変わるのでインデックスを使わない
+_LIKE_SPECIAL_CHARACTERS = frozenset('%_\\')
+
+
+class ItemSearchIndex:
+    """
+    カード名・カードID (正規化済み) の部分一致検索用の n-gram インデックス。
+    n-gram の表はカード名とカードIDで別に持つ (カードIDにだけ多い n-gram でカード名の候補が増えないように)。
+    行は追加した順に位置 (0, 1, 2, ...) を持ち、更新・削除した行の位置は ids を 0 にして無効にする。
+    無効な位置が有効な行より多くなったら、残っている行だけで作り直す。
+    """
+
+    def __init__(self, gram_size=None):
+        self.gram_size = gram_size or config.ITEM_SEARCH_INDEX_GRAM_SIZE
+        self.ids = array('i')      # 位置 -> id (無効な位置は 0)
+        self.texts = {'name': [], 'card_id': []}        # 検索対象 -> 位置 -> 正規化した文字列
+        self.postings = {'name': {}, 'card_id': {}}     # 検索対象 -> n-gram -> その n-gram を含む位置の配列 (昇順)
+        self.positions = {}        # id -> 位置
+        self.dead = 0
+        # この日時より前の変更はすべて反映済み (refresh_index で使う)
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _grams(self, text):
+        grams = set()
+        for size in range(1, self.gram_size + 1):
+            for start in range(len(text) - size + 1):
+                grams.add(text[start:start + size])
+        return grams
+
+    def add(self, item_id, name, card_id):
+        """ 行を追加する。同じ id の行があれば置き換える (内容が同じなら何もしない) """
+        values = {'name': name or '', 'card_id': card_id or ''}
+        position = self.positions.get(item_id)
+        if position is not None:
+            if all(self.texts[field][position] == value for field, value in values.items()):
+                return
+            self.ids[position] = 0
+            self.dead += 1
+        position = len(self.ids)
+        self.ids.append(item_id)
+        self.positions[item_id] = position
+        for field, value in values.items():
+            self.texts[field].append(value)
+            postings_by_gram = self.postings[field]
+            for gram in self._grams(value):
+                postings = postings_by_gram.get(gram)
+                if postings is None:
+                    postings = postings_by_gram[gram] = array('i')
+                postings.append(position)
+        if self.dead > len(self.positions) and self.dead > config.ITEM_SEARCH_INDEX_COMPACT_MIN_DEAD:
+            self.compact()
+
+    def remove(self, item_id):
+        position = self.positions.pop(item_id, None)
+        if position is not None:
+            self.ids[position] = 0
+            self.dead += 1
+
+    def compact(self):
+        """ 無効な位置を除いて作り直す """
+        name_texts, card_id_texts = self.texts['name'], self.texts['card_id']
+        live = [(self.ids[p], name_texts[p], card_id_texts[p]) for p in sorted(self.positions.values())]
+        watermark = self.watermark
+        self.__init__(self.gram_size)
+        self.watermark = watermark
+        for row in live:
+            self.add(*row)
+
+    def _candidates(self, term, field):
+        """ term を含む可能性のある位置と、それを確かめる必要があるかを返す """
+        postings_by_gram = self.postings[field]
+        size = min(len(term), self.gram_size)
+        lists = []
+        for start in range(len(term) - size + 1):
+            postings = postings_by_gram.get(term[start:start + size])
+            if postings is None:
+                return (), False
+            lists.append(postings)
+        if len(lists) == 1:
+            # term 自体が n-gram なので、候補はすべて一致している
+            return lists[0], len(term) > self.gram_size
+        lists.sort(key=len)
+        # 行の少ない n-gram から順に重ねて候補を絞る。次の n-gram の行が候補よりずっと多い場合は、
+        # 重ねるより候補をそのまま部分文字列の一致で確かめる方が速いのでそこでやめる
+        candidates = lists[0]
+        for postings in lists[1:]:
+            if len(postings) > len(candidates) * 4:
+                break
+            candidates = set(candidates).intersection(postings)
+        return candidates, True
+
+    def search(self, term, field='all', limit=None):
+        """
+        正規化済みの term を field ('name' / 'card_id' / 'all') に含む行の id を返す。
+        一致が limit 件を超えた場合は None を返す (呼び出し側は SQL で探す)。
+        """
+        ids = self.ids
+        matched = []
+        seen = set() if field == 'all' else None
+        for target in (('name', 'card_id') if field == 'all' else (field,)):
+            candidates, verify = self._candidates(term, target)
+            if not verify and limit is not None and len(candidates) - self.dead > limit:
+                # 確かめなくても limit 件を超えるのがわかっている
+                return None
+            texts = self.texts[target]
+            for position in candidates:
+                item_id = ids[position]
+                if not item_id or (verify and term not in texts[position]):
+                    continue
+                if seen is not None:
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                matched.append(item_id)
+                if limit is not None and len(matched) > limit:
+                    return None
+        return matched
+
+
+_ITEMS_QUERY = "SELECT id, name_normalized, card_id_normalized FROM items"
+
+def load_index(cur, gram_size=None):
+    """ items 全体からインデックスを作る """
+    index = ItemSearchIndex(gram_size)
+    # 読み込みより前に上限を求めておけば、読み込みと前後した変更も次の refresh_index で拾える
+    index.watermark = changefeed.safe_upper_bound(cur)
+    cur.execute(_ITEMS_QUERY)
+    for row in cur.fetchall():
+        index.add(row[0], row[1], row[2])
+    return index
+
+def refresh_index(index, cur):
+    """
+    watermark 以降に変わった行・削除された行をインデックスに反映する。
+    反映済みの行をもう一度読むことはあるが、内容が同じなら add は何もしないので結果は変わらない。
+    """
+    upper_bound = changefeed.safe_upper_bound(cur)
+    cur.execute("""
+        SELECT t.id FROM item_tombstones t
+        WHERE t.deleted_at >= %s AND NOT EXISTS (SELECT 1 FROM items x WHERE x.id = t.id)
+    """, (index.watermark,))
+    deleted = [row[0] for row in cur.fetchall()]
+    cur.execute(_ITEMS_QUERY + " WHERE updated_at >= %s", (index.watermark,))
+    changed = cur.fetchall()
+    for item_id in deleted:
+        index.remove(item_id)
+    for row in changed:
+        index.add(row[0], row[1], row[2])
+    index.watermark = upper_bound
+    return len(deleted), len(changed)
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def _current_index(version):
+    """ items の版番号 version に追いついたインデックスを返す (_lock を持った状態で呼ぶ) """
+    global _index, _index_version
+    if _index is not None and version <= _index_version:
+        return _index
+    conn = None
+    try:
+        # @read_only の画面から呼ばれても、変更を読む上限 (changefeed.safe_upper_bound) は
+        # 書き込み中のトランザクションが見えるプライマリでしか正しく求められないので、プライマリから読む
+        conn = get_primary_connection()
+        cur = conn.cursor()
+        if _index is None:
+            _index = load_index(cur)
+            current_app.logger.info(f"Item search index loaded: {len(_index)} items")
+        else:
+            try:
+                refresh_index(_index, cur)
+            except (psycopg2.errors.UndefinedColumn, psycopg2.errors.UndefinedTable):
+                # 変更フィードのマイグレーションが未適用。版番号が変わるたびに全体を読み直す
+                conn.rollback()
+                _index = load_index(cur)
+        conn.rollback()
+        _index_version = version
+        return _index
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+
+def match_item_ids(keyword, search_field):
+    """
+    一覧のキーワード検索の結果を、インデックスで id のリストに解決する。
+    インデックスが使えない場合・一致が ITEM_SEARCH_INDEX_MAX_IDS 件を超える場合は None を返す。
+    """
+    if not config.ITEM_SEARCH_INDEX_ENABLED or search_field not in INDEXED_SEARCH_FIELDS:
+        return None
+    term = normalize_for_search(keyword)
+    if not term or not _LIKE_SPECIAL_CHARACTERS.isdisjoint(term):
+        return None
+    versions = versioning.current_versions()
+    if not versions:
+        # 版番号が読めないと、インデックスが最新か確かめられない
+        return None
+    # 別のスレッドがインデックスを更新している間は待たずに SQL で探す
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        index = _current_index(versioning.version_key(versions, 'items'))
+        return index.search(term, search_field, config.ITEM_SEARCH_INDEX_MAX_IDS)
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Error updating item search index: {e}")
+        return None
+    finally:
+        _lock.release()
+
+def item_list_filter_params(show_zero, keyword, search_field, category):
+    """
+    queries.item_list_filter_params と同じ形 (検索対象, 絞り込みの形, $1〜$3) を返す。
+    キーワードをインデックスで id に解決できた場合は、$2 を id の配列にした文の検索対象を返す。
+    """
+    search_field, filter_shape, params = queries.item_list_filter_params(show_zero, keyword, search_field, category)
+    ids = match_item_ids(keyword, search_field) if keyword else None
+    if ids is None:
+        return search_field, filter_shape, params
+    return queries.ITEM_LIST_ID_SEARCH_FIELDS[search_field], filter_shape, (params[0], ids, params[2])
+
+def warm_up():
+    """ ウォームアップ用: 有効な場合、インデックスを作っておく """
+    if not config.ITEM_SEARCH_INDEX_ENABLED:
+        return
+    versions = versioning.current_versions()
+    if not versions:
+        return
+    with _lock:
+        _current_index(versioning.version_key(versions, 'items'))
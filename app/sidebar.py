@@ -0,0 +1,46 @@
+# app/sidebar.py
+# サイドバーに表示する製品の一覧 (期ごと) を組み立てる処理。
+# 全ページのテンプレートから使うので、products / items の版番号が変わるまでは前回の結果を使い回す。
+from collections import defaultdict
+
+import psycopg2
+from flask import current_app
+
+from . import config, queries, rollups, versioning
+from .cache import sidebar_cache
+from .db import get_db_connection
+
+
+def get_sidebar_data():
+    """ {期: [製品 (在庫の集計 rollup 付き), ...]} を返す。読み込みに失敗した場合は空 """
+    # 在庫の集計も表示するので、items の変更でも作り直す
+    versions = versioning.current_versions() if config.RESPONSE_CACHE_ENABLED else None
+    sidebar_version = versioning.version_key(versions, 'products', 'items') if versions else None
+    grouped_by_era = sidebar_cache.get('sidebar', sidebar_version) if sidebar_version else None
+    if grouped_by_era is not None:
+        return grouped_by_era
+
+    conn = None
+    grouped_by_era = defaultdict(list)
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        queries.execute(cur, 'sidebar_products')
+        sidebar_products = cur.fetchall()
+        product_rollups = rollups.fetch_rollups(cur) or {}
+        for product in sidebar_products:
+            era = product['era']
+            if era:
+                product = dict(product)
+                product['rollup'] = product_rollups.get(product['category_key'])
+                grouped_by_era[era].append(product)
+        if sidebar_version:
+            sidebar_cache.set('sidebar', sidebar_version, grouped_by_era)
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Sidebar data fetching failed: {e}")
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+    return grouped_by_era
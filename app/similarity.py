@@ -0,0 +1,57 @@
+# app/similarity.py
+# pg_trgm と同じ考え方のトライグラム類似度。
+# データベースに pg_trgm を入れられない環境で、カテゴリ診断の「近い製品名」の候補を求めるのに使う。
+#   - 小文字にして英数字 (日本語の文字を含む) の単語に分け、各単語の前に空白2つ・後ろに空白1つを付ける
+#   - 3文字ずつずらして取り出した集合どうしの、共通部分 / 和集合 を類似度とする
+import re
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """ 文字列のトライグラムの集合 """
+    grams = set()
+    for word in _WORD_RE.findall((text or '').lower()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return frozenset(grams)
+
+def similarity(a, b):
+    """ 2つの文字列の類似度 (0.0〜1.0)。pg_trgm の similarity() に相当する """
+    return _similarity(trigrams(a), trigrams(b))
+
+def _similarity(grams_a, grams_b):
+    if not grams_a or not grams_b:
+        return 0.0
+    common = len(grams_a & grams_b)
+    return common / (len(grams_a) + len(grams_b) - common)
+
+
+def suggest(targets, candidates, limit=3, threshold=0.3):
+    """
+    targets の各文字列について、candidates の中から類似度が threshold 以上のものを高い順に最大 limit 件返す。
+    戻り値: {target: [(candidate, 類似度), ...]}
+    candidates のトライグラムは一度だけ求め、同じトライグラムを持つものだけを比べる。
+    """
+    candidate_grams = [(candidate, trigrams(candidate)) for candidate in candidates]
+    postings = {}
+    for index, (_, grams) in enumerate(candidate_grams):
+        for gram in grams:
+            postings.setdefault(gram, []).append(index)
+
+    results = {}
+    for target in targets:
+        target_grams = trigrams(target)
+        seen = set()
+        for gram in target_grams:
+            seen.update(postings.get(gram, ()))
+        scored = []
+        for index in seen:
+            candidate, grams = candidate_grams[index]
+            score = _similarity(target_grams, grams)
+            if score >= threshold:
+                scored.append((candidate, score))
+        scored.sort(key=lambda pair: (-pair[1], pair[0]))
+        results[target] = scored[:limit]
+    return results
@@ -0,0 +1,51 @@
+// app/static/js/product_suggest.js
+// data-product-suggest-url を持つ入力欄に、入力に合わせて製品名の候補を datalist で表示する。
+// 候補はサーバーの /api/products/suggest から取得し、全製品名をページに埋め込まないようにしている。
+document.addEventListener('DOMContentLoaded', function() {
+  document.querySelectorAll('input[data-product-suggest-url]').forEach(function(input) {
+    const datalist = document.getElementById(input.getAttribute('list'));
+    const url = input.dataset.productSuggestUrl;
+    let timer = null;
+    let lastQuery = null;
+    let controller = null;
+
+    function update() {
+      const query = input.value.trim();
+      if (query === lastQuery) {
+        return;
+      }
+      lastQuery = query;
+      if (controller) {
+        controller.abort();
+      }
+      if (!query) {
+        datalist.innerHTML = '';
+        return;
+      }
+      controller = new AbortController();
+      fetch(url + '?q=' + encodeURIComponent(query), { signal: controller.signal })
+        .then(response => response.json())
+        .then(data => {
+          datalist.innerHTML = '';
+          (data.suggestions || []).forEach(function(product) {
+            const option = document.createElement('option');
+            option.value = product.name;
+            if (product.display_name && product.display_name !== product.name) {
+              option.label = product.display_name;
+            }
+            datalist.appendChild(option);
+          });
+        })
+        .catch(error => {
+          if (error.name !== 'AbortError') {
+            console.error('Error:', error);
+          }
+        });
+    }
+
+    input.addEventListener('input', function() {
+      clearTimeout(timer);
+      timer = setTimeout(update, 150);
+    });
+  });
+});
@@ -0,0 +1,100 @@
+# app/versioning.py
+# トリガーで管理しているテーブルの版番号 (migrations/002_table_versions.sql, 008_table_version_slots.sql) を読み、
+# 条件付き GET (ETag / Last-Modified) とサーバー側キャッシュのキーに使うための処理。
+import functools
+import hashlib
+import os
+
+import psycopg2
+import psycopg2.errors
+from flask import current_app, g, request
+
+from . import queries
+from .db import get_db_connection
+
+TRACKED_TABLES = ('items', 'products')
+
+
+def current_versions():
+    """
+    {テーブル名: (版番号, 最終更新日時)} を返す。1リクエストにつき1回だけ DB から読む。
+    版番号のテーブルがまだない (マイグレーション未適用) などで読めない場合は None を返し、
+    呼び出し側はキャッシュや条件付き GET を使わずに通常どおり処理する。
+    """
+    if 'table_versions' in g:
+        return g.table_versions
+
+    versions = None
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        queries.execute(cur, 'table_versions')
+        versions = {row['table_name']: (row['version'], row['updated_at']) for row in cur.fetchall()}
+        if any(table not in versions for table in TRACKED_TABLES):
+            versions = None
+    except psycopg2.errors.UndefinedTable:
+        current_app.logger.warning("table_version_slots does not exist. Run apply_migrations.py to enable response caching.")
+    except (Exception, psycopg2.Error) as e:
+        current_app.logger.error(f"Error fetching table versions: {e}")
+    finally:
+        if conn:
+            if 'cur' in locals() and not cur.closed:
+                cur.close()
+            conn.close()
+
+    g.table_versions = versions
+    return versions
+
+def version_key(versions, *tables):
+    """ 指定したテーブルの版番号のタプル (キャッシュのキーに使う) """
+    return tuple(versions[table][0] for table in tables)
+
+def last_modified(versions, *tables):
+    """ 指定したテーブルのうち、最後に更新された日時 """
+    return max(versions[table][1] for table in tables)
+
+
+@functools.lru_cache(maxsize=1)
+def _render_salt():
+    """
+    テンプレートやコードを入れ替えたら ETag も変わるよう、app 以下のファイルの更新日時から作る値。
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    latest = 0.0
+    for root, _, files in os.walk(app_dir):
+        for name in files:
+            if name.endswith(('.py', '.html')):
+                latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+    return str(latest)
+
+def make_etag(*parts):
+    """ 応答の内容を決める値 (版番号・検索条件・ユーザーなど) から ETag を作る """
+    return hashlib.sha1(repr((_render_salt(),) + parts).encode('utf-8')).hexdigest()
+
+
+def not_modified_response(etag, modified_at):
+    """
+    リクエストの If-None-Match / If-Modified-Since が現在の内容と一致すれば 304 の応答を返す。
+    一致しなければ None (通常どおり応答を作る)。If-None-Match があればそちらを優先する。
+    """
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and modified_at is not None:
+        matched = modified_at.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    response = current_app.response_class(status=304)
+    set_validators(response, etag, modified_at)
+    return response
+
+def set_validators(response, etag, modified_at):
+    """ 応答に ETag / Last-Modified を付け、毎回再検証させる """
+    response.set_etag(etag, weak=True)
+    if modified_at is not None:
+        response.last_modified = modified_at
+    # ログイン状態で内容が変わるので共有キャッシュには置かせない
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
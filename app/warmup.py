@@ -0,0 +1,120 @@
+# app/warmup.py
+# ワーカーの起動直後に、最初のリクエストで払うことになる準備 (DB 接続・テンプレートのコンパイル・
+# サイドバー・製品名インデックス・カード検索インデックスの読み込み・正規化処理の初期化) を済ませておく処理と、
+# ロードバランサー向けの /healthz (生存確認) と /readyz (準備完了の確認)。
+#
+# gunicorn では gunicorn.conf.py の post_worker_init から warm_up(app) を呼ぶ。
+# 環境変数 WARMUP_ON_START=1 のときは create_app の中で呼ぶ (gunicorn 以外で起動する場合など)。
+import threading
+import time
+
+import psycopg2
+from flask import Blueprint, current_app, jsonify
+
+from . import config, kana, product_index, queries, search_index, sidebar
+from .db import get_db_connection, get_pool, get_replica_url
+from .utils import normalize_for_search
+
+bp = Blueprint('health', __name__)
+
+_lock = threading.Lock()
+_ready = threading.Event()
+# 直近の warm_up の結果: {'steps': {手順名: {'ok': bool, 'ms': 所要時間, 'error': エラー}}, 'finished_at': 時刻}
+_last_result = None
+
+
+def _warm_pool():
+    """ プールの最小接続数ぶんの接続を同時に借りて生存確認し、よく使う文を PREPARE しておく """
+    get_pool()
+    if get_replica_url():
+        # レプリカに繋がらなくてもプライマリで処理できるので、準備完了の条件にはしない
+        try:
+            get_pool('replica')
+        except psycopg2.Error as e:
+            current_app.logger.warning(f"Replica pool could not be created during warm-up: {e}")
+    connections = []
+    try:
+        for _ in range(config.DB_POOL_MIN_CONN):
+            connections.append(get_db_connection())
+        for conn in connections:
+            with conn.cursor() as cur:
+                queries.execute(cur, 'table_versions')
+                cur.fetchall()
+            conn.rollback()
+    finally:
+        for conn in connections:
+            conn.close()
+
+def _warm_templates():
+    env = current_app.jinja_env
+    for name in config.WARMUP_TEMPLATES:
+        env.get_template(name)
+
+def _warm_normalizers():
+    normalize_for_search('ウォームアップ ｗａｒｍ-up')
+    kana.get_hira_converter()
+    kana.get_kata_converter()
+
+# (手順名, 処理)。接続プールを先に作ってから、DB を読む手順を実行する
+WARMUP_STEPS = (
+    ('db_pool', _warm_pool),
+    ('templates', _warm_templates),
+    ('sidebar', sidebar.get_sidebar_data),
+    ('product_index', product_index.get_product_index),
+    ('item_search_index', search_index.warm_up),
+    ('normalizers', _warm_normalizers),
+)
+
+
+def warm_up(app):
+    """
+    WARMUP_STEPS を順に実行する。手順が失敗しても残りは続け、すべて成功したときだけ準備完了にする。
+    別のスレッドで実行中の場合は待たずに False を返す。戻り値は準備完了かどうか。
+    """
+    global _last_result
+    if not _lock.acquire(blocking=False):
+        return _ready.is_set()
+    try:
+        steps = {}
+        with app.test_request_context('/'):
+            for name, step in WARMUP_STEPS:
+                started_at = time.perf_counter()
+                try:
+                    step()
+                    steps[name] = {'ok': True}
+                except Exception as e:
+                    app.logger.error(f"Warm-up step '{name}' failed: {e}")
+                    steps[name] = {'ok': False, 'error': str(e)}
+                steps[name]['ms'] = round((time.perf_counter() - started_at) * 1000, 1)
+        _last_result = {'steps': steps, 'finished_at': time.time()}
+        if all(result['ok'] for result in steps.values()):
+            _ready.set()
+            total_ms = sum(result['ms'] for result in steps.values())
+            app.logger.info(f"Warm-up finished in {total_ms:.1f} ms")
+        return _ready.is_set()
+    finally:
+        _lock.release()
+
+def is_ready():
+    return _ready.is_set()
+
+
+@bp.route('/healthz')
+def healthz():
+    """ プロセスが応答できるか (DB には接続しない) """
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz')
+def readyz():
+    """
+    ウォームアップが済んでいれば 200、まだなら 503 を返す。
+    ウォームアップが失敗していた場合 (起動時に DB に繋がらなかったなど) は、前回から
+    WARMUP_RETRY_INTERVAL_SECONDS 秒以上たっていればここでやり直す。
+    """
+    if not _ready.is_set():
+        if _last_result is None or time.time() - _last_result['finished_at'] >= config.WARMUP_RETRY_INTERVAL_SECONDS:
+            warm_up(current_app._get_current_object())
+    result = _last_result or {'steps': {}}
+    if _ready.is_set():
+        return jsonify({'status': 'ready', 'steps': result['steps']})
+    return jsonify({'status': 'warming_up', 'steps': result['steps']}), 503
@@ -0,0 +1,108 @@
+# apply_migrations.py
+import argparse
+import glob
+import os
+import sys
+import traceback
+from dotenv import load_dotenv
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+def load_environment():
+    """
+    .envまたは.flaskenvファイルから環境変数を読み込む。
+    """
+    for filename in ('.env', '.flaskenv'):
+        dotenv_path = os.path.join(os.path.dirname(__file__), filename)
+        if os.path.exists(dotenv_path):
+            load_dotenv(dotenv_path=dotenv_path)
+            print(f"INFO: {filename} ファイルから環境変数を読み込みました。")
+            return
+    print("WARNING: .env または .flaskenv が見つかりませんでした。システムの環境変数を参照します。")
+
+def list_migration_files():
+    """ migrations/ 以下の SQL ファイルをファイル名順 (=番号順) に返す """
+    return sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')))
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            filename TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+
+def pending_migrations(cur):
+    """ まだ適用されていないマイグレーションファイルのパスを番号順に返す """
+    cur.execute("SELECT filename FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+    return [path for path in list_migration_files() if os.path.basename(path) not in applied]
+
+def apply_migration_files(conn, paths, verbose=True):
+    """ 指定したマイグレーションを1ファイルずつ適用し、ファイルごとにコミットする """
+    with conn.cursor() as cur:
+        for path in paths:
+            filename = os.path.basename(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                sql = f.read()
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (filename,))
+            conn.commit()
+            if verbose:
+                print(f"適用しました: {filename}")
+
+def apply_migrations(assume_yes=False):
+    """
+    未適用のマイグレーションを番号順に1ファイルずつ適用する。
+    適用済みのファイル名は schema_migrations テーブルに記録する。
+    """
+    load_environment()
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("エラー: 環境変数 DATABASE_URL が設定されていません。", file=sys.stderr)
+        return False
+
+    conn = None
+    try:
+        conn = psycopg2.connect(db_url)
+        cur = conn.cursor()
+        ensure_migrations_table(cur)
+        conn.commit()
+
+        pending = pending_migrations(cur)
+        if not pending:
+            print("全てのマイグレーションは適用済みです。")
+            return True
+
+        print("未適用のマイグレーション:")
+        for path in pending:
+            print(f"  - {os.path.basename(path)}")
+        if not assume_yes:
+            proceed = input("これらを適用しますか？ (yes/no): ").strip().lower()
+            if proceed != 'yes':
+                print("処理を中止しました。")
+                return False
+
+        apply_migration_files(conn, pending)
+        return True
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"エラーが発生しました: {e}", file=sys.stderr)
+        traceback.print_exc()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="migrations/ 以下の SQL を順番にデータベースへ適用します。")
+    parser.add_argument('--yes', action='store_true', help="確認を行わずに適用する")
+    args = parser.parse_args()
+
+    print("--- データベース・マイグレーション適用スクリプト ---")
+    success = apply_migrations(assume_yes=args.yes)
+    print("--- スクリプト終了 ---")
+    sys.exit(0 if success else 1)
@@ -0,0 +1,167 @@
+# benchmarks/datagen.py
+# ベンチマーク用の架空のカードカタログを生成する。
+# 同じ seed からは常に同じ製品・カード・CSV が生成されるので、実行結果を時系列で比較できる。
+import csv
+import datetime
+import io
+import random
+import string
+
+from app import config
+from app.data_definitions import calculate_era
+from app.utils import normalize_for_search
+
+NAME_PREFIXES = [
+    "ブラック", "青眼の", "真紅眼の", "E・HERO", "サイバー", "ジャンク", "閃刀姫－", "烙印の", "灰流", "幻影騎士団",
+    "電脳堺", "古代の", "究極", "混沌の", "光の", "暗黒の", "竜騎士", "魔導", "氷結界の", "Ｎｏ．",
+    "ＳＲ", "超重武者", "ＤＤ", "Ｅｍ", "聖なる", "終焉の", "剣闘獣", "ヴァレット", "天威の", "教導の",
+]
+NAME_CORES = [
+    "ドラゴン", "マジシャン", "ウォリアー", "ナイト", "ガーディアン", "エンジェル", "デーモン", "ゴーレム", "ビースト", "サーペント",
+    "シンクロン", "ウィッチ", "パラディン", "ソーサラー", "ファルコン", "タイガー", "フェニックス", "ワイバーン", "ガンナー", "ロード",
+]
+NAME_SUFFIXES = [
+    "", "", "", "・オブ・カオス", "－ネオス", " ＭＫ－２", "・ゼロ", "の守護者", "・リボルト", "・アサルト",
+    "・ネクスト", "の福音", "・オーバーロード", "Ｘ", "・レクイエム",
+]
+
+PRODUCT_WORDS_A = [
+    "ファントム", "バトル", "ライズ", "シャドウ", "クロス", "ダーク", "エターニティ", "ブレイジング", "ディメンション", "ミレニアム",
+    "ジェネシス", "ストーム", "レガシー", "インフィニット", "サイバネティック", "エクシーズ", "オリジン", "フォトン", "ギャラクシー", "ヴォルテックス",
+]
+PRODUCT_WORDS_B = [
+    "ナイトメア", "オブ・カオス", "オブ・ザ・デュエリスト", "リベリオン", "インパクト", "フォース", "コード", "ボルテックス", "ハーツ", "レボリューション",
+    "オーバーロード", "ストライク", "ディスティニー", "アライアンス", "クロニクル",
+]
+PRODUCT_KINDS = ["", "", "", "ストラクチャーデッキ－", "デュエリストパック－", "プロモーションパック－"]
+
+# 実際の在庫に近い出現頻度になるよう、低レアほど重みを大きくしている
+RARITY_WEIGHTS = [
+    ("N", 40), ("R", 15), ("SR", 12), ("UR", 10), ("SE", 8), ("N-P", 4), ("UL", 3), ("PSE", 2),
+    ("GR", 1), ("HR", 1), ("20thSE", 1), ("QCSE", 1), ("CR", 1), ("KC", 1),
+]
+# CSV インポート用に、変換ルール (RARITY_CONVERSION_MAP) を通る表記も混ぜる
+RAW_RARITY_WEIGHTS = RARITY_WEIGHTS + [("ウルトラ", 5), ("Secret", 3), ("ノーマル", 5), ("スーパー", 3)]
+
+IMPORT_CSV_HEADERS = ['名前', '型番', 'レアリティ', '在庫数', 'カテゴリ']
+
+
+def _weighted_choice(rng, weighted):
+    values = [value for value, _ in weighted]
+    weights = [weight for _, weight in weighted]
+    return rng.choices(values, weights=weights, k=1)[0]
+
+def _card_name(rng):
+    return rng.choice(NAME_PREFIXES) + rng.choice(NAME_CORES) + rng.choice(NAME_SUFFIXES)
+
+def _stock(rng):
+    # 半分近くは在庫0、残りは少数枚が中心
+    roll = rng.random()
+    if roll < 0.4:
+        return 0
+    if roll < 0.9:
+        return rng.randint(1, 3)
+    return rng.randint(4, 30)
+
+def _release_date(rng):
+    first_day = datetime.date.fromisoformat(config.ERA_DEFINITIONS[-1][1])
+    last_day = datetime.date.fromisoformat(config.ERA_DEFINITIONS[0][1]) + datetime.timedelta(days=365)
+    return first_day + datetime.timedelta(days=rng.randrange((last_day - first_day).days))
+
+
+def generate_products(count, seed=42):
+    """
+    製品マスタの行 (name, display_name, release_date, era, show_in_sidebar, code) を count 件生成する。
+    code は型番の接頭辞 (例: 'PHRA') として items の生成に使う。
+    """
+    rng = random.Random(seed)
+    products = []
+    used_names = set()
+    used_codes = set()
+    for index in range(count):
+        base_name = rng.choice(PRODUCT_KINDS) + rng.choice(PRODUCT_WORDS_A) + "・" + rng.choice(PRODUCT_WORDS_B)
+        name = base_name
+        suffix = 2
+        while name in used_names:
+            name = f"{base_name} {suffix}"
+            suffix += 1
+        used_names.add(name)
+
+        code = ''.join(rng.choice(string.ascii_uppercase) for _ in range(4))
+        while code in used_codes:
+            code = ''.join(rng.choice(string.ascii_uppercase) for _ in range(4))
+        used_codes.add(code)
+
+        release_date = _release_date(rng)
+        products.append({
+            'name': name,
+            'display_name': name,
+            'release_date': release_date,
+            'era': calculate_era(release_date),
+            'show_in_sidebar': index % 3 == 0,
+            'code': code,
+        })
+    return products
+
+def generate_items(count, products, seed=42):
+    """
+    items の行を count 件生成する。各カードは製品に属し、一部は別レアリティ違いとして同じ型番で複数行になる。
+    (card_id, rare) の組み合わせは重複しない。
+    """
+    rng = random.Random(seed + 1)
+    items = []
+    card_numbers = [0] * len(products)
+    last_card = [None] * len(products)
+    used_rarities = {}
+    while len(items) < count:
+        product_index = rng.randrange(len(products))
+        product = products[product_index]
+
+        previous = last_card[product_index]
+        rare = _weighted_choice(rng, RARITY_WEIGHTS)
+        if previous is not None and rng.random() < 0.25 and rare not in used_rarities[previous['card_id']]:
+            # 直前のカードのレアリティ違い
+            name, card_id = previous['name'], previous['card_id']
+        else:
+            card_numbers[product_index] += 1
+            name = _card_name(rng)
+            card_id = f"{product['code']}-JP{card_numbers[product_index]:03d}"
+            used_rarities[card_id] = set()
+
+        used_rarities[card_id].add(rare)
+        item = {
+            'name': name,
+            'card_id': card_id,
+            'rare': rare,
+            'stock': _stock(rng),
+            'category': product['name'],
+            'name_normalized': normalize_for_search(name),
+            'card_id_normalized': normalize_for_search(card_id),
+        }
+        items.append(item)
+        last_card[product_index] = item
+    return items
+
+def generate_import_csv(row_count, seed=42, existing_items=None, existing_ratio=0.1):
+    """
+    admin_import_csv に渡す CSV (UTF-8 BOM 付きの bytes) を生成する。
+    existing_items を渡すと、その一部を既存カードとして混ぜ、更新・変更なしの経路も通るようにする。
+    """
+    rng = random.Random(seed + 2)
+    si = io.StringIO()
+    si.write('\ufeff')
+    writer = csv.writer(si)
+    writer.writerow(IMPORT_CSV_HEADERS)
+    for index in range(row_count):
+        if existing_items and rng.random() < existing_ratio:
+            item = rng.choice(existing_items)
+            writer.writerow([item['name'], item['card_id'], item['rare'], item['stock'], item['category']])
+            continue
+        writer.writerow([
+            _card_name(rng),
+            f"BNCH-JP{index:06d}",
+            _weighted_choice(rng, RAW_RARITY_WEIGHTS),
+            _stock(rng),
+            '',
+        ])
+    return si.getvalue().encode('utf-8')
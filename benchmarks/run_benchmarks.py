@@ -0,0 +1,307 @@
+# benchmarks/run_benchmarks.py
+# 架空のカードカタログを投入したローカルの PostgreSQL に対して、主要な画面・処理の所要時間を計測する。
+#
+# 使い方 (プロジェクトルートで実行):
+#   python -m benchmarks.run_benchmarks --database-url postgresql://localhost/yugioh_bench --items 100000 --products 500
+#
+# 指定したデータベースの public スキーマは作り直されるので、必ずベンチマーク専用のデータベースを使うこと。
+# 結果は JSON で保存され、--compare に以前の結果を渡すと中央値の差分を表示する。
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import psycopg2
+from werkzeug.security import generate_password_hash
+
+from apply_migrations import apply_migration_files, ensure_migrations_table, list_migration_files
+from benchmarks import datagen
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+BENCH_USER = 'benchmark'
+
+INDEX_SORT_KEYS = ['release_date', 'name', 'card_id', 'stock', 'id']
+SEARCH_CASES = [
+    ('all', 'マジシャン'),
+    ('name', 'ドラゴン'),
+    ('card_id', 'jp001'),
+    ('category', 'ナイトメア'),
+    ('rare', 'se'),
+]
+
+_SERVER_TIMING_DB_RE = re.compile(r'db;dur=([\d.]+)')
+
+
+def reset_database(db_url):
+    """ public スキーマを作り直し、基本テーブルとマイグレーションを適用する """
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA public CASCADE")
+            cur.execute("CREATE SCHEMA public")
+            with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+                cur.execute(f.read())
+            ensure_migrations_table(cur)
+        conn.commit()
+        apply_migration_files(conn, list_migration_files(), verbose=False)
+    finally:
+        conn.close()
+
+def load_catalogue(db_url, products, items):
+    """ 生成したカタログを COPY でまとめて投入する """
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            buf = io.StringIO()
+            writer = datagen.csv.writer(buf)
+            for p in products:
+                writer.writerow([p['name'], p['display_name'], p['release_date'].isoformat(), p['era'] if p['era'] is not None else '', p['show_in_sidebar']])
+            buf.seek(0)
+            cur.copy_expert("COPY products (name, display_name, release_date, era, show_in_sidebar) FROM STDIN WITH (FORMAT csv, NULL '')", buf)
+
+            buf = io.StringIO()
+            writer = datagen.csv.writer(buf)
+            for i in items:
+                writer.writerow([i['name'], i['card_id'], i['rare'], i['stock'], i['category'], i['name_normalized'], i['card_id_normalized']])
+            buf.seek(0)
+            cur.copy_expert("COPY items (name, card_id, rare, stock, category, name_normalized, card_id_normalized) FROM STDIN WITH (FORMAT csv)", buf)
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE")
+    finally:
+        conn.close()
+
+def server_version(db_url):
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SHOW server_version")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkRunner:
+    def __init__(self, app, repeat, warmup):
+        self.app = app
+        self.repeat = repeat
+        self.warmup = warmup
+        self.results = []
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_id'] = BENCH_USER
+            session['username'] = BENCH_USER
+            session['logged_in'] = True
+
+    def _request(self, method, url, **kwargs):
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        response.get_data()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+        match = _SERVER_TIMING_DB_RE.search(response.headers.get('Server-Timing', ''))
+        db_ms = float(match.group(1)) if match else None
+        # フラッシュメッセージが次のリクエストに持ち越されないよう消しておく
+        with self.client.session_transaction() as session:
+            session.pop('_flashes', None)
+        return elapsed_ms, db_ms
+
+    def measure(self, name, params, method, url, repeat=None, warmup=None, make_kwargs=None):
+        """ 同じリクエストを繰り返し、所要時間の統計を results に追加する """
+        repeat = self.repeat if repeat is None else repeat
+        warmup = self.warmup if warmup is None else warmup
+        for _ in range(warmup):
+            self._request(method, url, **(make_kwargs() if make_kwargs else {}))
+        runs, db_runs = [], []
+        for _ in range(repeat):
+            elapsed_ms, db_ms = self._request(method, url, **(make_kwargs() if make_kwargs else {}))
+            runs.append(elapsed_ms)
+            if db_ms is not None:
+                db_runs.append(db_ms)
+        result = {
+            'name': name,
+            'params': params,
+            'runs_ms': [round(r, 3) for r in runs],
+            'min_ms': round(min(runs), 3),
+            'median_ms': round(statistics.median(runs), 3),
+            'mean_ms': round(statistics.mean(runs), 3),
+            'max_ms': round(max(runs), 3),
+            'db_median_ms': round(statistics.median(db_runs), 3) if db_runs else None,
+        }
+        self.results.append(result)
+        print(f"  {name:<40} {json.dumps(params, ensure_ascii=False):<50} median {result['median_ms']:>10.1f} ms"
+              + (f" (db {result['db_median_ms']:.1f} ms)" if db_runs else ''))
+        return result
+
+
+def run_scenarios(runner, db_url, items, products, import_sizes, seed):
+    print("[index] 一覧画面 (ソートキー別)")
+    for sort_key in INDEX_SORT_KEYS:
+        runner.measure('index_sort', {'sort_key': sort_key, 'sort_order': 'desc', 'show_zero': True}, 'GET',
+                       f"/?sort_key={sort_key}&sort_order=desc&per_page=20&show_zero=on")
+    runner.measure('index_sort', {'sort_key': 'release_date', 'sort_order': 'desc', 'show_zero': False}, 'GET',
+                   "/?sort_key=release_date&sort_order=desc&per_page=20")
+
+    print("[search] キーワード検索 (検索対象別)")
+    for search_field, keyword in SEARCH_CASES:
+        runner.measure('index_search', {'search_field': search_field, 'keyword': keyword}, 'GET',
+                       f"/?search_field={search_field}&keyword={keyword}&per_page=20&show_zero=on")
+
+    print("[export] CSVエクスポート")
+    runner.measure('csv_export', {'items': len(items)}, 'GET', '/download_csv')
+
+    print("[batch] 一括在庫更新")
+    rng = random.Random(seed)
+    category = max(products, key=lambda p: sum(1 for i in items if i['category'] == p['name']))['name']
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM items WHERE LOWER(category) LIKE %s ORDER BY name ASC LIMIT 20", (f"%{category.lower()}%",))
+            batch_ids = [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+    def batch_form():
+        form = {f"stock_item_{item_id}": str(rng.randint(0, 5)) for item_id in batch_ids}
+        form.update({'category_keyword_hidden': category, 'current_page': '1'})
+        return {'data': form}
+    runner.measure('batch_register_update', {'rows': len(batch_ids)}, 'POST', '/admin/batch_register', make_kwargs=batch_form)
+    runner.measure('batch_register_view', {'category': category}, 'GET', f"/admin/batch_register?category_keyword={category}")
+
+    print("[import] CSVインポート")
+    for size in import_sizes:
+        csv_bytes = datagen.generate_import_csv(size, seed=seed, existing_items=items)
+
+        def import_form(csv_bytes=csv_bytes, size=size):
+            return {'data': {'csv_files': [(io.BytesIO(csv_bytes), f"benchmark_import_{size}.csv")]},
+                    'content_type': 'multipart/form-data'}
+        runner.measure('csv_import', {'rows': size, 'bytes': len(csv_bytes)}, 'POST', '/admin/import_csv',
+                       repeat=1, warmup=0, make_kwargs=import_form)
+        # 次の計測に影響しないよう、追加された行を取り除いておく
+        conn = psycopg2.connect(db_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM items WHERE card_id LIKE 'BNCH-%%'")
+            conn.commit()
+        finally:
+            conn.close()
+
+def compare_results(previous_path, current):
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    previous_by_key = {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in previous['scenarios']}
+    print(f"\n--- 比較: {previous_path} ({previous['meta'].get('git_commit')}) ---")
+    for result in current['scenarios']:
+        key = (result['name'], json.dumps(result['params'], sort_keys=True))
+        old = previous_by_key.get(key)
+        if not old:
+            continue
+        delta = (result['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+        print(f"  {result['name']:<25} {json.dumps(result['params'], ensure_ascii=False):<50} "
+              f"{old['median_ms']:>10.1f} -> {result['median_ms']:>10.1f} ms ({delta:+.1f}%)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ベンチマーク用データベースで主要な処理の所要時間を計測します。")
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help="ベンチマーク専用の PostgreSQL の URL (環境変数 BENCH_DATABASE_URL でも指定可)")
+    parser.add_argument('--items', type=int, default=100000, help="生成するカードの行数")
+    parser.add_argument('--products', type=int, default=500, help="生成する製品の数")
+    parser.add_argument('--import-sizes', default='10000,100000', help="CSVインポートで計測する行数 (カンマ区切り)")
+    parser.add_argument('--repeat', type=int, default=5, help="各シナリオの計測回数")
+    parser.add_argument('--warmup', type=int, default=1, help="計測前に捨てる実行回数")
+    parser.add_argument('--seed', type=int, default=42, help="データ生成の乱数シード")
+    parser.add_argument('--output', help="結果を書き出す JSON ファイル (省略時は benchmarks/results/ に日時付きで保存)")
+    parser.add_argument('--compare', help="比較対象とする以前の結果 JSON")
+    parser.add_argument('--no-response-cache', action='store_true', help="一覧画面などのサーバー側キャッシュを無効にして計測する")
+    parser.add_argument('--yes', action='store_true', help="データベースを作り直す前の確認を省略する")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        print("エラー: --database-url または BENCH_DATABASE_URL でベンチマーク用データベースを指定してください。", file=sys.stderr)
+        return 1
+    if not args.yes:
+        proceed = input("指定したデータベースの public スキーマを削除して作り直します。続行しますか？ (yes/no): ").strip().lower()
+        if proceed != 'yes':
+            print("処理を中止しました。")
+            return 1
+
+    import_sizes = [int(size) for size in args.import_sizes.split(',') if size.strip()]
+
+    print(f"データ生成中... (製品 {args.products} 件, カード {args.items} 件, seed={args.seed})")
+    products = datagen.generate_products(args.products, seed=args.seed)
+    items = datagen.generate_items(args.items, products, seed=args.seed)
+
+    print("データベースを初期化しています...")
+    reset_database(args.database_url)
+    started = time.perf_counter()
+    load_catalogue(args.database_url, products, items)
+    print(f"投入完了 ({time.perf_counter() - started:.1f} 秒)")
+
+    # アプリはベンチマーク用データベースに接続させる
+    os.environ['DATABASE_URL'] = args.database_url
+    warnings.filterwarnings('ignore', category=DeprecationWarning)
+    from app import config, create_app
+    if args.no_response_cache:
+        config.RESPONSE_CACHE_ENABLED = False
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        user_file = os.path.join(tmpdir, 'users.json')
+        with open(user_file, 'w', encoding='utf-8') as f:
+            json.dump({BENCH_USER: generate_password_hash('benchmark')}, f)
+        app = create_app({'TESTING': True, 'USER_FILE': user_file})
+
+        runner = BenchmarkRunner(app, args.repeat, args.warmup)
+        run_scenarios(runner, args.database_url, items, products, import_sizes, args.seed)
+
+    result = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'postgres': server_version(args.database_url),
+            'items': args.items,
+            'products': args.products,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'response_cache': not args.no_response_cache,
+        },
+        'scenarios': runner.results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {output}")
+
+    if args.compare:
+        compare_results(args.compare, result)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+-- benchmarks/schema.sql
+-- ベンチマーク用の空のデータベースに作成する基本テーブル。
+-- 本番の items / products と同じ列構成で、追加分は migrations/ を順に適用して揃える。
+CREATE TABLE IF NOT EXISTS products (
+    name TEXT PRIMARY KEY,
+    display_name TEXT,
+    release_date DATE,
+    era INTEGER,
+    show_in_sidebar BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS items (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    card_id TEXT,
+    rare TEXT,
+    stock INTEGER NOT NULL DEFAULT 0,
+    category TEXT,
+    name_normalized TEXT,
+    card_id_normalized TEXT,
+    UNIQUE (card_id, rare)
+);
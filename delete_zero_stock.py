@@ -1,10 +1,19 @@
 # delete_zero_stock.py
+import argparse
+import csv
+import datetime
+import gzip
 import os
 import psycopg2
 import psycopg2.extras
 import sys
+import time
+import traceback
 from dotenv import load_dotenv
 
+from app import config
+from app.db import ITEM_ARCHIVE_COLUMNS, delete_items_batch
+
 def get_db_connection_local():
     """
     ローカル環境変数ファイル (.env) からデータベースURLを読み込み接続を確立します。
@@ -38,53 +47,127 @@ def get_db_connection_local():
         print(f"Error details: {e}", file=sys.stderr)
         sys.exit(1) # エラーで終了
 
-def delete_zero_stock_items():
+def count_zero_stock_items(cur):
+    cur.execute("SELECT COUNT(*) FROM items WHERE stock = 0")
+    count_result = cur.fetchone()
+    return count_result[0] if count_result else 0
+
+def archive_table_exists(cur):
+    cur.execute("SELECT to_regclass('items_archive')")
+    return cur.fetchone()[0] is not None
+
+def purge_zero_stock_items(conn, batch_size, pause_seconds, archive_mode, csv_writer=None, csv_file=None):
+    """
+    在庫数0のアイテムを id 順に batch_size 件ずつ削除し、バッチごとにコミットする。
+    archive_mode が 'table' なら items_archive に、'csv' なら csv_writer に退避してから削除する。
+    削除した件数の合計を返す。
+    """
+    deleted_total = 0
+    last_id = 0
+    archive_reason = 'zero_stock_purge' if archive_mode == 'table' else None
+    started_at = time.monotonic()
+    with conn.cursor() as cur:
+        while True:
+            # id の範囲を区切って少しずつ削除する。外側の stock = 0 は、選んだ後に在庫が
+            # 戻された行を誤って消さないための再チェック。
+            deleted_rows = delete_items_batch(
+                cur,
+                "stock = 0 AND id IN (SELECT id FROM items WHERE stock = 0 AND id > %s ORDER BY id LIMIT %s)",
+                (last_id, batch_size),
+                archive_reason
+            )
+            if not deleted_rows:
+                break
+            if csv_writer is not None:
+                csv_writer.writerows(deleted_rows)
+                csv_file.flush()
+            conn.commit()
+
+            first_id = min(row[0] for row in deleted_rows)
+            last_id = max(row[0] for row in deleted_rows)
+            deleted_total += len(deleted_rows)
+            elapsed = time.monotonic() - started_at
+            print(f"INFO: {deleted_total} 件削除済み (今回 {len(deleted_rows)} 件, ID {first_id}〜{last_id}, 経過 {elapsed:.1f} 秒)")
+
+            # 選んだ後に在庫が戻された行があるとバッチが batch_size 件に満たないことがあるので、
+            # 件数では終わりを判断せず、削除する行がなくなるまで続ける
+            if pause_seconds > 0:
+                time.sleep(pause_seconds)
+    return deleted_total
+
+def delete_zero_stock_items(batch_size=None, pause_seconds=None, archive_mode='table', archive_file=None, assume_yes=False):
     """
     データベース内の在庫数が0のアイテムを全て削除します。
-    削除前に確認を求め、削除件数を報告します。
+    削除前に確認を求め（assume_yes の場合は省略）、削除件数を報告します。
     """
+    batch_size = batch_size or config.DELETE_BATCH_SIZE
+    pause_seconds = config.PURGE_BATCH_PAUSE_SECONDS if pause_seconds is None else pause_seconds
     conn = None
-    deleted_count = 0
+    csv_file = None
     try:
         conn = get_db_connection_local()
         cur = conn.cursor()
 
         # まず、在庫数0のアイテムが何件あるか確認
-        cur.execute("SELECT COUNT(*) FROM items WHERE stock = 0")
-        count_result = cur.fetchone()
-        zero_stock_count = count_result[0] if count_result else 0
+        zero_stock_count = count_zero_stock_items(cur)
 
         if zero_stock_count == 0:
             print("INFO: 在庫数0のアイテムは見つかりませんでした。削除処理は行いません。")
             return
 
         print(f"INFO: 現在、在庫数0のアイテムが {zero_stock_count} 件見つかりました。")
+
+        if archive_mode == 'table' and not archive_table_exists(cur):
+            print("ERROR: 退避先の items_archive テーブルがありません。先に apply_migrations.py を実行するか、--archive csv / none を指定してください。", file=sys.stderr)
+            return
         
-        # ユーザーに最終確認
-        confirm = input(f"本当にこれらのアイテム {zero_stock_count} 件を全て削除しますか？ この操作は元に戻せません。 (yes/no): ").strip().lower()
-
-        if confirm == 'yes':
-            print("INFO: 削除処理を開始します...")
-            cur.execute("DELETE FROM items WHERE stock = 0")
-            deleted_count = cur.rowcount # 削除された行数を取得
-            conn.commit() # 変更をデータベースに永続化
-            print(f"SUCCESS: {deleted_count} 件の在庫数0のアイテムを削除しました。")
-        else:
-            print("INFO: 削除処理はキャンセルされました。")
+        if not assume_yes:
+            # ユーザーに最終確認
+            confirm = input(f"本当にこれらのアイテム {zero_stock_count} 件を全て削除しますか？ この操作は元に戻せません。 (yes/no): ").strip().lower()
+            if confirm != 'yes':
+                print("INFO: 削除処理はキャンセルされました。")
+                return
+
+        csv_writer = None
+        if archive_mode == 'csv':
+            if not archive_file:
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                archive_file = f"zero_stock_archive_{timestamp}.csv.gz"
+            csv_file = gzip.open(archive_file, 'wt', encoding='utf-8', newline='')
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(ITEM_ARCHIVE_COLUMNS)
+            print(f"INFO: 削除する行を {archive_file} に退避します。")
+
+        print(f"INFO: 削除処理を開始します... (バッチサイズ: {batch_size}, バッチ間隔: {pause_seconds} 秒, 退避先: {archive_mode})")
+        deleted_count = purge_zero_stock_items(conn, batch_size, pause_seconds, archive_mode, csv_writer, csv_file)
+        print(f"SUCCESS: {deleted_count} 件の在庫数0のアイテムを削除しました。")
 
     except (Exception, psycopg2.Error) as error:
         if conn:
-            conn.rollback() # エラーが発生した場合はロールバック
+            conn.rollback() # エラーが発生した場合は、実行中のバッチのみロールバック
         print(f"ERROR: 在庫数0のアイテム削除中にエラーが発生しました: {error}", file=sys.stderr)
         traceback.print_exc()
     finally:
+        if csv_file:
+            csv_file.close()
         if conn:
             if 'cur' in locals() and cur and not cur.closed:
                 cur.close()
             conn.close()
             print("INFO: Database connection closed.")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="在庫数0のカードをバッチに分けて削除します。")
+    parser.add_argument('--yes', action='store_true', help="確認を行わずに実行する (cron などの非対話実行用)")
+    parser.add_argument('--batch-size', type=int, default=config.DELETE_BATCH_SIZE, help="1トランザクションで削除する最大件数")
+    parser.add_argument('--pause', type=float, default=config.PURGE_BATCH_PAUSE_SECONDS, help="バッチ間の待機秒数")
+    parser.add_argument('--archive', choices=['table', 'csv', 'none'], default='table',
+                        help="削除前の退避先 (table: items_archive テーブル, csv: gzip 圧縮CSV, none: 退避しない)")
+    parser.add_argument('--archive-file', help="--archive csv のときの出力ファイル名 (省略時は日時から自動生成)")
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
+    args = parse_args()
     print("--- 在庫数0のカード一括削除スクリプト ---")
     print("警告: このスクリプトはデータベースの内容を直接変更します。")
     print("実行前に必ずデータベースのバックアップを取得してください。")
@@ -93,10 +176,10 @@ if __name__ == '__main__':
     print(f"スクリプトの場所: {os.path.abspath(__file__)}")
     print(f"想定される.envファイルの場所: {os.path.abspath(os.path.join(os.path.dirname(__file__), '.env'))}")
     
-    # ユーザーに実行意思を再確認
-    proceed = input("スクリプトを実行しますか？ (yes/no): ").strip().lower()
+    # ユーザーに実行意思を再確認 (--yes の場合は省略)
+    proceed = 'yes' if args.yes else input("スクリプトを実行しますか？ (yes/no): ").strip().lower()
     if proceed == 'yes':
-        delete_zero_stock_items()
+        delete_zero_stock_items(args.batch_size, args.pause, args.archive, args.archive_file, assume_yes=args.yes)
     else:
         print("スクリプトの実行を中止しました。")
     print("--- スクリプト終了 ---")
@@ -0,0 +1,79 @@
+# export_snapshot.py
+# items と対応する製品の情報を、分析用に型付きの列指向形式 (Parquet / Arrow IPC) で書き出すスクリプト。
+# 画面の「分析用エクスポート」(/download_snapshot) と同じ内容。pyarrow が必要。
+#
+# 例:
+#   python export_snapshot.py --output snapshot.parquet
+#   python export_snapshot.py --format arrow --output snapshot.arrow
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from app import columnar, config
+
+
+def get_db_connection_local():
+    """
+    ローカル環境変数ファイル (.env) からデータベースURLを読み込み接続を確立します。
+    """
+    dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
+    if os.path.exists(dotenv_path):
+        load_dotenv(dotenv_path)
+        print(f"INFO: Loaded environment variables from {dotenv_path}")
+    else:
+        flaskenv_path = os.path.join(os.path.dirname(__file__), '.flaskenv')
+        if os.path.exists(flaskenv_path):
+            load_dotenv(flaskenv_path)
+            print(f"INFO: Loaded environment variables from {flaskenv_path}")
+        else:
+            print("WARNING: .env or .flaskenv file not found in the script's directory. DATABASE_URL must be set in the system environment.")
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("CRITICAL: DATABASE_URL environment variable not set. Cannot connect to the database.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        return psycopg2.connect(db_url)
+    except psycopg2.Error as e:
+        print(f"CRITICAL: Database connection failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="items と製品の情報を Parquet / Arrow IPC 形式で書き出します。")
+    parser.add_argument('--format', choices=sorted(columnar.FORMATS), default='parquet', help="出力形式 (既定: parquet)")
+    parser.add_argument('--output', help="出力ファイル (既定: yugioh_inventory_snapshot_<日時>.<拡張子>)")
+    parser.add_argument('--batch-size', type=int, default=config.COLUMNAR_EXPORT_BATCH_SIZE, help="1回に読む行数")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = args.output or columnar.snapshot_filename(args.format)
+    print(f"--- 分析用エクスポート ({args.format}) ---")
+    conn = get_db_connection_local()
+    try:
+        started_at = time.perf_counter()
+        table = columnar.read_snapshot_table(conn, args.batch_size)
+        conn.rollback()
+        columnar.write_snapshot(table, output, args.format)
+        elapsed = time.perf_counter() - started_at
+        print(f"SUCCESS: {table.num_rows} 行を {output} に書き出しました "
+              f"({os.path.getsize(output) / 1024:.1f} KB, {elapsed:.2f} 秒)。")
+        return 0
+    except columnar.ColumnarExportUnavailable as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"ERROR: エクスポート中にエラーが発生しました: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# find_duplicates.py
+# 重複・ほぼ重複のカード (正規化したカードID・カード名とレアリティが同じ行) を一覧表示し、
+# 必要なら在庫を1行にまとめるスクリプト。判定の規則は app/duplicates.py を参照。
+#
+# 例:
+#   python find_duplicates.py                 # 重複の一覧を表示するだけ
+#   python find_duplicates.py --merge         # 確認のうえ、各クラスタの在庫を1行にまとめる
+#   python find_duplicates.py --merge --yes   # 確認なしでまとめる (cron などの非対話実行用)
+import argparse
+import os
+import sys
+
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+from app import duplicates
+
+
+def get_db_connection_local():
+    """
+    ローカル環境変数ファイル (.env) からデータベースURLを読み込み接続を確立します。
+    """
+    dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
+    if os.path.exists(dotenv_path):
+        load_dotenv(dotenv_path)
+        print(f"INFO: Loaded environment variables from {dotenv_path}")
+    else:
+        flaskenv_path = os.path.join(os.path.dirname(__file__), '.flaskenv')
+        if os.path.exists(flaskenv_path):
+            load_dotenv(flaskenv_path)
+            print(f"INFO: Loaded environment variables from {flaskenv_path}")
+        else:
+            print("WARNING: .env or .flaskenv file not found in the script's directory. DATABASE_URL must be set in the system environment.")
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("CRITICAL: DATABASE_URL environment variable not set. Cannot connect to the database.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        return psycopg2.connect(db_url, cursor_factory=psycopg2.extras.DictCursor)
+    except psycopg2.Error as e:
+        print(f"CRITICAL: Database connection failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def print_clusters(clusters, limit):
+    for cluster in clusters[:limit]:
+        print(f"  [{len(cluster.rows)} 件 / 在庫合計 {cluster.total_stock} 枚]")
+        for row in cluster.rows:
+            mark = '*' if row['id'] == cluster.survivor_id else ' '
+            print(f"   {mark} id={row['id']} {row['name']} / {row['card_id']} / {row['rare']} / 在庫 {row['stock']} / {row['category'] or '(カテゴリなし)'}")
+    if len(clusters) > limit:
+        print(f"  ... ほか {len(clusters) - limit} 組")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="重複・ほぼ重複のカードを一覧表示し、在庫を1行にまとめます。")
+    parser.add_argument('--merge', action='store_true', help="各クラスタの在庫を、在庫の多い (同じなら id の小さい) 行にまとめる")
+    parser.add_argument('--yes', action='store_true', help="確認を行わずに実行する (cron などの非対話実行用)")
+    parser.add_argument('--show', type=int, default=50, help="表示するクラスタ数 (既定: 50)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("--- 重複カードのチェック ---")
+    conn = get_db_connection_local()
+    try:
+        with conn.cursor() as cur:
+            clusters = duplicates.find_duplicate_clusters(cur)
+        conn.rollback()
+        if not clusters:
+            print("INFO: 重複しているカードはありません。")
+            return 0
+        print(f"WARNING: {len(clusters)} 組 ({sum(len(c.rows) for c in clusters)} 件) の重複が見つかりました。* は残す行です。")
+        print_clusters(clusters, args.show)
+        if not args.merge:
+            return 1
+
+        proceed = 'yes' if args.yes else input("重複をまとめますか？ (yes/no): ").strip().lower()
+        if proceed != 'yes':
+            print("スクリプトの実行を中止しました。")
+            return 0
+        with conn.cursor() as cur:
+            survivors, merged = duplicates.merge_clusters(cur, [(c.survivor_id, c.ids) for c in clusters])
+        conn.commit()
+        print(f"SUCCESS: {merged} 件の重複カードを {survivors} 件のカードにまとめました (削除した行は items_archive に退避しています)。")
+        return 0
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"ERROR: 重複チェック中にエラーが発生しました: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+# gunicorn.conf.py
+# gunicorn wsgi:app -c gunicorn.conf.py で読み込まれる設定。
+# 各ワーカーはアプリを読み込んだ直後にウォームアップし、終わるまで /readyz は 503 を返す。
+# ロードバランサーのヘルスチェックには /readyz を使うこと (/healthz はプロセスの生存確認だけ)。
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+
+
+def post_worker_init(worker):
+    # post_fork の時点ではまだワーカーがアプリを読み込んでいないので、読み込み後のこのフックで行う
+    from app import warmup
+
+    warmup.warm_up(worker.wsgi)
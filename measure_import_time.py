@@ -0,0 +1,110 @@
+# measure_import_time.py
+# アプリの読み込み (gunicorn のワーカー起動時と同じ import wsgi) にかかる時間を、モジュールごとに計測するスクリプト。
+# python -X importtime の出力を集計するので、別プロセスで毎回まっさらな状態から読み込む。
+#
+# 例:
+#   python measure_import_time.py                  # 上位20件を表示
+#   python measure_import_time.py --repeat 5       # 5回計測して中央値を表示
+#   python measure_import_time.py --max-ms 500     # 合計が 500ms を超えたら終了コード 1 (CI などでの監視用)
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# "import time:       self [us] |  cumulative | imported package" の行
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_importtime(stderr):
+    """
+    -X importtime の出力を {モジュール名: (自身の時間, 累積時間)} (マイクロ秒) にする。
+    最後に出てくる、最も浅い階層のモジュールが計測対象そのもの。
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+def measure_once(module):
+    """ 新しい Python プロセスで module を読み込み、parse_importtime の結果を返す """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} の読み込みに失敗しました:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def summarize(runs, module):
+    """
+    複数回の計測結果から、モジュールごと・トップレベルのパッケージごとの中央値 (ミリ秒) を求める。
+    パッケージごとの値は、そのパッケージに属するモジュールの自身の時間の合計。
+    """
+    names = set().union(*runs)
+    per_module = {}
+    for name in names:
+        samples = [run[name] for run in runs if name in run]
+        per_module[name] = (statistics.median(s[0] for s in samples) / 1000.0,
+                            statistics.median(s[1] for s in samples) / 1000.0)
+    per_package = {}
+    for name, (self_ms, _) in per_module.items():
+        package = name.split('.')[0]
+        per_package[package] = per_package.get(package, 0.0) + self_ms
+    total_ms = per_module.get(module, (0.0, 0.0))[1]
+    return total_ms, per_module, per_package
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="アプリの読み込みにかかる時間をモジュールごとに計測します。")
+    parser.add_argument('--module', default='wsgi', help="計測するモジュール (既定: wsgi)")
+    parser.add_argument('--repeat', type=int, default=3, help="計測する回数。結果は中央値 (既定: 3)")
+    parser.add_argument('--top', type=int, default=20, help="表示する件数 (既定: 20)")
+    parser.add_argument('--max-ms', type=float, help="合計の読み込み時間がこれを超えたら終了コード 1 で終了する")
+    parser.add_argument('--json', dest='json_path', help="結果を JSON で保存するファイル")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"--- 読み込み時間の計測: import {args.module} ({args.repeat} 回) ---")
+    try:
+        runs = [measure_once(args.module) for _ in range(max(args.repeat, 1))]
+    except RuntimeError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+    total_ms, per_module, per_package = summarize(runs, args.module)
+    print(f"合計: {total_ms:.1f} ms")
+
+    print(f"\nパッケージごと (自身の時間の合計、上位 {args.top} 件):")
+    for package, self_ms in sorted(per_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_ms:9.1f} ms  {package}")
+
+    print(f"\nモジュールごと (自身の時間、上位 {args.top} 件):")
+    for name, (self_ms, cumulative_ms) in sorted(per_module.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_ms:9.1f} ms  (累積 {cumulative_ms:9.1f} ms)  {name}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'module': args.module,
+                'repeat': len(runs),
+                'total_ms': total_ms,
+                'packages': per_package,
+                'modules': {name: {'self_ms': v[0], 'cumulative_ms': v[1]} for name, v in per_module.items()},
+            }, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"\nINFO: 結果を {args.json_path} に保存しました。")
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"ERROR: 読み込み時間 {total_ms:.1f} ms が上限 {args.max_ms:.1f} ms を超えています。", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+-- 001_items_archive.sql
+-- 在庫0パージなどで削除した items の行を退避しておくテーブル
+CREATE TABLE IF NOT EXISTS items_archive (
+    id INTEGER NOT NULL,
+    name TEXT,
+    card_id TEXT,
+    rare TEXT,
+    stock INTEGER,
+    category TEXT,
+    name_normalized TEXT,
+    card_id_normalized TEXT,
+    archive_reason TEXT,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_items_archive_id ON items_archive (id);
+CREATE INDEX IF NOT EXISTS idx_items_archive_archived_at ON items_archive (archived_at);
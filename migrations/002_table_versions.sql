@@ -0,0 +1,32 @@
+-- 002_table_versions.sql
+-- items / products が変更されるたびに増える版番号。
+-- 一覧画面やCSVエクスポートの ETag / Last-Modified と、サーバー側のキャッシュのキーに使う。
+-- アプリ以外 (スクリプトや直接の SQL) からの変更でも版番号が進むよう、トリガーで管理する。
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO table_versions (table_name) VALUES ('items'), ('products')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE table_versions
+    SET version = version + 1, updated_at = clock_timestamp()
+    WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 行ごとではなく文ごとに1回だけ版番号を進める
+DROP TRIGGER IF EXISTS trg_items_version ON items;
+CREATE TRIGGER trg_items_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS trg_products_version ON products;
+CREATE TRIGGER trg_products_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
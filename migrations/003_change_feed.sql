@@ -0,0 +1,75 @@
+-- 003_change_feed.sql
+-- 差分同期 (変更フィード) 用の更新日時と、削除された行の記録 (tombstone)。
+-- 更新日時と tombstone はトリガーで管理するので、アプリ・スクリプト・直接の SQL のどこから変更しても記録される。
+
+-- --- 更新日時 ---
+ALTER TABLE items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    -- 値が何も変わらない UPDATE では更新日時を進めない
+    IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
+    END IF;
+    NEW.updated_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_items_updated_at ON items;
+CREATE TRIGGER trg_items_updated_at
+    BEFORE INSERT OR UPDATE ON items
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_products_updated_at ON products;
+CREATE TRIGGER trg_products_updated_at
+    BEFORE INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_items_updated_at_id ON items (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_updated_at_name ON products (updated_at, name);
+
+-- --- 削除の記録 ---
+CREATE TABLE IF NOT EXISTS item_tombstones (
+    tombstone_id BIGSERIAL PRIMARY KEY,
+    id INTEGER NOT NULL,
+    card_id TEXT,
+    rare TEXT,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+CREATE INDEX IF NOT EXISTS idx_item_tombstones_deleted_at ON item_tombstones (deleted_at, tombstone_id);
+
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    tombstone_id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_deleted_at ON product_tombstones (deleted_at, tombstone_id);
+
+CREATE OR REPLACE FUNCTION record_item_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO item_tombstones (id, card_id, rare) VALUES (OLD.id, OLD.card_id, OLD.rare);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 製品は名前が主キーなので、名前を変更した場合も元の名前を削除として記録する
+CREATE OR REPLACE FUNCTION record_product_tombstone() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR OLD.name IS DISTINCT FROM NEW.name THEN
+        INSERT INTO product_tombstones (name) VALUES (OLD.name);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_items_tombstone ON items;
+CREATE TRIGGER trg_items_tombstone
+    AFTER DELETE ON items
+    FOR EACH ROW EXECUTE FUNCTION record_item_tombstone();
+
+DROP TRIGGER IF EXISTS trg_products_tombstone ON products;
+CREATE TRIGGER trg_products_tombstone
+    AFTER DELETE OR UPDATE OF name ON products
+    FOR EACH ROW EXECUTE FUNCTION record_product_tombstone();
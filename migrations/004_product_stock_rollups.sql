@@ -0,0 +1,137 @@
+-- 004_product_stock_rollups.sql
+-- 製品 (items.category) ごと・レアリティごとの集計 (カード種類数・在庫ありの種類数・在庫枚数)。
+-- サイドバーや製品マスタ管理で items 全体を GROUP BY しなくて済むよう、items の変更に合わせてトリガーで増減させる。
+-- items と products の対応は一覧画面と同じ LOWER(TRIM(category)) = LOWER(TRIM(name)) で、category_key はこの値。
+-- ずれが生じた場合は rebuild_rollups.py (rebuild_product_stock_rollups()) で作り直す。
+CREATE TABLE IF NOT EXISTS product_stock_rollups (
+    category_key TEXT NOT NULL,
+    rare TEXT NOT NULL,
+    item_rows INTEGER NOT NULL DEFAULT 0,
+    in_stock_rows INTEGER NOT NULL DEFAULT 0,
+    total_stock BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (category_key, rare)
+);
+
+-- 変更前の行 (old_rows) を引き、変更後の行 (new_rows) を足す。
+-- 行ごとではなく文ごとに1回、変更された行をまとめて反映する。
+-- CSVインポートは1行ずつ INSERT するので、文ごとの処理は軽く保つ:
+--   - イベントごとに関数を分けて静的な SQL にし、実行計画を使い回す
+--   - 件数が減ることのない INSERT では、0件になった集計行の削除を行わない
+CREATE OR REPLACE FUNCTION rollup_items_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_stock_rollups AS r (category_key, rare, item_rows, in_stock_rows, total_stock)
+    SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''),
+           COUNT(*), COUNT(*) FILTER (WHERE stock > 0), COALESCE(SUM(stock), 0)
+    FROM new_rows
+    GROUP BY 1, 2
+    -- 同時に更新するトランザクション同士でデッドロックしないよう、常に同じ順番で行をロックする
+    ORDER BY 1, 2
+    ON CONFLICT (category_key, rare) DO UPDATE SET
+        item_rows = r.item_rows + EXCLUDED.item_rows,
+        in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+        total_stock = r.total_stock + EXCLUDED.total_stock;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_items_delete() RETURNS trigger AS $$
+BEGIN
+    WITH changes AS (
+        SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+               COUNT(*) AS item_rows, COUNT(*) FILTER (WHERE stock > 0) AS in_stock_rows,
+               COALESCE(SUM(stock), 0) AS total_stock
+        FROM old_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    )
+    UPDATE product_stock_rollups r SET
+        item_rows = r.item_rows - c.item_rows,
+        in_stock_rows = r.in_stock_rows - c.in_stock_rows,
+        total_stock = r.total_stock - c.total_stock
+    FROM changes c
+    WHERE r.category_key = c.category_key AND r.rare = c.rare;
+
+    DELETE FROM product_stock_rollups WHERE item_rows <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_items_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_stock_rollups AS r (category_key, rare, item_rows, in_stock_rows, total_stock)
+    SELECT category_key, rare, SUM(sign), SUM(sign * (stock > 0)::int), SUM(sign * stock)
+    FROM (
+        SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+               COALESCE(stock, 0) AS stock, 1 AS sign
+        FROM new_rows
+        UNION ALL
+        SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''), COALESCE(stock, 0), -1
+        FROM old_rows
+    ) AS changes
+    GROUP BY category_key, rare
+    -- 値が変わらない UPDATE (名前の変更など) では集計の行に触れない
+    HAVING SUM(sign) <> 0 OR SUM(sign * (stock > 0)::int) <> 0 OR SUM(sign * stock) <> 0
+    ORDER BY category_key, rare
+    ON CONFLICT (category_key, rare) DO UPDATE SET
+        item_rows = r.item_rows + EXCLUDED.item_rows,
+        in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+        total_stock = r.total_stock + EXCLUDED.total_stock;
+
+    -- 集計行を増減させた後は毎回ここで表全体を探す (009_rollup_targeted_cleanup.sql で、0件になったキーだけに絞った)
+    IF FOUND THEN
+        DELETE FROM product_stock_rollups WHERE item_rows <= 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION clear_product_stock_rollups() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM product_stock_rollups;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 集計を items から作り直す。作り直している間は items への書き込みを待たせる
+CREATE OR REPLACE FUNCTION rebuild_product_stock_rollups() RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    LOCK TABLE items IN SHARE MODE;
+    DELETE FROM product_stock_rollups;
+    INSERT INTO product_stock_rollups (category_key, rare, item_rows, in_stock_rows, total_stock)
+    SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''),
+           COUNT(*), COUNT(*) FILTER (WHERE stock > 0), COALESCE(SUM(stock), 0)
+    FROM items
+    GROUP BY 1, 2;
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 遷移テーブル (REFERENCING) を使うトリガーは、イベントごとに分けて作る
+DROP TRIGGER IF EXISTS trg_items_rollup_insert ON items;
+CREATE TRIGGER trg_items_rollup_insert
+    AFTER INSERT ON items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_items_insert();
+
+DROP TRIGGER IF EXISTS trg_items_rollup_update ON items;
+CREATE TRIGGER trg_items_rollup_update
+    AFTER UPDATE ON items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_items_update();
+
+DROP TRIGGER IF EXISTS trg_items_rollup_delete ON items;
+CREATE TRIGGER trg_items_rollup_delete
+    AFTER DELETE ON items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_items_delete();
+
+DROP TRIGGER IF EXISTS trg_items_rollup_truncate ON items;
+CREATE TRIGGER trg_items_rollup_truncate
+    AFTER TRUNCATE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION clear_product_stock_rollups();
+
+-- 既存の items から最初の集計を作る
+SELECT rebuild_product_stock_rollups();
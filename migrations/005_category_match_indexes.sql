@@ -0,0 +1,16 @@
+-- 005_category_match_indexes.sql
+-- items.category と products.name の対応付け (LOWER(TRIM(...)) どうしの比較) を索引で引けるようにする。
+-- 一覧画面の LEFT JOIN とカテゴリ診断の anti-join の両方で使う。
+CREATE INDEX IF NOT EXISTS idx_products_name_key ON products (LOWER(TRIM(name)));
+CREATE INDEX IF NOT EXISTS idx_items_category_key ON items (LOWER(TRIM(category)));
+
+-- カテゴリ診断で、製品マスタにないカテゴリに似た製品名を候補として出すための pg_trgm。
+-- 拡張を入れられない環境 (権限がない・パッケージがない) ではスキップし、アプリ側の計算で代わりに求める。
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXECUTE 'CREATE INDEX IF NOT EXISTS idx_products_name_key_trgm ON products USING gin (LOWER(TRIM(name)) gin_trgm_ops)';
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm is not available (%). Category suggestions will be computed in the application.', SQLERRM;
+END;
+$$;
@@ -0,0 +1,18 @@
+-- 006_product_list_indexes.sql
+-- 製品マスタ管理の一覧 (キーセット方式のページング) と検索のための索引。
+-- 並べ替えは NULL を埋めた式と name の組で行うので、同じ式の索引を作る (name 順は主キーを使う)。
+CREATE INDEX IF NOT EXISTS idx_products_release_date_name ON products ((COALESCE(release_date, DATE '0001-01-01')), name);
+CREATE INDEX IF NOT EXISTS idx_products_era_name ON products ((COALESCE(era, -1)), name);
+CREATE INDEX IF NOT EXISTS idx_products_display_name_name ON products ((COALESCE(display_name, '')), name);
+
+-- 製品名・表示名の部分一致検索 (LOWER(...) LIKE '%...%') には pg_trgm の索引を使う。
+-- pg_trgm を入れられない環境ではスキップする (検索は索引なしで動く)。
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXECUTE 'CREATE INDEX IF NOT EXISTS idx_products_name_lower_trgm ON products USING gin (LOWER(name) gin_trgm_ops)';
+    EXECUTE 'CREATE INDEX IF NOT EXISTS idx_products_display_name_lower_trgm ON products USING gin (LOWER(display_name) gin_trgm_ops)';
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm is not available (%). Product search will run without trigram indexes.', SQLERRM;
+END;
+$$;
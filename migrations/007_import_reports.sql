@@ -0,0 +1,37 @@
+-- 007_import_reports.sql
+-- CSVインポートの実行ごとの結果 (import_runs) と、行ごとのエラー・警告 (import_run_issues)。
+-- 結果をフラッシュメッセージ (= Cookie のセッション) に詰め込まず、ここに保存してレポート画面で表示する。
+CREATE TABLE IF NOT EXISTS import_runs (
+    id BIGSERIAL PRIMARY KEY,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ,
+    username TEXT,
+    -- running (実行中・中断) / success / warning / info / failed
+    status TEXT NOT NULL DEFAULT 'running',
+    file_count INTEGER NOT NULL DEFAULT 0,
+    rows_processed INTEGER NOT NULL DEFAULT 0,
+    added INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    skipped_no_change INTEGER NOT NULL DEFAULT 0,
+    skipped_error INTEGER NOT NULL DEFAULT 0,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    warning_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_import_runs_started_at ON import_runs (started_at);
+
+CREATE TABLE IF NOT EXISTS import_run_issues (
+    id BIGSERIAL PRIMARY KEY,
+    run_id BIGINT NOT NULL REFERENCES import_runs (id) ON DELETE CASCADE,
+    filename TEXT,
+    -- CSV の行番号 (ファイル全体の問題は NULL)
+    row_number INTEGER,
+    -- error / warning
+    severity TEXT NOT NULL,
+    message TEXT NOT NULL,
+    -- 問題のあった行の内容 (確認用)
+    row_data TEXT
+);
+-- レポート画面は実行ごとに id 順 (重大度で絞り込む場合も) にキーセット方式でページングする
+CREATE INDEX IF NOT EXISTS idx_import_run_issues_run_id ON import_run_issues (run_id, id);
+CREATE INDEX IF NOT EXISTS idx_import_run_issues_run_severity ON import_run_issues (run_id, severity, id);
@@ -0,0 +1,34 @@
+-- 008_table_version_slots.sql
+-- 版番号 (002_table_versions.sql) を、テーブルごとの1行ではなく接続 (バックエンド) ごとの行に分けて数える。
+-- 1行を全員で UPDATE すると、その行のロックをコミットまで持つので items / products への書き込みが互いに待ち合わせ、
+-- 別々の行を更新しているトランザクションどうしでもデッドロックすることがあった。
+-- 接続ごとの行は同時に1つのトランザクションからしか更新されないので、書き込みが待たされることはない。
+-- 版番号はテーブルごとの合計で、コミットされた変更でだけ増え、減ることはない。
+CREATE TABLE IF NOT EXISTS table_version_slots (
+    table_name TEXT NOT NULL,
+    backend_pid INTEGER NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (table_name, backend_pid)
+);
+
+-- これまでの版番号を引き継ぐ (backend_pid = 0 はどの接続の pid とも重ならない)
+INSERT INTO table_version_slots (table_name, backend_pid, version, updated_at)
+SELECT table_name, 0, version, updated_at FROM table_versions
+ON CONFLICT (table_name, backend_pid) DO NOTHING;
+
+INSERT INTO table_version_slots (table_name, backend_pid, version) VALUES ('items', 0, 1), ('products', 0, 1)
+ON CONFLICT (table_name, backend_pid) DO NOTHING;
+
+-- 行ごとではなく文ごとに1回だけ、この接続の行の版番号を進める (トリガーは 002 のものをそのまま使う)
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_version_slots AS s (table_name, backend_pid, version, updated_at)
+    VALUES (TG_TABLE_NAME, pg_backend_pid(), 1, clock_timestamp())
+    ON CONFLICT (table_name, backend_pid)
+    DO UPDATE SET version = s.version + 1, updated_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TABLE IF EXISTS table_versions;
@@ -0,0 +1,79 @@
+-- 009_rollup_targeted_cleanup.sql
+-- 004_product_stock_rollups.sql の UPDATE / DELETE トリガーは、集計の行を増減させた後に
+-- product_stock_rollups 全体から 0件になった行を探して削除していた。在庫の +/- のたびに表全体を読んでいたので、
+-- 増減させた行のうち 0件になったもの (RETURNING で受け取る) だけを、キーを指定して削除するようにする。
+-- 増減と同じ文の中では更新後の行が見えないので、0件になったキーを変数に受け取ってから別の文で削除する。
+CREATE OR REPLACE FUNCTION rollup_items_delete() RETURNS trigger AS $$
+DECLARE
+    emptied_keys TEXT[];
+    emptied_rares TEXT[];
+BEGIN
+    WITH changes AS (
+        SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+               COUNT(*) AS item_rows, COUNT(*) FILTER (WHERE stock > 0) AS in_stock_rows,
+               COALESCE(SUM(stock), 0) AS total_stock
+        FROM old_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    ), changed AS (
+        UPDATE product_stock_rollups r SET
+            item_rows = r.item_rows - c.item_rows,
+            in_stock_rows = r.in_stock_rows - c.in_stock_rows,
+            total_stock = r.total_stock - c.total_stock
+        FROM changes c
+        WHERE r.category_key = c.category_key AND r.rare = c.rare
+        RETURNING r.category_key, r.rare, r.item_rows
+    )
+    SELECT array_agg(category_key), array_agg(rare) INTO emptied_keys, emptied_rares
+    FROM changed
+    WHERE item_rows <= 0;
+
+    IF emptied_keys IS NOT NULL THEN
+        DELETE FROM product_stock_rollups
+        WHERE (category_key, rare) IN (SELECT * FROM unnest(emptied_keys, emptied_rares))
+          AND item_rows <= 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_items_update() RETURNS trigger AS $$
+DECLARE
+    emptied_keys TEXT[];
+    emptied_rares TEXT[];
+BEGIN
+    WITH changed AS (
+        INSERT INTO product_stock_rollups AS r (category_key, rare, item_rows, in_stock_rows, total_stock)
+        SELECT category_key, rare, SUM(sign), SUM(sign * (stock > 0)::int), SUM(sign * stock)
+        FROM (
+            SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+                   COALESCE(stock, 0) AS stock, 1 AS sign
+            FROM new_rows
+            UNION ALL
+            SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''), COALESCE(stock, 0), -1
+            FROM old_rows
+        ) AS changes
+        GROUP BY category_key, rare
+        -- 値が変わらない UPDATE (名前の変更など) では集計の行に触れない
+        HAVING SUM(sign) <> 0 OR SUM(sign * (stock > 0)::int) <> 0 OR SUM(sign * stock) <> 0
+        ORDER BY category_key, rare
+        ON CONFLICT (category_key, rare) DO UPDATE SET
+            item_rows = r.item_rows + EXCLUDED.item_rows,
+            in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+            total_stock = r.total_stock + EXCLUDED.total_stock
+        RETURNING r.category_key, r.rare, r.item_rows
+    )
+    SELECT array_agg(category_key), array_agg(rare) INTO emptied_keys, emptied_rares
+    FROM changed
+    WHERE item_rows <= 0;
+
+    -- 0件になる集計行ができるのは、カテゴリ・レアリティの変更や削除で行が移った場合だけ。
+    -- 在庫数だけの変更ではここに来ない
+    IF emptied_keys IS NOT NULL THEN
+        DELETE FROM product_stock_rollups
+        WHERE (category_key, rare) IN (SELECT * FROM unnest(emptied_keys, emptied_rares))
+          AND item_rows <= 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,139 @@
+-- 010_product_stock_rollup_slots.sql
+-- 製品別在庫の集計 (004_product_stock_rollups.sql) を、(製品, レアリティ) ごとの1行ではなく、
+-- 接続 (バックエンド) ごとの増減の行に分けて持つ。版番号 (008_table_version_slots.sql) と同じ考え方。
+-- 1行を全員で増減させると、その行のロックをコミットまで持つので、長いCSVインポートの間は同じ製品・レアリティの
+-- 在庫の +/- が待たされ、別の順番で行を更新するトランザクションどうしはデッドロックすることがあった。
+-- 接続ごとの行は同時に1つのトランザクションからしか更新されないので、集計のせいで書き込みが待たされることはない。
+-- 読むときは product_stock_rollups (ビュー) で合計する。行は接続の数だけ増えるので、
+-- rebuild_rollups.py --compact (compact_product_stock_rollups()) で時々 backend_pid = 0 の行にまとめる。
+CREATE TABLE IF NOT EXISTS product_stock_rollup_slots (
+    category_key TEXT NOT NULL,
+    rare TEXT NOT NULL,
+    backend_pid INTEGER NOT NULL,
+    item_rows INTEGER NOT NULL DEFAULT 0,
+    in_stock_rows INTEGER NOT NULL DEFAULT 0,
+    total_stock BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (category_key, rare, backend_pid)
+);
+
+-- これまでの集計を引き継ぐ (backend_pid = 0 はどの接続の pid とも重ならない)
+INSERT INTO product_stock_rollup_slots (category_key, rare, backend_pid, item_rows, in_stock_rows, total_stock)
+SELECT category_key, rare, 0, item_rows, in_stock_rows, total_stock FROM product_stock_rollups
+ON CONFLICT (category_key, rare, backend_pid) DO NOTHING;
+
+DROP TABLE product_stock_rollups;
+
+-- 0件になった (製品, レアリティ) は出さない (以前は集計の行を削除していた)
+CREATE VIEW product_stock_rollups AS
+SELECT category_key, rare,
+       SUM(item_rows)::integer AS item_rows,
+       SUM(in_stock_rows)::integer AS in_stock_rows,
+       SUM(total_stock)::bigint AS total_stock
+FROM product_stock_rollup_slots
+GROUP BY category_key, rare
+HAVING SUM(item_rows) > 0;
+
+-- 変更された行の増減を、この接続の行に足す。文ごとに1回まとめて反映する
+CREATE OR REPLACE FUNCTION rollup_items_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_stock_rollup_slots AS r (category_key, rare, backend_pid, item_rows, in_stock_rows, total_stock)
+    SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''), pg_backend_pid(),
+           COUNT(*), COUNT(*) FILTER (WHERE stock > 0), COALESCE(SUM(stock), 0)
+    FROM new_rows
+    GROUP BY 1, 2
+    ON CONFLICT (category_key, rare, backend_pid) DO UPDATE SET
+        item_rows = r.item_rows + EXCLUDED.item_rows,
+        in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+        total_stock = r.total_stock + EXCLUDED.total_stock;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_items_delete() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_stock_rollup_slots AS r (category_key, rare, backend_pid, item_rows, in_stock_rows, total_stock)
+    SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''), pg_backend_pid(),
+           -COUNT(*), -COUNT(*) FILTER (WHERE stock > 0), -COALESCE(SUM(stock), 0)
+    FROM old_rows
+    GROUP BY 1, 2
+    ON CONFLICT (category_key, rare, backend_pid) DO UPDATE SET
+        item_rows = r.item_rows + EXCLUDED.item_rows,
+        in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+        total_stock = r.total_stock + EXCLUDED.total_stock;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_items_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_stock_rollup_slots AS r (category_key, rare, backend_pid, item_rows, in_stock_rows, total_stock)
+    SELECT category_key, rare, pg_backend_pid(), SUM(sign), SUM(sign * (stock > 0)::int), SUM(sign * stock)
+    FROM (
+        SELECT COALESCE(LOWER(TRIM(category)), '') AS category_key, COALESCE(rare, '') AS rare,
+               COALESCE(stock, 0) AS stock, 1 AS sign
+        FROM new_rows
+        UNION ALL
+        SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''), COALESCE(stock, 0), -1
+        FROM old_rows
+    ) AS changes
+    GROUP BY category_key, rare
+    -- 値が変わらない UPDATE (名前の変更など) では集計の行に触れない
+    HAVING SUM(sign) <> 0 OR SUM(sign * (stock > 0)::int) <> 0 OR SUM(sign * stock) <> 0
+    ON CONFLICT (category_key, rare, backend_pid) DO UPDATE SET
+        item_rows = r.item_rows + EXCLUDED.item_rows,
+        in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+        total_stock = r.total_stock + EXCLUDED.total_stock;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION clear_product_stock_rollups() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM product_stock_rollup_slots;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 集計を items から作り直す。作り直している間は items への書き込みを待たせる
+CREATE OR REPLACE FUNCTION rebuild_product_stock_rollups() RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    LOCK TABLE items IN SHARE MODE;
+    DELETE FROM product_stock_rollup_slots;
+    INSERT INTO product_stock_rollup_slots (category_key, rare, backend_pid, item_rows, in_stock_rows, total_stock)
+    SELECT COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, ''), 0,
+           COUNT(*), COUNT(*) FILTER (WHERE stock > 0), COALESCE(SUM(stock), 0)
+    FROM items
+    GROUP BY 1, 2;
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 接続ごとの行を backend_pid = 0 の行に足し込んで削除し、まとめた行数を返す。合計 (ビューの値) は変わらない。
+-- 書き込み中のトランザクションの行はコミットまで待つが、items への書き込みは待たせない
+CREATE OR REPLACE FUNCTION compact_product_stock_rollups() RETURNS INTEGER AS $$
+DECLARE
+    compacted INTEGER;
+BEGIN
+    WITH moved AS (
+        DELETE FROM product_stock_rollup_slots
+        WHERE backend_pid <> 0
+        RETURNING category_key, rare, item_rows, in_stock_rows, total_stock
+    )
+    INSERT INTO product_stock_rollup_slots AS r (category_key, rare, backend_pid, item_rows, in_stock_rows, total_stock)
+    SELECT category_key, rare, 0, SUM(item_rows), SUM(in_stock_rows), SUM(total_stock)
+    FROM moved
+    GROUP BY category_key, rare
+    ON CONFLICT (category_key, rare, backend_pid) DO UPDATE SET
+        item_rows = r.item_rows + EXCLUDED.item_rows,
+        in_stock_rows = r.in_stock_rows + EXCLUDED.in_stock_rows,
+        total_stock = r.total_stock + EXCLUDED.total_stock;
+    GET DIAGNOSTICS compacted = ROW_COUNT;
+
+    DELETE FROM product_stock_rollup_slots
+    WHERE backend_pid = 0 AND item_rows = 0 AND in_stock_rows = 0 AND total_stock = 0;
+    RETURN compacted;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,4 @@
+-- 011_item_list_filter_indexes.sql
+-- 一覧画面のカテゴリでの絞り込み (queries.ITEM_LIST_FILTER_CONDITIONS の i.category = $1) 用の索引。
+-- 絞り込みを文の形にしたので、PREPARE した文の汎用の実行計画でもこの索引を使える。
+CREATE INDEX IF NOT EXISTS idx_items_category ON items (category);
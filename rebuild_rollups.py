@@ -0,0 +1,105 @@
+# rebuild_rollups.py
+# 製品ごとの在庫の集計 (product_stock_rollups) を items から作り直すスクリプト。
+# 集計はトリガーで更新しているので通常は不要だが、トリガーを外して直接データを入れた場合などのずれを直すのに使う。
+# 集計は接続ごとの増減の行に分けて持っているので、--compact を cron などで時々実行して1行にまとめる。
+#
+# 例:
+#   python rebuild_rollups.py --check     # ずれを表示するだけ
+#   python rebuild_rollups.py --yes       # 確認なしで作り直す
+#   python rebuild_rollups.py --compact   # 接続ごとの行をまとめるだけ (items への書き込みは待たせない)
+import argparse
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+from app import rollups
+
+
+def get_db_connection_local():
+    """
+    ローカル環境変数ファイル (.env) からデータベースURLを読み込み接続を確立します。
+    """
+    dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
+    if os.path.exists(dotenv_path):
+        load_dotenv(dotenv_path)
+        print(f"INFO: Loaded environment variables from {dotenv_path}")
+    else:
+        flaskenv_path = os.path.join(os.path.dirname(__file__), '.flaskenv')
+        if os.path.exists(flaskenv_path):
+            load_dotenv(flaskenv_path)
+            print(f"INFO: Loaded environment variables from {flaskenv_path}")
+        else:
+            print("WARNING: .env or .flaskenv file not found in the script's directory. DATABASE_URL must be set in the system environment.")
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("CRITICAL: DATABASE_URL environment variable not set. Cannot connect to the database.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        return psycopg2.connect(db_url)
+    except psycopg2.Error as e:
+        print(f"CRITICAL: Database connection failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def print_drift(drift, limit=20):
+    for category_key, rare, stored, actual in drift[:limit]:
+        print(f"  {category_key or '(カテゴリなし)'} / {rare or '(レアリティなし)'}: 集計 {stored} -> 実際 {actual}")
+    if len(drift) > limit:
+        print(f"  ... ほか {len(drift) - limit} 件")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="製品ごとの在庫の集計を items から作り直します。")
+    parser.add_argument('--check', action='store_true', help="作り直さずに、ずれている集計を表示するだけにする")
+    parser.add_argument('--yes', action='store_true', help="確認を行わずに実行する (cron などの非対話実行用)")
+    parser.add_argument('--compact', action='store_true', help="作り直さずに、接続ごとの増減の行を1行にまとめるだけにする")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("--- 製品別在庫集計の再構築スクリプト ---")
+    conn = get_db_connection_local()
+    try:
+        if args.compact:
+            with conn.cursor() as cur:
+                compacted = rollups.compact(cur)
+            conn.commit()
+            print(f"SUCCESS: 集計の行をまとめました ({compacted} 件)。")
+            return 0
+        with conn.cursor() as cur:
+            drift = rollups.find_drift(cur)
+        conn.rollback()
+        if not drift:
+            print("INFO: 集計のずれはありません。")
+        else:
+            print(f"WARNING: {len(drift)} 件の集計がずれています。")
+            print_drift(drift)
+        if args.check:
+            return 1 if drift else 0
+
+        proceed = 'yes' if args.yes else input("集計を作り直しますか？ (yes/no): ").strip().lower()
+        if proceed != 'yes':
+            print("スクリプトの実行を中止しました。")
+            return 0
+        with conn.cursor() as cur:
+            rebuilt = rollups.rebuild(cur)
+        conn.commit()
+        print(f"SUCCESS: 集計を作り直しました ({rebuilt} 行)。")
+        return 0
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        print("ERROR: 集計テーブルがありません。先に apply_migrations.py を実行してください。", file=sys.stderr)
+        return 1
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"ERROR: 集計の再構築中にエラーが発生しました: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
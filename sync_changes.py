@@ -0,0 +1,143 @@
+# sync_changes.py
+# 変更フィード (app/changefeed.py) から、前回以降に更新・削除された行を取り出して JSON Lines で出力するスクリプト。
+# 外部の在庫表や検索インデックスへの差分同期に使う。テーブル全体を毎回エクスポートする必要はない。
+#
+# 例:
+#   python sync_changes.py --entity items --state-file .sync_items.state --output changes.jsonl
+#   python sync_changes.py --entity products --follow --interval 30
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from app import changefeed, config
+
+
+def get_db_connection_local():
+    """
+    ローカル環境変数ファイル (.env) からデータベースURLを読み込み接続を確立します。
+    """
+    dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
+    if os.path.exists(dotenv_path):
+        load_dotenv(dotenv_path)
+        print(f"INFO: Loaded environment variables from {dotenv_path}", file=sys.stderr)
+    else:
+        flaskenv_path = os.path.join(os.path.dirname(__file__), '.flaskenv')
+        if os.path.exists(flaskenv_path):
+            load_dotenv(flaskenv_path)
+            print(f"INFO: Loaded environment variables from {flaskenv_path}", file=sys.stderr)
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("CRITICAL: DATABASE_URL environment variable not set. Cannot connect to the database.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        return psycopg2.connect(db_url)
+    except psycopg2.Error as e:
+        print(f"CRITICAL: Database connection failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def read_state(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip() or None
+
+def write_state(path, watermark):
+    """ 途中で止まっても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(watermark)
+    os.replace(tmp_path, path)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def write_changes(out, entity, changes):
+    """ 1行に1件、{"op": "upsert" | "delete", "entity": ..., "row": {...}} の形で書き出す """
+    for op, rows in (('upsert', changes['upserts']), ('delete', changes['deletes'])):
+        for row in rows:
+            out.write(json.dumps({'op': op, 'entity': entity, 'row': row}, ensure_ascii=False, default=_json_default))
+            out.write('\n')
+    out.flush()
+
+
+def sync(conn, entity, watermark, batch_size, out, state_file=None):
+    """ has_more が false になるまで変更を読み進め、最後のウォーターマークと件数を返す """
+    upserts = deletes = 0
+    while True:
+        with conn.cursor() as cur:
+            changes = changefeed.fetch_changes(cur, entity, watermark, batch_size)
+        conn.rollback()  # 読み取りだけなので、長いトランザクションを残さない
+        write_changes(out, entity, changes)
+        upserts += len(changes['upserts'])
+        deletes += len(changes['deletes'])
+        watermark = changes['next']
+        # 出力を書き終えてからウォーターマークを保存する (途中で落ちたら同じ変更をもう一度出す)
+        if state_file:
+            write_state(state_file, watermark)
+        if not changes['has_more']:
+            return watermark, upserts, deletes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="前回以降に更新・削除された行を JSON Lines で出力します。")
+    parser.add_argument('--entity', choices=sorted(changefeed.ENTITIES), default='items', help="対象の種類")
+    parser.add_argument('--since', help="このウォーターマークより後の変更を出力する (省略時は --state-file の値、なければ最初から)")
+    parser.add_argument('--state-file', help="ウォーターマークを読み書きするファイル (実行のたびに続きから出力する)")
+    parser.add_argument('--batch-size', type=int, default=config.CHANGE_FEED_BATCH_SIZE, help="1回に読み取る最大件数")
+    parser.add_argument('--output', help="出力先のファイル (追記。省略時は標準出力)")
+    parser.add_argument('--follow', action='store_true', help="終了せずに、一定間隔で新しい変更を出力し続ける")
+    parser.add_argument('--interval', type=float, default=10.0, help="--follow のときの確認間隔 (秒)")
+    parser.add_argument('--prune-tombstones-days', type=int,
+                        help="指定した日数より前の削除記録 (tombstone) を消してから実行する")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    watermark = args.since or read_state(args.state_file)
+    try:
+        changefeed.decode_watermark(watermark, args.entity)
+    except changefeed.WatermarkError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+    conn = get_db_connection_local()
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        if args.prune_tombstones_days is not None:
+            with conn.cursor() as cur:
+                pruned = changefeed.prune_tombstones(cur, args.prune_tombstones_days)
+            conn.commit()
+            print(f"INFO: {args.prune_tombstones_days} 日より前の削除記録を {pruned} 件削除しました。", file=sys.stderr)
+
+        while True:
+            watermark, upserts, deletes = sync(conn, args.entity, watermark, args.batch_size, out, args.state_file)
+            if upserts or deletes or not args.follow:
+                print(f"INFO: 更新 {upserts} 件, 削除 {deletes} 件を出力しました。次回のウォーターマーク: {watermark}", file=sys.stderr)
+            if not args.follow:
+                return 0
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("INFO: 中断しました。", file=sys.stderr)
+        return 0
+    except psycopg2.Error as e:
+        print(f"ERROR: 変更の読み取り中にエラーが発生しました: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# tests/test_analytics.py
+from app import analytics
+
+def _row(grouping, era=None, rare=None, category_key=None, stats=(0, 0, 0), product_name=None, display_name=None):
+    item_rows, in_stock_rows, total_stock = stats
+    return {'grouping': grouping, 'era': era, 'rare': rare, 'category_key': category_key,
+            'product_name': product_name, 'display_name': display_name,
+            'item_rows': item_rows, 'in_stock_rows': in_stock_rows, 'total_stock': total_stock}
+
+def test_build_summary_from_grouping_sets():
+    """
+    GROUPING SETS の各行が、全体・期別・レアリティ別・期×レアリティ別・製品別に振り分けられるかテストする。
+    """
+    rows = [
+        _row(0b111, stats=(10, 6, 30)),
+        _row(0b011, era=12, stats=(8, 5, 25)),
+        _row(0b011, era=None, stats=(2, 1, 5)),
+        _row(0b101, rare='SR', stats=(4, 4, 20)),
+        _row(0b001, era=12, rare='SR', stats=(3, 3, 18)),
+        _row(0b010, era=12, category_key='seta', product_name='SetA', display_name='Set A', stats=(5, 4, 20)),
+        _row(0b010, era=12, category_key='setb', product_name='SetB', display_name='Set B', stats=(3, 1, 5)),
+        _row(0b010, era=None, category_key='unknown', stats=(2, 1, 5)),
+    ]
+    summary = analytics.build_summary(rows)
+
+    assert summary.total.total_stock == 30
+    assert summary.total.in_stock_percent == 60.0
+    assert summary.by_era_rarity[(12, 'SR')].total_stock == 18
+    assert summary.eras() == [12, None]
+    assert [p[1] for p in summary.top_products(2)] == ['Set A', 'Set B']
+
+def test_rollup_and_items_sources_agree(db_session):
+    """
+    集計テーブルから求めた結果と、items から直接求めた結果が一致するかテストする。
+    """
+    cursor = db_session.cursor()
+    from_rollups = analytics.compute_summary(cursor)
+    cursor.execute(analytics._SUMMARY_QUERY.format(source=analytics._ITEMS_SOURCE))
+    from_items = analytics.build_summary(cursor.fetchall())
+
+    assert from_rollups.total.total_stock == from_items.total.total_stock
+    assert {era: s.total_stock for era, s in from_rollups.by_era.items()} == {era: s.total_stock for era, s in from_items.by_era.items()}
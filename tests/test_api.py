@@ -0,0 +1,38 @@
+# tests/test_api.py
+from app import api, queries
+
+def test_cursor_round_trip():
+    """
+    next_cursor に入れた値が、そのまま取り出せるかテストする。
+    """
+    cursor = api.encode_cursor('name', 'desc', 'ブラック・マジシャン', 42, 'abcd')
+
+    assert '=' not in cursor
+    assert api.decode_cursor(cursor) == ('name', 'desc', 'ブラック・マジシャン', 42, 'abcd')
+
+def test_invalid_parameters_return_400(client):
+    """
+    不明な項目・不正なカーソル・検索条件の違うカーソルが 400 になるかテストする。
+    """
+    response = client.get('/api/v1/items?fields=id,unknown')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+    assert client.get('/api/items?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/items?sort=release_date').status_code == 400
+    assert client.get('/api/items?limit=0').status_code == 400
+
+    other_cursor = api.encode_cursor('id', 'asc', 10, 10, 'not-the-same-filters')
+    assert client.get(f'/api/items?cursor={other_cursor}').status_code == 400
+
+def test_cursor_with_mistyped_sort_value_returns_400(client):
+    """
+    検索条件が同じでも、ソート値の型がソートキーと合わないカーソルは DB に渡さずに 400 になるかテストする。
+    """
+    search_field, filter_shape, filter_params = queries.item_list_filter_params(False, '', 'all', None)
+    for sort_by, sort_value in (('name', ['a']), ('name', {'a': 1}), ('name', 5), ('stock', '5'), ('id', True)):
+        digest = api._filters_digest(search_field, filter_shape, filter_params, sort_by, 'asc')
+        cursor = api.encode_cursor(sort_by, 'asc', sort_value, 1, digest)
+        response = client.get(f'/api/v1/items?sort={sort_by}&cursor={cursor}')
+        assert response.status_code == 400, (sort_by, sort_value)
+        assert response.get_json()['message'] == "cursor が不正です。"
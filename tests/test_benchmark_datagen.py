@@ -0,0 +1,41 @@
+# tests/test_benchmark_datagen.py
+import csv
+import io
+
+from benchmarks import datagen
+
+def test_generated_catalogue_is_deterministic():
+    """
+    同じ seed からは同じ製品・カード・CSV が生成されるかテストする。
+    """
+    products = datagen.generate_products(20, seed=7)
+    items = datagen.generate_items(500, products, seed=7)
+
+    assert products == datagen.generate_products(20, seed=7)
+    assert items == datagen.generate_items(500, products, seed=7)
+    assert datagen.generate_import_csv(100, seed=7, existing_items=items) == datagen.generate_import_csv(100, seed=7, existing_items=items)
+    assert items != datagen.generate_items(500, products, seed=8)
+
+def test_generated_items_are_unique_per_card_and_rarity():
+    """
+    生成したカードの (card_id, rare) が重複せず、すべて既存の製品に属しているかテストする。
+    """
+    products = datagen.generate_products(10, seed=1)
+    items = datagen.generate_items(2000, products, seed=1)
+    product_names = {p['name'] for p in products}
+
+    assert len(items) == 2000
+    assert len({(i['card_id'], i['rare']) for i in items}) == len(items)
+    assert all(i['category'] in product_names for i in items)
+    assert len({p['name'] for p in products}) == len(products)
+
+def test_generated_import_csv_format():
+    """
+    インポート用 CSV が BOM 付き UTF-8 で、想定したヘッダーと行数になっているかテストする。
+    """
+    data = datagen.generate_import_csv(50, seed=3)
+
+    assert data.startswith(b'\xef\xbb\xbf')
+    rows = list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+    assert rows[0] == datagen.IMPORT_CSV_HEADERS
+    assert len(rows) == 51
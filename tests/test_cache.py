@@ -0,0 +1,69 @@
+# tests/test_cache.py
+import datetime
+
+from app import queries, versioning
+from app.cache import VersionedLRUCache
+from app.db import get_db_connection
+
+def test_versioned_cache_drops_stale_and_old_entries():
+    """
+    版番号が変わった値は返さず、上限を超えたら古いものから追い出されるかテストする。
+    """
+    cache = VersionedLRUCache(2)
+    cache.set('a', (1, 1), 'A')
+    cache.set('b', (1, 1), 'B')
+
+    assert cache.get('a', (1, 1)) == 'A'
+    assert cache.get('a', (2, 1)) is None
+
+    cache.set('c', (1, 1), 'C')
+    assert cache.get('b', (1, 1)) is None
+    assert cache.get('a', (1, 1)) == 'A'
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_not_modified_response(app):
+    """
+    If-None-Match / If-Modified-Since が現在の内容と一致する場合だけ 304 が返るかテストする。
+    """
+    etag = versioning.make_etag('index', (3, 5), 'crosayo')
+    modified_at = datetime.datetime(2025, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc)
+
+    with app.test_request_context('/', headers={'If-None-Match': f'W/"{etag}"'}):
+        response = versioning.not_modified_response(etag, modified_at)
+        assert response.status_code == 304
+        assert response.headers['ETag'] == f'W/"{etag}"'
+    with app.test_request_context('/', headers={'If-None-Match': '"other"', 'If-Modified-Since': 'Thu, 02 Jan 2025 03:04:05 GMT'}):
+        assert versioning.not_modified_response(etag, modified_at) is None
+    with app.test_request_context('/', headers={'If-Modified-Since': 'Thu, 02 Jan 2025 03:04:05 GMT'}):
+        assert versioning.not_modified_response(etag, modified_at).status_code == 304
+    with app.test_request_context('/'):
+        assert versioning.not_modified_response(etag, modified_at) is None
+    assert versioning.make_etag('index', (3, 6), 'crosayo') != etag
+
+def test_version_bump_does_not_block_concurrent_writes(db_session):
+    """
+    別々の接続で items を更新しても版番号の更新で待たされず、コミット前の変更では版番号が進まないかテストする。
+    """
+    other = get_db_connection()
+    try:
+        cursor = db_session.cursor()
+        other_cursor = other.cursor()
+        queries.execute(other_cursor, 'table_versions')
+        before = {row['table_name']: row['version'] for row in other_cursor.fetchall()}
+        other.rollback()
+
+        cursor.execute("SELECT id FROM items ORDER BY id LIMIT 2")
+        first_id, second_id = [row[0] for row in cursor.fetchall()]
+        cursor.execute("UPDATE items SET stock = stock WHERE id = %s", (first_id,))
+
+        other_cursor.execute("SET LOCAL lock_timeout = '1s'")
+        other_cursor.execute("UPDATE items SET stock = stock WHERE id = %s", (second_id,))
+        other.rollback()
+
+        queries.execute(other_cursor, 'table_versions')
+        after = {row['table_name']: row['version'] for row in other_cursor.fetchall()}
+        assert after['items'] == before['items']
+    finally:
+        other.rollback()
+        other.close()
@@ -0,0 +1,45 @@
+# tests/test_changefeed.py
+import datetime
+
+import pytest
+
+from app import changefeed
+
+def test_watermark_round_trip():
+    """
+    next に入れた更新日時・キーと削除日時・tombstone_id が、そのまま取り出せるかテストする。
+    """
+    changed_at = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+    deleted_at = datetime.datetime(2024, 5, 2, 8, 0, tzinfo=datetime.timezone.utc)
+
+    watermark = changefeed.encode_watermark(changed_at, 'ブラック・マジシャン', deleted_at, 7)
+    assert '=' not in watermark
+    assert changefeed.decode_watermark(watermark, 'products') == (changed_at, 'ブラック・マジシャン', deleted_at, 7)
+
+    # ウォーターマークを渡さなければ最初から
+    assert changefeed.decode_watermark(None, 'items') == (None, 0, None, 0)
+    assert changefeed.decode_watermark('', 'products') == (None, '', None, 0)
+
+def test_invalid_watermark():
+    """
+    壊れたウォーターマークや、別の種類のウォーターマークが WatermarkError になるかテストする。
+    """
+    with pytest.raises(changefeed.WatermarkError):
+        changefeed.decode_watermark('not-a-watermark', 'items')
+
+    # products (キーが文字列) のウォーターマークは items (キーが整数) には使えない
+    products_watermark = changefeed.encode_watermark(None, 'LOB', None, 0)
+    with pytest.raises(changefeed.WatermarkError):
+        changefeed.decode_watermark(products_watermark, 'items')
+
+def test_changes_endpoint_rejects_bad_requests(client):
+    """
+    不明な種類は 404、不正なウォーターマーク・件数は 400 になるかテストする。
+    """
+    assert client.get('/api/v1/changes/users').status_code == 404
+
+    response = client.get('/api/v1/changes/items?since=not-a-watermark')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+    assert client.get('/api/v1/changes/products?limit=abc').status_code == 400
@@ -0,0 +1,43 @@
+# tests/test_columnar.py
+import io
+
+import pytest
+
+from app import columnar
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.ipc
+import pyarrow.parquet
+
+
+def test_snapshot_round_trip(db_session):
+    """
+    Parquet / Arrow IPC に書き出したスナップショットが、型 (整数・日付・辞書エンコード) を保ったまま読み戻せるかテストする。
+    バッチが複数になっても、辞書が1つにまとまること。
+    """
+    cursor = db_session.cursor()
+    for i, rare in enumerate(['SR', 'UR', 'SR']):
+        cursor.execute(
+            "INSERT INTO items (name, card_id, rare, stock, category) VALUES (%s, %s, %s, %s, 'テストカテゴリ')",
+            (f'テスト・カード{i}', f'TEST-JP{i:03}', rare, i + 1)
+        )
+
+    table = columnar.read_snapshot_table(db_session, batch_size=2)
+    assert table.schema == columnar.snapshot_schema(pa)
+    assert table.column('rare').num_chunks == 1
+
+    for fmt in columnar.FORMATS:
+        sink = io.BytesIO()
+        columnar.write_snapshot(table, sink, fmt)
+        sink.seek(0)
+        if fmt == 'parquet':
+            loaded = pyarrow.parquet.read_table(sink)
+        else:
+            loaded = pyarrow.ipc.open_file(sink).read_all()
+        assert loaded.num_rows == table.num_rows
+        assert loaded.schema.field('stock').type == pa.int32()
+        assert pa.types.is_dictionary(loaded.schema.field('rare').type)
+        rows = [row for row in loaded.to_pylist() if row['category'] == 'テストカテゴリ']
+        assert [(row['card_id'], row['rare'], row['stock']) for row in rows] == [
+            ('TEST-JP000', 'SR', 1), ('TEST-JP001', 'UR', 2), ('TEST-JP002', 'SR', 3)
+        ]
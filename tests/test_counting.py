@@ -0,0 +1,33 @@
+# tests/test_counting.py
+from app import counting
+from app.counting import RowCount
+
+def test_round_estimate():
+    """
+    見積もりの件数が上から2桁に丸められるかテストする。
+    """
+    assert counting._round_estimate(87) == 87
+    assert counting._round_estimate(1334) == 1300
+    assert counting._round_estimate(1351) == 1400
+    assert counting._round_estimate(2468135) == 2500000
+
+def test_exact_from_page():
+    """
+    取得したページの行数から、見積もりの件数が正しく補正されるかテストする。
+    """
+    estimate = RowCount(1300, False)
+
+    # 途中で終わったページがあれば件数が確定する
+    settled = counting.exact_from_page(estimate, 40, 14, 20)
+    assert (settled.count, settled.exact) == (54, True)
+    empty = counting.exact_from_page(estimate, 0, 0, 20)
+    assert (empty.count, empty.exact) == (0, True)
+
+    # 見積もりより先まで行があれば、次のページがあることが分かるようにする
+    beyond = counting.exact_from_page(estimate, 1280, 20, 20)
+    assert (beyond.count, beyond.exact) == (1301, False)
+
+    # 見積もりの範囲内なら何もしない
+    assert counting.exact_from_page(estimate, 20, 20, 20) is estimate
+    exact = RowCount(5, True)
+    assert counting.exact_from_page(exact, 0, 3, 20) is exact
@@ -0,0 +1,74 @@
+# tests/test_csv_ingest.py
+import csv
+import io
+
+import pytest
+
+from app import csv_ingest
+
+def _rows(text, spec=csv_ingest.ITEM_CSV_SPEC):
+    reader = csv.reader(io.StringIO(text))
+    compiled = csv_ingest.read_header(reader, spec)
+    return list(csv_ingest.iter_rows(reader, compiled))
+
+def test_header_aliases_and_row_decoding():
+    """
+    日本語のヘッダー名・大文字小文字・前後の空白を吸収し、項目の順のタプルとして行を読めるかテストする。
+    """
+    rows = _rows("在庫数, 名前 ,Rare,型番\n3, ブラック・マジシャン ,UR,LOB-JP001\n\n,青眼の白龍,SE\n")
+
+    assert rows == [
+        (1, ('ブラック・マジシャン', 'LOB-JP001', 'UR', 3, ''), None),
+        (2, ('青眼の白龍', '', 'SE', 0, ''), None),
+    ]
+
+def test_row_problems():
+    """
+    必須項目が空の行と、在庫数が不正な行が問題として報告されるかテストする。
+    """
+    rows = _rows("name,rare,stock\n,UR,1\nカードA,N,abc\nカードB,,x\n")
+
+    assert rows[0][2] == (csv_ingest.MISSING_REQUIRED, 'name', '')
+    assert rows[1][1] == ('カードA', '', 'N', 0, '')
+    assert rows[1][2] == (csv_ingest.INVALID_INTEGER, 'stock', 'abc')
+    assert rows[2][2][0] == csv_ingest.MISSING_REQUIRED
+
+def test_compiled_header_is_cached_and_validated():
+    """
+    同じヘッダーには同じ対応付けが再利用され、必須列がないヘッダーはエラーになるかテストする。
+    """
+    header = ('製品名', '発売日', '表示名')
+    compiled = csv_ingest.compile_header(csv_ingest.PRODUCT_CSV_SPEC, header)
+
+    assert csv_ingest.compile_header(csv_ingest.PRODUCT_CSV_SPEC, header) is compiled
+    assert compiled.has('display_name') and not compiled.has('show_in_sidebar')
+    with pytest.raises(csv_ingest.CsvHeaderError) as excinfo:
+        csv_ingest.compile_header(csv_ingest.ITEM_CSV_SPEC, ('name', 'stock'))
+    assert excinfo.value.missing == ['rare']
+    assert csv_ingest.read_header(csv.reader(io.StringIO('')), csv_ingest.ITEM_CSV_SPEC) is None
+
+class _ForwardOnlyStream:
+    """ seek できないアップロードのストリームの代わり """
+    def __init__(self, data):
+        self._buffer = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+def test_upload_text_stream_reads_in_one_pass():
+    """
+    BOM 付きのアップロードを先頭から読み、読み取ったバイト位置から進捗を求められるかテストする。
+    seek できないストリームは一時ファイルに移してから読むこともテストする。
+    """
+    data = '\ufeff名前,レアリティ\n"改行を\n含む名前",N\nカードB,R\n'.encode('utf-8')
+
+    for source in (io.BytesIO(data), _ForwardOnlyStream(data)):
+        upload = csv_ingest.UploadTextStream(source)
+        assert upload.total_bytes == len(data)
+        reader = csv.reader(upload.text)
+        compiled = csv_ingest.read_header(reader, csv_ingest.ITEM_CSV_SPEC)
+        rows = [values for _, values, _ in csv_ingest.iter_rows(reader, compiled)]
+        assert [row[0] for row in rows] == ['改行を\n含む名前', 'カードB']
+        assert upload.bytes_read() == len(data)
+        assert upload.progress_percent() == 100.0
+        upload.close()
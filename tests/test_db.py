@@ -65,4 +65,59 @@ def test_add_and_get_item(db_session):
     assert inserted_item['name'] == test_card['name']
     assert inserted_item['stock'] == test_card['stock']
     
-    # テストが終わると、db_sessionが自動的にこのINSERTをロールバック（取り消し）してくれます。
\ No newline at end of file
+    # テストが終わると、db_sessionが自動的にこのINSERTをロールバック（取り消し）してくれます。
+
+def test_rename_category_in_batches(db_session):
+    """
+    製品名の変更で、表記ゆれ (大文字小文字・前後の空白) を含むカテゴリのカードが
+    バッチに分けてすべて書き換わり、別のカテゴリのカードは変わらないかテストする。
+    """
+    from app.db import count_items_to_rename, rename_category_in_batches
+
+    cursor = db_session.cursor()
+    for i, category in enumerate(['テスト製品', 'テスト製品 ', 'テスト製品', '別のテスト製品', 'テスト製品']):
+        cursor.execute(
+            "INSERT INTO items (name, card_id, rare, stock, category) VALUES (%s, %s, 'N', 1, %s)",
+            (f'テスト・カード{i}', f'TEST-JP{i:03}', category)
+        )
+
+    assert count_items_to_rename(cursor, 'テスト製品', '新テスト製品') == 4
+
+    progress = []
+    assert rename_category_in_batches(cursor, 'テスト製品', '新テスト製品', batch_size=3, on_batch=progress.append) == 4
+    assert progress == [3, 4]
+
+    cursor.execute("SELECT category, COUNT(*) FROM items WHERE card_id LIKE 'TEST-JP%%' GROUP BY category")
+    assert {row[0]: row[1] for row in cursor.fetchall()} == {'新テスト製品': 4, '別のテスト製品': 1}
+    assert count_items_to_rename(cursor, 'テスト製品', '新テスト製品') == 0
+
+def test_delete_items_in_batches_single_transaction(db_session):
+    """
+    commit_each_batch=False ではバッチに分けてもコミットせず、ロールバックで全件元に戻るかテストする。
+    """
+    from app.db import delete_items_in_batches
+
+    cursor = db_session.cursor()
+    item_ids = []
+    for i in range(3):
+        cursor.execute(
+            "INSERT INTO items (name, card_id, rare, stock, category) VALUES (%s, %s, 'N', 0, 'テスト製品') RETURNING id",
+            (f'テスト・削除カード{i}', f'TDEL-JP{i:03}')
+        )
+        item_ids.append(cursor.fetchone()[0])
+    db_session.commit()
+
+    try:
+        progress = []
+        deleted = delete_items_in_batches(db_session, item_ids, batch_size=2, commit_each_batch=False,
+                                          on_batch=lambda rows, done, total: progress.append(done))
+        assert deleted == 3
+        assert progress == [2, 3]
+        db_session.rollback()
+
+        cursor.execute("SELECT COUNT(*) FROM items WHERE id = ANY(%s)", (item_ids,))
+        assert cursor.fetchone()[0] == 3
+    finally:
+        db_session.rollback()
+        cursor.execute("DELETE FROM items WHERE id = ANY(%s)", (item_ids,))
+        db_session.commit()
@@ -0,0 +1,47 @@
+# tests/test_duplicates.py
+from app import duplicates
+from app.utils import normalize_for_search
+
+def test_cluster_blocks_joins_overlapping_groups():
+    """
+    共通の行を持つブロックが1つのクラスタにつながり、クラスタが id 順に並ぶかテストする。
+    """
+    blocks = [[5, 9], [1, 3], [9, 12], [3, 7], [20, 21]]
+
+    assert duplicates.cluster_blocks(blocks) == [[1, 3, 7], [5, 9, 12], [20, 21]]
+
+def test_find_and_merge_duplicates(db_session):
+    """
+    全角のカードIDや区切りの違うカードIDの行が1つのクラスタになり、まとめると在庫が残す行に足されるかテストする。
+    レアリティの違う行はまとめないこと。
+    """
+    cursor = db_session.cursor()
+    rows = [
+        ('テスト重複カード', 'TDUP-JP001', 'SR', 2),
+        ('テスト重複カード', 'ＴＤＵＰ－ＪＰ００１', 'SR', 5),
+        ('テスト重複カード', 'TDUPJP001', 'SR', 1),
+        ('テスト重複カード', 'TDUP-JP001', 'UR', 1),
+    ]
+    ids = []
+    for name, card_id, rare, stock in rows:
+        cursor.execute(
+            """
+            INSERT INTO items (name, card_id, rare, stock, category, name_normalized, card_id_normalized)
+            VALUES (%s, %s, %s, %s, 'テストカテゴリ', %s, %s) RETURNING id
+            """,
+            (name, card_id, rare, stock, normalize_for_search(name), normalize_for_search(card_id))
+        )
+        ids.append(cursor.fetchone()[0])
+
+    clusters = [c for c in duplicates.find_duplicate_clusters(cursor) if ids[0] in c.ids]
+    assert len(clusters) == 1
+    cluster = clusters[0]
+    assert cluster.ids == ids[:3]
+    assert cluster.total_stock == 8
+    assert cluster.survivor_id == ids[1]
+
+    assert duplicates.merge_clusters(cursor, [(cluster.survivor_id, cluster.ids)]) == (1, 2)
+    cursor.execute("SELECT id, stock FROM items WHERE id = ANY(%s) ORDER BY id", (ids,))
+    assert [tuple(row) for row in cursor.fetchall()] == [(ids[1], 8), (ids[3], 1)]
+    cursor.execute("SELECT COUNT(*) FROM items_archive WHERE id = ANY(%s) AND archive_reason = 'duplicate_merge'", (ids,))
+    assert cursor.fetchone()[0] == 2
@@ -0,0 +1,85 @@
+# tests/test_import_pipeline.py
+import concurrent.futures
+import io
+
+import pytest
+
+from app import config, csv_ingest, import_pipeline
+
+def _source(key, text, fallback_category=''):
+    return import_pipeline.ImportSource(key, csv_ingest.UploadTextStream(io.BytesIO(text.encode('utf-8'))), fallback_category)
+
+def test_prepare_item_rows():
+    """
+    チャンクの行が、レアリティ変換・カテゴリ補完・検索用の正規化を済ませた形になるかテストする。
+    """
+    header = ('名前', '型番', 'レアリティ', '在庫数', 'カテゴリ')
+    rows = [['Ｎｏ．３９ 希望皇ホープ', 'ABC-JP039', 'ウルトラ', '2', ''], ['', 'ABC-JP040', 'N', '1', '']]
+
+    prepared = import_pipeline.prepare_item_rows(header, rows, 11, 'ファイル名')
+
+    assert prepared[0] == (11, 'Ｎｏ．３９ 希望皇ホープ', 'ABC-JP039', 'UR', 2, 'ファイル名', 'no.39 希望皇ホープ', 'abc-jp039', None)
+    assert prepared[1][0] == 12
+    assert prepared[1][-1][0] == csv_ingest.MISSING_REQUIRED
+    assert import_pipeline.prepare_item_rows(header, [['A', '', 'N', '', '']], 1, '')[0][5] == import_pipeline.UNKNOWN_CATEGORY
+
+def test_pipeline_events_are_ordered_per_file():
+    """
+    ファイルごとに ROWS が順番どおりに続き、最後に END か ERROR が返るかテストする。
+    """
+    sources = [
+        _source('a', 'name,rare\n' + ''.join(f'カード{i},N\n' for i in range(5)), 'A'),
+        _source('b', 'foo,bar\n1,2\n'),
+        _source('c', 'name,rare\nカードX,R\n', 'C'),
+    ]
+
+    events = list(import_pipeline.ItemImportPipeline(sources, chunk_rows=2))
+
+    assert [(key, kind) for key, kind, _ in events] == [
+        ('a', 'rows'), ('a', 'rows'), ('a', 'rows'), ('a', 'end'),
+        ('b', 'error'),
+        ('c', 'rows'), ('c', 'end'),
+    ]
+    assert [row[0] for _, kind, rows in events if kind == 'rows' for row in rows][:5] == [1, 2, 3, 4, 5]
+    assert isinstance(events[4][2], csv_ingest.CsvHeaderError)
+
+def test_discarded_file_stops_early():
+    """
+    discard したファイルは残りの行を返さずに終わるかテストする。
+    """
+    pipeline = import_pipeline.ItemImportPipeline(
+        [_source('a', 'name,rare\n' + ''.join(f'カード{i},N\n' for i in range(10)))], chunk_rows=2, max_pending_chunks=1
+    )
+    kinds = []
+    for key, kind, _ in pipeline:
+        kinds.append(kind)
+        if kind == 'rows':
+            pipeline.discard(key)
+
+    assert kinds[-1] == 'end'
+    assert len(kinds) < 6
+
+def test_pipeline_shuts_down_executor(monkeypatch):
+    """
+    最後まで読み終えたとき・途中で close() したときに、プールが止まるかテストする。
+    ワーカー数を指定しなければ、CPU 数が多くても CSV_IMPORT_MAX_DEFAULT_WORKERS までになるかもテストする。
+    """
+    text = 'name,rare\n' + ''.join(f'カード{i},N\n' for i in range(6))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    pipeline = import_pipeline.ItemImportPipeline([_source('a', text)], executor=executor, workers=2, chunk_rows=2)
+    assert [kind for _, kind, _ in pipeline] == ['rows', 'rows', 'rows', 'end']
+    assert pipeline.executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(int)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    pipeline = import_pipeline.ItemImportPipeline([_source('a', text)], executor=executor, workers=2, chunk_rows=2)
+    next(iter(pipeline))
+    pipeline.close()
+    with pytest.raises(RuntimeError):
+        executor.submit(int)
+
+    monkeypatch.setattr('app.config.CSV_IMPORT_WORKERS', 0)
+    monkeypatch.setattr('app.import_pipeline.os.cpu_count', lambda: 64)
+    assert import_pipeline.get_worker_count() == config.CSV_IMPORT_MAX_DEFAULT_WORKERS
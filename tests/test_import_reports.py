@@ -0,0 +1,44 @@
+# tests/test_import_reports.py
+from app import import_reports
+
+def test_report_issues_are_batched_and_paginated(db_session):
+    """
+    問題がバッチごとに書き込まれ、finish で件数が記録され、id 順に前後のページをたどれるかテストする。
+    レポートはコミットするので、最後に削除する。
+    """
+    report = import_reports.ImportReport.start(db_session, 'test_user', 2, batch_size=3)
+    try:
+        for row_number in range(1, 8):
+            severity = import_reports.ERROR if row_number % 2 else import_reports.WARNING
+            report.add_issue('テスト.csv', row_number, severity, f"行 {row_number} の問題", ('name', row_number))
+        # 3件ずつ書き込まれ、7件目はまだ書き込まれていない
+        assert len(report._pending) == 1
+        report.finish('warning', {'rows_processed': 7, 'added': 0, 'updated': 0, 'skipped_no_change': 0, 'skipped_error': 4}, "テスト")
+
+        cursor = db_session.cursor()
+        run = import_reports.fetch_run(cursor, report.run_id)
+        assert (run['status'], run['error_count'], run['warning_count'], run['skipped_error']) == ('warning', 4, 3, 4)
+        assert run['finished_at'] is not None
+        assert import_reports.fetch_issue_counts_by_file(cursor, report.run_id) == [['テスト.csv', 4, 3]]
+
+        first, previous_cursor, next_cursor = import_reports.fetch_issue_page(cursor, report.run_id, page_size=3)
+        assert [issue['row_number'] for issue in first] == [1, 2, 3]
+        assert previous_cursor is None and next_cursor == first[-1]['id']
+        assert first[0]['row_data'] == "('name', 1)"
+
+        second, previous_cursor, next_cursor = import_reports.fetch_issue_page(cursor, report.run_id, after=next_cursor, page_size=3)
+        assert [issue['row_number'] for issue in second] == [4, 5, 6]
+        assert previous_cursor == second[0]['id'] and next_cursor is not None
+
+        back, previous_cursor, _ = import_reports.fetch_issue_page(cursor, report.run_id, before=previous_cursor, page_size=3)
+        assert [issue['row_number'] for issue in back] == [1, 2, 3]
+        assert previous_cursor is None
+
+        errors, _, next_cursor = import_reports.fetch_issue_page(cursor, report.run_id, severity='error', page_size=10)
+        assert [issue['row_number'] for issue in errors] == [1, 3, 5, 7]
+        assert next_cursor is None
+    finally:
+        db_session.rollback()
+        with db_session.cursor() as cursor:
+            cursor.execute("DELETE FROM import_runs WHERE id = %s", (report.run_id,))
+        db_session.commit()
@@ -0,0 +1,41 @@
+# tests/test_instrumentation.py
+from app.instrumentation import LatencyHistogram, QueryStats, normalize_statement
+
+def test_normalize_statement():
+    """
+    集計用に SQL の空白がまとめられるかテストする。
+    """
+    assert normalize_statement("SELECT *\n    FROM items\n   WHERE id = %s ") == "SELECT * FROM items WHERE id = %s"
+    assert normalize_statement(b"SELECT  1") == "SELECT 1"
+
+def test_query_stats_orders_by_total_time():
+    """
+    文ごとの集計が累計時間の長い順に並ぶかテストする。
+    """
+    stats = QueryStats()
+    stats.record("SELECT 1", 1.0, 1)
+    stats.record("SELECT 2", 5.0, 3)
+    stats.record("SELECT 1", 2.0, 1)
+
+    top = stats.top()
+    assert [row['statement'] for row in top] == ["SELECT 2", "SELECT 1"]
+    assert top[1]['calls'] == 2
+    assert top[1]['total_ms'] == 3.0
+    assert top[1]['max_ms'] == 2.0
+
+def test_latency_histogram_percentiles():
+    """
+    バケットから推定した p50/p99 が、実際の分布に近い値になるかテストする。
+    """
+    histogram = LatencyHistogram([10, 100, 1000])
+    for _ in range(90):
+        histogram.record('main.index', 5)
+    for _ in range(10):
+        histogram.record('main.index', 500)
+
+    row = histogram.summary()[0]
+    assert row['count'] == 100
+    assert row['p50_ms'] <= 10
+    assert 100 < row['p99_ms'] <= 1000
+    assert row['max_ms'] == 500
+    assert row['counts'] == [90, 0, 10, 0]
@@ -0,0 +1,39 @@
+# tests/test_product_index.py
+from app.product_index import ProductNameIndex
+
+def test_prefix_search_on_names_and_display_names():
+    """
+    正規化した前方一致で製品名・表示名の両方から候補が返り、完全一致が先頭・重複なしになるかテストする。
+    """
+    index = ProductNameIndex([
+        ('SetA', 'Set A'),
+        ('SetAB', 'SetAB'),
+        ('Ｓｅｔ Ｂ', 'Set B'),
+        ('ファントム・オブ・カオス', 'PHHY'),
+    ])
+
+    assert index.search('set') == ['SetA', 'Ｓｅｔ Ｂ', 'SetAB']
+    assert index.search('seta') == ['SetA', 'SetAB']
+    assert index.search('ｓｅｔａｂ') == ['SetAB']
+    assert index.search('phhy') == ['ファントム・オブ・カオス']
+    assert index.search('set', limit=1) == ['SetA']
+    assert index.search('  ') == []
+    assert index.search('zzz') == []
+    assert len(index) == 4
+
+def test_prefix_search_stops_at_limit():
+    """
+    短い検索語でも、limit 件そろった時点で前方一致の範囲を読み終えずに止まるかテストする。
+    """
+    index = ProductNameIndex([(f'Set{i:04}', None) for i in range(1000)] + [('S', None)])
+
+    class CountingList(list):
+        reads = 0
+
+        def __getitem__(self, position):
+            CountingList.reads += 1
+            return super().__getitem__(position)
+
+    index.names = CountingList(index.names)
+    assert index.search('s', limit=3) == ['S', 'Set0000', 'Set0001']
+    assert CountingList.reads == 3
@@ -0,0 +1,28 @@
+# tests/test_product_list.py
+import datetime
+
+from app import admin
+
+def test_product_cursor_round_trip():
+    """
+    製品一覧のカーソルが元の値に戻り、別のソート条件や壊れた値では使えないかテストする。
+    """
+    cursor = admin.encode_product_cursor('release_date', 'desc', datetime.date(2024, 1, 13), 'ファントム・ナイトメア')
+
+    assert admin.decode_product_cursor(cursor, 'release_date', 'desc') == ('2024-01-13', 'ファントム・ナイトメア')
+    assert admin.decode_product_cursor(cursor, 'release_date', 'asc') is None
+    assert admin.decode_product_cursor(cursor, 'name', 'desc') is None
+    assert admin.decode_product_cursor('not-a-cursor', 'release_date', 'desc') is None
+
+def test_product_cursor_rejects_mistyped_sort_value():
+    """
+    ソート値の型がソートキーと合わないカーソル (書き換えられたもの・古いもの) を使わないかテストする。
+    """
+    for sort_key, sort_value in (('release_date', 'abc'), ('release_date', 20240113), ('era', 'abc'),
+                                 ('era', True), ('show_in_sidebar', 'abc'), ('show_in_sidebar', 1), ('name', 5)):
+        cursor = admin.encode_product_cursor(sort_key, 'asc', sort_value, 'ファントム・ナイトメア')
+        assert admin.decode_product_cursor(cursor, sort_key, 'asc') is None
+
+    for sort_key, sort_value in (('era', 12), ('show_in_sidebar', False), ('display_name', '')):
+        cursor = admin.encode_product_cursor(sort_key, 'asc', sort_value, 'ファントム・ナイトメア')
+        assert admin.decode_product_cursor(cursor, sort_key, 'asc') == (sort_value, 'ファントム・ナイトメア')
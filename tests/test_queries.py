@@ -0,0 +1,50 @@
+# tests/test_queries.py
+from app import queries
+
+def test_item_list_shapes_are_registered():
+    """
+    一覧画面の検索対象・絞り込み・ソートの全組み合わせが、事前に登録されているかテストする。
+    """
+    for search_field in queries.ITEM_LIST_SEARCH_FIELDS:
+        for filter_shape in queries.ITEM_LIST_FILTER_CONDITIONS:
+            for sort_by in queries.ITEM_LIST_SORT_KEYS:
+                for sort_order in ('asc', 'DESC'):
+                    name = queries.item_list_query_name(search_field, filter_shape, sort_by, sort_order)
+                    assert name in queries.REGISTRY
+                    assert queries.REGISTRY[name].param_types == queries.ITEM_LIST_PARAM_TYPES
+
+                    page_name = queries.item_list_page_query_name(search_field, filter_shape, sort_by, sort_order)
+                    assert queries.REGISTRY[page_name].param_types == queries.ITEM_LIST_PARAM_TYPES + ('integer', 'integer')
+            assert queries.item_list_count_query_name(search_field, filter_shape) in queries.REGISTRY
+
+def test_item_list_filters_are_part_of_the_shape():
+    """
+    在庫0の表示・カテゴリの絞り込みが引数ではなく文の形で切り替わり、
+    カテゴリで絞り込む形だけがカテゴリの値を使うかテストする。
+    """
+    assert queries.item_list_filter_params(True, '', 'all', None) == ('none', 'all', (None, None, None))
+    assert queries.item_list_filter_params(False, '', 'all', '') == ('none', 'in_stock', (None, None, None))
+    assert queries.item_list_filter_params(True, '', 'all', 'LOB')[1:] == ('category', ('LOB', None, None))
+    search_field, filter_shape, params = queries.item_list_filter_params(False, 'Ab', 'rare', 'LOB')
+    assert (search_field, filter_shape, params[0], params[2]) == ('rare', 'in_stock_category', 'LOB', '%ab%')
+
+    for filter_shape in queries.ITEM_LIST_FILTER_CONDITIONS:
+        sql = queries.REGISTRY[queries.item_list_query_name('none', filter_shape, 'id', 'asc')].sql
+        assert ' OR ' not in sql and 'IS NULL' not in sql
+        assert ('i.stock > 0' in sql) == filter_shape.startswith('in_stock')
+        assert ('i.category = $1' in sql) == filter_shape.endswith('category')
+
+def test_prepared_query_statements():
+    """
+    PREPARE / EXECUTE 文と、PREPARE を使わない場合の SQL が正しく組み立てられるかテストする。
+    """
+    query = queries.PreparedQuery('test_query', "SELECT * FROM items WHERE id = $1 AND name LIKE '%a' AND stock > $2", ('integer', 'integer'))
+
+    assert query.prepare_statement() == "PREPARE test_query (integer, integer) AS SELECT * FROM items WHERE id = $1 AND name LIKE '%a' AND stock > $2"
+    assert query.execute_statement() == "EXECUTE test_query (%s, %s)"
+    assert query.direct_sql == "SELECT * FROM items WHERE id = %(p1)s AND name LIKE '%%a' AND stock > %(p2)s"
+    assert query.direct_params((10, 3)) == {'p1': 10, 'p2': 3}
+
+    no_params = queries.PreparedQuery('no_params', "SELECT 1")
+    assert no_params.prepare_statement() == "PREPARE no_params AS SELECT 1"
+    assert no_params.execute_statement() == "EXECUTE no_params"
@@ -0,0 +1,31 @@
+# tests/test_records.py
+from app import queries, records
+from app.utils import normalize_for_search
+
+def test_fetch_records_from_item_list_query(db_session):
+    """
+    一覧用の文の結果が ItemListRow になり、属性と位置のどちらでも参照できるかテストする。
+    """
+    cursor = db_session.cursor()
+    cursor.execute(
+        """
+        INSERT INTO items (name, card_id, rare, stock, category, name_normalized, card_id_normalized)
+        VALUES ('テスト軽量行カード', 'TREC-JP001', 'SR', 3, NULL, %s, %s) RETURNING id
+        """,
+        (normalize_for_search('テスト軽量行カード'), normalize_for_search('TREC-JP001'))
+    )
+    item_id = cursor.fetchone()[0]
+
+    tuple_cursor = records.tuple_cursor(db_session)
+    search_field, filter_shape, params = queries.item_list_filter_params(True, 'テスト軽量行', 'name', None)
+    queries.execute(tuple_cursor, queries.item_list_query_name(search_field, filter_shape, 'id', 'asc'), params)
+    rows = records.fetch_records(tuple_cursor, records.ItemListRow)
+
+    assert len(rows) == 1
+    row = rows[0]
+    assert isinstance(row, records.ItemListRow)
+    assert (row.id, row.name, row.rare, row.stock) == (item_id, 'テスト軽量行カード', 'SR', 3)
+    assert row[1] == row.name
+    assert row.category is None and row.release_date is None
+    # __slots__ が空なので、行ごとの __dict__ を持たない
+    assert not hasattr(row, '__dict__')
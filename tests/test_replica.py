@@ -0,0 +1,36 @@
+# tests/test_replica.py
+import time
+
+from flask import session
+
+from app import config, db, replica
+
+def test_read_only_requests_use_replica(app, monkeypatch):
+    """
+    @read_only の画面だけがレプリカを使い、更新の直後と遅延が大きいときはプライマリに戻るかテストする。
+    (テストではレプリカの接続先にプライマリと同じデータベースを使うので、遅延は 0 になる)
+    """
+    monkeypatch.setenv('DATABASE_REPLICA_URL', db._get_database_url())
+    monkeypatch.setattr(replica, '_lag_sample', (None, None))
+
+    with app.test_request_context('/'):
+        assert replica.should_use_replica() is False
+
+    with app.test_request_context('/'):
+        replica.read_only(lambda: None)()
+        assert replica.should_use_replica() is True
+        conn = db.get_db_connection()
+        try:
+            assert conn.pool is db.get_pool('replica')
+        finally:
+            conn.close()
+
+    with app.test_request_context('/'):
+        replica.read_only(lambda: None)()
+        session['last_write_at'] = time.time()
+        assert replica.should_use_replica() is False
+
+    monkeypatch.setattr(replica, '_lag_sample', (config.REPLICA_MAX_LAG_SECONDS + 1, time.monotonic()))
+    with app.test_request_context('/'):
+        replica.read_only(lambda: None)()
+        assert replica.should_use_replica() is False
@@ -0,0 +1,82 @@
+# tests/test_rollups.py
+import pytest
+
+from app import rollups
+from app.db import get_db_connection
+from app.rollups import ProductRollup
+
+def test_product_rollup_totals():
+    """
+    レアリティごとの集計が製品の合計と揃い率にまとめられるかテストする。
+    """
+    rollup = ProductRollup()
+    rollup.add('N', 30, 24, 80)
+    rollup.add('SR', 10, 6, 7)
+
+    assert (rollup.item_rows, rollup.in_stock_rows, rollup.total_stock) == (40, 30, 87)
+    assert rollup.by_rarity == {'N': (30, 24, 80), 'SR': (10, 6, 7)}
+    assert rollup.completion_percent == 75.0
+    assert ProductRollup().completion_percent == 0.0
+
+def test_rollup_triggers_track_changes(db_session):
+    """
+    追加・在庫の変更・カテゴリの変更・削除が集計に反映され、0件になった製品は集計から消えるかテストする。
+    まとめ直しても合計は変わらないかもテストする。
+    """
+    cursor = db_session.cursor()
+
+    def rollup(category_key):
+        cursor.execute(
+            "SELECT item_rows, in_stock_rows, total_stock FROM product_stock_rollups WHERE category_key = %s AND rare = 'N'",
+            (category_key,)
+        )
+        row = cursor.fetchone()
+        return tuple(row) if row else None
+
+    cursor.execute(
+        "INSERT INTO items (name, card_id, rare, stock, category) VALUES ('テスト集計カード', 'TROL-JP001', 'N', 2, 'テスト集計Ａ') RETURNING id"
+    )
+    item_id = cursor.fetchone()[0]
+    assert rollup('テスト集計ａ') == (1, 1, 2)
+
+    cursor.execute("UPDATE items SET stock = 0 WHERE id = %s", (item_id,))
+    assert rollup('テスト集計ａ') == (1, 0, 0)
+
+    cursor.execute("UPDATE items SET category = 'テスト集計Ｂ', stock = 3 WHERE id = %s", (item_id,))
+    assert rollup('テスト集計ａ') is None
+    assert rollup('テスト集計ｂ') == (1, 1, 3)
+
+    rollups.compact(cursor)
+    assert rollup('テスト集計ｂ') == (1, 1, 3)
+    cursor.execute("SELECT COUNT(*) FROM product_stock_rollup_slots WHERE category_key = 'テスト集計ａ'")
+    assert cursor.fetchone()[0] == 0
+
+    cursor.execute("DELETE FROM items WHERE id = %s", (item_id,))
+    assert rollup('テスト集計ｂ') is None
+    assert rollups.find_drift(cursor) == []
+
+def test_rollup_triggers_do_not_block_concurrent_writes(db_session):
+    """
+    同じ製品・レアリティのカードの在庫を別々の接続で変えても、集計のせいで待たされないかテストする。
+    """
+    cursor = db_session.cursor()
+    cursor.execute("""
+        SELECT array_agg(id ORDER BY id) FROM items
+        GROUP BY COALESCE(LOWER(TRIM(category)), ''), COALESCE(rare, '')
+        HAVING COUNT(*) >= 2
+        LIMIT 1
+    """)
+    row = cursor.fetchone()
+    if row is None:
+        pytest.skip("同じ製品・レアリティのカードが2件以上必要です")
+    first_id, second_id = row[0][:2]
+    cursor.execute("UPDATE items SET stock = stock + 1 WHERE id = %s", (first_id,))
+
+    other = get_db_connection()
+    try:
+        with other.cursor() as other_cursor:
+            other_cursor.execute("SET LOCAL lock_timeout = '1s'")
+            other_cursor.execute("UPDATE items SET stock = stock + 1 WHERE id = %s", (second_id,))
+    finally:
+        other.rollback()
+        other.close()
@@ -0,0 +1,123 @@
+# tests/test_search_index.py
+from app import db, queries, replica, search_index
+from app.search_index import ItemSearchIndex
+from app.utils import normalize_for_search
+
+def _sample_index():
+    index = ItemSearchIndex(gram_size=3)
+    index.add(1, 'ブラック・マジシャン', 'lob-jp005')
+    index.add(2, 'ブラック・マジシャン・ガール', 'mfc-jp000')
+    index.add(3, '青眼の白龍', 'lob-jp001')
+    index.add(4, 'マジシャンズ・ロッド', None)
+    return index
+
+def test_search_matches_like_semantics_per_field():
+    """
+    短い検索語 (n-gram そのもの) と長い検索語のどちらでも、検索対象ごとに部分一致した id だけが返るかテストする。
+    """
+    index = _sample_index()
+
+    assert sorted(index.search('マジシャン', 'name')) == [1, 2, 4]
+    assert index.search('マジシャン・', 'name') == [2]
+    assert sorted(index.search('lob', 'card_id')) == [1, 3]
+    assert index.search('lob', 'name') == []
+    assert sorted(index.search('j', 'all')) == [1, 2, 3]
+    assert sorted(index.search('jp00', 'all')) == [1, 2, 3]
+    assert index.search('龍', 'all') == [3]
+    assert index.search('存在しない', 'all') == []
+
+def test_search_returns_none_over_limit():
+    """
+    一致が limit 件を超えると None (SQL で探す) になるかテストする。
+    """
+    index = _sample_index()
+
+    assert index.search('マジシャン', 'name', limit=2) is None
+    assert sorted(index.search('マジシャン', 'name', limit=3)) == [1, 2, 4]
+
+def test_update_remove_and_compact(monkeypatch):
+    """
+    行を置き換え・削除すると古い内容で一致しなくなり、作り直した後も結果が変わらないかテストする。
+    """
+    monkeypatch.setattr('app.config.ITEM_SEARCH_INDEX_COMPACT_MIN_DEAD', 0)
+    index = _sample_index()
+
+    index.add(3, '真紅眼の黒竜', 'lob-jp070')
+    assert index.search('白龍', 'name') == []
+    assert index.search('黒竜', 'name') == [3]
+    index.remove(4)
+    assert sorted(index.search('マジシャン', 'name')) == [1, 2]
+    assert len(index) == 3
+
+    # 無効な位置 (2) が有効な行 (3) より多くなると作り直される
+    index.add(1, 'ブラック・マジシャン', 'sd6-jp001')
+    index.add(2, 'ブラック・マジシャン・ガール', 'sd6-jp002')
+    assert index.dead == 0
+    assert len(index.ids) == 3
+    assert sorted(index.search('sd6', 'card_id')) == [1, 2]
+    assert index.search('黒竜', 'all') == [3]
+
+def test_refresh_index_applies_changes(db_session):
+    """
+    読み込み後に追加・変更・削除した行が refresh_index で反映されるかテストする。
+    """
+    cursor = db_session.cursor()
+    index = search_index.load_index(cursor)
+
+    def insert(name, card_id):
+        cursor.execute(
+            """
+            INSERT INTO items (name, card_id, rare, stock, category, name_normalized, card_id_normalized)
+            VALUES (%s, %s, 'N', 1, 'テストカテゴリ', %s, %s) RETURNING id
+            """,
+            (name, card_id, normalize_for_search(name), normalize_for_search(card_id))
+        )
+        return cursor.fetchone()[0]
+
+    kept_id = insert('テスト索引カードＡ', 'TIDX-JP001')
+    deleted_id = insert('テスト索引カードＢ', 'TIDX-JP002')
+    search_index.refresh_index(index, cursor)
+    assert sorted(index.search('テスト索引カード', 'name')) == sorted([kept_id, deleted_id])
+
+    cursor.execute("UPDATE items SET name_normalized = %s WHERE id = %s", (normalize_for_search('テスト改名カード'), kept_id))
+    cursor.execute("DELETE FROM items WHERE id = %s", (deleted_id,))
+    search_index.refresh_index(index, cursor)
+    assert index.search('テスト索引カード', 'name') == []
+    assert index.search('テスト改名', 'name') == [kept_id]
+    assert index.search('tidx-jp00', 'card_id') == [kept_id]
+
+def test_item_list_filter_params_uses_ids(app, monkeypatch):
+    """
+    インデックスで解決できた場合は id の配列を使う文になり、使えない場合は LIKE の文のままになるかテストする。
+    """
+    monkeypatch.setattr('app.config.ITEM_SEARCH_INDEX_ENABLED', True)
+    monkeypatch.setattr(search_index, 'match_item_ids', lambda keyword, field: [7, 9])
+    field, filter_shape, params = search_index.item_list_filter_params(False, 'マジシャン', 'name', None)
+    assert (field, filter_shape) == ('ids', 'in_stock')
+    assert params == (None, [7, 9], '%マジシャン%')
+    assert queries.item_list_page_query_name(field, filter_shape, 'name', 'asc') in queries.REGISTRY
+
+    monkeypatch.setattr(search_index, 'match_item_ids', lambda keyword, field: None)
+    field, filter_shape, params = search_index.item_list_filter_params(False, 'マジシャン', 'all', None)
+    assert field == 'all'
+    assert params[1] == '%マジシャン%'
+
+def test_index_refresh_reads_primary(app, monkeypatch):
+    """
+    レプリカを使う @read_only の画面から呼ばれても、インデックスの読み込み・更新はプライマリの接続で行うかテストする。
+    """
+    monkeypatch.setenv('DATABASE_REPLICA_URL', db._get_database_url())
+    monkeypatch.setattr(replica, '_lag_sample', (None, None))
+    monkeypatch.setattr(search_index, '_index', None)
+    monkeypatch.setattr(search_index, '_index_version', None)
+    pools = []
+    monkeypatch.setattr(search_index, 'load_index', lambda cur: pools.append(cur.connection.pool) or ItemSearchIndex())
+    monkeypatch.setattr(search_index, 'refresh_index', lambda index, cur: pools.append(cur.connection.pool))
+
+    with app.test_request_context('/'):
+        replica.read_only(lambda: None)()
+        assert replica.should_use_replica() is True
+        search_index._current_index((1,))
+        search_index._current_index((2,))
+
+    assert pools == [db.get_pool('primary'), db.get_pool('primary')]
@@ -0,0 +1,22 @@
+# tests/test_similarity.py
+from app import similarity
+
+def test_trigram_similarity_matches_pg_trgm():
+    """
+    トライグラムと類似度が pg_trgm と同じ値になるかテストする (値は PostgreSQL のドキュメントの例)。
+    """
+    assert similarity.trigrams('cat') == {'  c', ' ca', 'cat', 'at '}
+    assert round(similarity.similarity('word', 'two words'), 6) == 0.363636
+    assert similarity.similarity('Set A', 'set a') == 1.0
+    assert similarity.similarity('', 'abc') == 0.0
+
+def test_suggest_closest_products():
+    """
+    カテゴリごとに、似た製品名が類似度の高い順に返り、閾値未満は返らないかテストする。
+    """
+    products = ['LIGHTNING OVERDRIVE', 'BURST OF DESTINY', 'DIMENSION FORCE']
+    suggestions = similarity.suggest(['Lightning Overdrive (LIOV)', 'BURST OF DESTINYY', '全然違う'], products, limit=2)
+
+    assert [name for name, _ in suggestions['Lightning Overdrive (LIOV)']] == ['LIGHTNING OVERDRIVE']
+    assert suggestions['BURST OF DESTINYY'][0][0] == 'BURST OF DESTINY'
+    assert suggestions['全然違う'] == []
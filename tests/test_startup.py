@@ -0,0 +1,43 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+
+from measure_import_time import parse_importtime
+
+def test_app_import_defers_heavy_modules():
+    """
+    アプリの読み込み (import wsgi) で、Selenium・BeautifulSoup・pykakasi が読み込まれないかテストする。
+    sys.modules を汚さないよう、別プロセスで確認する。
+    """
+    code = (
+        "import sys, wsgi\n"
+        "loaded = [m for m in ('selenium', 'webdriver_manager', 'bs4', 'pykakasi') if m in sys.modules]\n"
+        "print(','.join(loaded))\n"
+    )
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    result = subprocess.run([sys.executable, '-c', code], cwd=project_root, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+def test_kana_converters_are_created_once():
+    """
+    変換器は最初に使うときに1つだけ作られ、以降は同じものが返るかテストする。
+    """
+    from app import kana
+
+    converter = kana.get_hira_converter()
+    assert kana.get_hira_converter() is converter
+    assert kana.get_kata_converter() is not converter
+
+def test_parse_importtime():
+    """
+    -X importtime の出力から、モジュールごとの自身の時間と累積時間を読み取れるかテストする。
+    """
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     app.queries\n"
+        "import time:      5000 |       5120 |   app\n"
+        "import time:       300 |       5420 | wsgi\n"
+    )
+    assert parse_importtime(stderr) == {'app.queries': (120, 120), 'app': (5000, 5120), 'wsgi': (300, 5420)}
@@ -0,0 +1,16 @@
+# tests/test_warmup.py
+from app import warmup
+
+def test_healthz_and_readyz(client):
+    """
+    /healthz は常に 200、/readyz はウォームアップの全手順が成功してから 200 になるかテストする。
+    """
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == 'ready'
+    assert set(body['steps']) == {name for name, _ in warmup.WARMUP_STEPS}
+    assert all(step['ok'] for step in body['steps'].values())
+    assert warmup.is_ready()